@@ -12,19 +12,28 @@
 #    See the License for the specific language governing permissions and
 #    limitations under the License.
 import argparse
+import json
 import os
+import sys
 import textwrap
 from collections import defaultdict
 
 from colorama import Fore, Style, init
 from dotenv import load_dotenv
 
-from .ast import PromptDependencyCycleError, build_prompt_order
-from .code_generator import generate_code
+from .ast import PromptGraph, build_prompt_order, format_prompt_key
+from .code_generator import apply_lock, collect_batch, generate_code, submit_batch
 from .config import Config
-from .file_manager import get_file_paths
+from .context_index import ContextIndex
+from .file_manager import ignore_paths, iter_file_paths
 from .log import Log, configure_logger
-from .tag_parser import parse_tags
+from .pipeline import ast_error_message, stream_tasks
+from .planner import plan_run
+from .queue_runner import queue_run, run_worker
+from .run_state import RunState
+from .sharding import Shard, parse_shard, verify_manifests
+from .tag_parser import parse_tags, regexPatterns
+from .token_budget import TRIM_STRATEGIES
 
 logger = None
 
@@ -48,6 +57,253 @@ def entryArguments():
         default=False,
     )
 
+    parser.add_argument(
+        "--stream",
+        action="store_true",
+        help="Stream LLM responses and report per-prompt progress (optional)",
+        required=False,
+        default=False,
+    )
+
+    parser.add_argument(
+        "--timeout",
+        metavar="timeout",
+        type=float,
+        help="Seconds before a single LLM request is abandoned (optional)",
+        required=False,
+        default=Config.Request_Timeout,
+    )
+
+    parser.add_argument(
+        "--deadline",
+        metavar="deadline",
+        type=float,
+        help="Wall-clock budget in seconds for the whole run; unfinished prompts are cancelled (optional)",
+        required=False,
+        default=None,
+    )
+
+    parser.add_argument(
+        "--hedge",
+        action="store_true",
+        help="Send a duplicate request when a prompt is slower than the hedge percentile (optional)",
+        required=False,
+        default=False,
+    )
+
+    parser.add_argument(
+        "--hedge-percentile",
+        metavar="hedge_percentile",
+        type=float,
+        help="Latency percentile after which a hedged request is sent (optional)",
+        required=False,
+        default=Config.Hedge_Percentile,
+    )
+
+    parser.add_argument(
+        "--batch-prompts",
+        action="store_true",
+        help="Pack small independent prompts of a file into one LLM request (optional)",
+        required=False,
+        default=False,
+    )
+
+    parser.add_argument(
+        "--batch-submit",
+        metavar="batch_file",
+        type=str,
+        help="Write every rendered prompt to an OpenAI batch JSONL file instead of calling the LLM (optional)",
+        required=False,
+        default=None,
+    )
+
+    parser.add_argument(
+        "--batch-collect",
+        metavar="results_file",
+        type=str,
+        help="Apply the generated code from a batch output JSONL file (optional)",
+        required=False,
+        default=None,
+    )
+
+    parser.add_argument(
+        "--max-prompt-tokens",
+        metavar="max_prompt_tokens",
+        type=int,
+        help="Token budget per prompt; defaults to the model context window minus an output reserve (optional)",
+        required=False,
+        default=None,
+    )
+
+    parser.add_argument(
+        "--trim-strategy",
+        metavar="trim_strategy",
+        type=str,
+        help="How oversized prompts are trimmed before the call: none, head, tail or drop (optional)",
+        required=False,
+        choices=TRIM_STRATEGIES,
+        default=Config.Trim_Strategy,
+    )
+
+    parser.add_argument(
+        "--concurrency",
+        metavar="concurrency",
+        type=int,
+        help="Initial number of concurrent LLM requests; adapts to provider feedback (optional)",
+        required=False,
+        default=Config.Concurrency,
+    )
+
+    parser.add_argument(
+        "--max-concurrency",
+        metavar="max_concurrency",
+        type=int,
+        help="Upper bound for the adaptive concurrency limit (optional)",
+        required=False,
+        default=Config.Max_Concurrency,
+    )
+
+    parser.add_argument(
+        "--strict",
+        action="store_true",
+        help="Parse and validate every file before generating anything; stop on any error (optional)",
+        required=False,
+        default=False,
+    )
+
+    parser.add_argument(
+        "--latency-history",
+        metavar="latency_file",
+        type=str,
+        help="Record prompt latencies in this file and use them to run the longest prompt chains first (optional)",
+        required=False,
+        default=None,
+    )
+
+    parser.add_argument(
+        "--journal",
+        metavar="journal_file",
+        type=str,
+        help="Append every written prompt to this run journal (optional)",
+        required=False,
+        default=None,
+    )
+
+    parser.add_argument(
+        "--resume",
+        action="store_true",
+        help="Skip prompts the run journal already has with unchanged inputs "
+        f"(journal defaults to {Config.Default_Journal_Path}) (optional)",
+        required=False,
+        default=False,
+    )
+
+    parser.add_argument(
+        "--lock",
+        metavar="lock_file",
+        nargs="?",
+        const=Config.Default_Lock_Path,
+        help=f"Record every generated output in a lockfile (default {Config.Default_Lock_Path}) (optional)",
+        required=False,
+        default=None,
+    )
+
+    parser.add_argument(
+        "--frozen",
+        action="store_true",
+        help="Write the outputs recorded in the lockfile without calling the LLM; fail if any prompt's inputs "
+        "changed since it was locked (optional)",
+        required=False,
+        default=False,
+    )
+
+    parser.add_argument(
+        "--queue",
+        metavar="queue_file",
+        type=str,
+        help="Generate through a SQLite job queue in this file, shared by local worker processes and any "
+        "--worker processes on machines sharing the filesystem (optional)",
+        required=False,
+        default=None,
+    )
+
+    parser.add_argument(
+        "--workers",
+        metavar="workers",
+        type=int,
+        help="Local worker processes for --queue; 0 relies on --worker processes only "
+        f"(default {Config.Queue_Workers}) (optional)",
+        required=False,
+        default=Config.Queue_Workers,
+    )
+
+    parser.add_argument(
+        "--worker",
+        metavar="queue_file",
+        type=str,
+        help="Only generate prompts claimed from this job queue, until it is drained (optional)",
+        required=False,
+        default=None,
+    )
+
+    parser.add_argument(
+        "--shard",
+        metavar="K/N",
+        type=str,
+        help="Only generate shard K of N: files are split by a stable hash of their path, keeping files that "
+        "import or reference each other together (optional)",
+        required=False,
+        default=None,
+    )
+
+    parser.add_argument(
+        "--shard-manifest",
+        metavar="manifest_file",
+        type=str,
+        help="Where --shard writes its result manifest "
+        f"(default {Config.Default_Shard_Manifest_Path.format(index='K', count='N')}) (optional)",
+        required=False,
+        default=None,
+    )
+
+    parser.add_argument(
+        "--verify-shards",
+        metavar="manifest_file",
+        nargs="+",
+        help="Check that the merged outputs match the result manifests of every shard and exit (optional)",
+        required=False,
+        default=None,
+    )
+
+    parser.add_argument(
+        "--index",
+        metavar="index_file",
+        type=str,
+        help="Persist the context variable index in this file so later runs only rescan changed files (optional)",
+        required=False,
+        default=None,
+    )
+
+    parser.add_argument(
+        "--plan",
+        nargs="?",
+        const="text",
+        choices=["text", "json"],
+        help="Print the execution plan with token, cost and time estimates (or emit it as JSON) and exit; "
+        "no LLM calls are made (optional)",
+        required=False,
+        default=None,
+    )
+
+    parser.add_argument(
+        "--where",
+        metavar="variable",
+        type=str,
+        help="Print where a context variable is defined and exit (optional)",
+        required=False,
+        default=None,
+    )
+
     parser.add_argument(
         "--filepath",
         metavar="filepath",
@@ -94,11 +350,68 @@ def configurationProcess(args):
 
     Config.Model = args.model
 
+    Config.Stream = getattr(args, "stream", False)
+    Config.Request_Timeout = getattr(args, "timeout", Config.Request_Timeout)
+    Config.Deadline = getattr(args, "deadline", None)
+    Config.Hedge = getattr(args, "hedge", False)
+    Config.Batch_Prompts = getattr(args, "batch_prompts", False)
+    Config.Max_Prompt_Tokens = getattr(args, "max_prompt_tokens", None)
+    Config.Trim_Strategy = getattr(args, "trim_strategy", Config.Trim_Strategy)
+    Config.Batch_Submit_Path = getattr(args, "batch_submit", None)
+    Config.Batch_Collect_Path = getattr(args, "batch_collect", None)
+    Config.Hedge_Percentile = getattr(args, "hedge_percentile", Config.Hedge_Percentile)
+    Config.Max_Concurrency = max(1, getattr(args, "max_concurrency", Config.Max_Concurrency))
+    Config.Concurrency = min(max(1, getattr(args, "concurrency", Config.Concurrency)), Config.Max_Concurrency)
+    Config.Strict = getattr(args, "strict", False)
+    Config.Latency_History_Path = getattr(args, "latency_history", None)
+    Config.Resume = getattr(args, "resume", False)
+    Config.Journal_Path = getattr(args, "journal", None) or (Config.Default_Journal_Path if Config.Resume else None)
+    Config.Frozen = getattr(args, "frozen", False)
+    Config.Lock_Path = getattr(args, "lock", None) or (Config.Default_Lock_Path if Config.Frozen else None)
+    Config.Queue_Path = getattr(args, "queue", None)
+    Config.Queue_Workers = max(0, getattr(args, "workers", Config.Queue_Workers))
+    Config.Worker_Queue_Path = getattr(args, "worker", None)
+    shard = getattr(args, "shard", None)
+    Config.Shard = parse_shard(shard) if shard else None
+    Config.Shard_Manifest_Path = getattr(args, "shard_manifest", None)
+    if Config.Shard and not Config.Shard_Manifest_Path:
+        index, count = Config.Shard
+        Config.Shard_Manifest_Path = Config.Default_Shard_Manifest_Path.format(index=index, count=count)
+    Config.Verify_Shard_Paths = getattr(args, "verify_shards", None)
+    Config.Index_Path = getattr(args, "index", None)
+    Config.Where = getattr(args, "where", None)
+    Config.Plan = getattr(args, "plan", None)
+    # The journal, lockfile and job queue (with SQLite's rollback journal) are written during the run;
+    # they must not be picked up as input files.
+    queue_path = Config.Queue_Path or Config.Worker_Queue_Path
+    ignore_paths(
+        Config.Journal_Path,
+        Config.Lock_Path,
+        queue_path,
+        queue_path and queue_path + "-journal",
+        Config.Lock_Path and Config.Lock_Path + ".tmp",
+    )
+
     # Config.Comment_Characters = str(os.getenv("CONTEXT_CONFIG_Comment_Characters")).replace("'","").split(",")
 
+    if Config.Batch_Submit_Path and Config.Batch_Collect_Path:
+        raise ValueError("--batch-submit and --batch-collect cannot be used in the same run.")
+    if Config.Queue_Path and (Config.Batch_Submit_Path or Config.Batch_Collect_Path):
+        raise ValueError("--queue cannot be combined with --batch-submit or --batch-collect.")
+
+    # Batch modes, --frozen and --where queries never call the provider from this process.
+    needs_api_key = not (
+        Config.MockLLM
+        or Config.Batch_Submit_Path
+        or Config.Batch_Collect_Path
+        or Config.Where
+        or Config.Plan
+        or Config.Frozen
+        or Config.Verify_Shard_Paths
+    )
     # Current behavior (relied on by unit tests): only `None` is treated as missing.
     # An empty string is accepted (even though it will fail later when making requests).
-    if not Config.MockLLM and Config.Api_Key is None:
+    if needs_api_key and Config.Api_Key is None:
         raise ValueError(
             "OpenRouter API Key is required. Please provide it as an argument, "
             "environment variable or in the .env file."
@@ -113,16 +426,52 @@ def contextProcess():
     Log.logger.debug("CWD: " + os.getcwd())
     Log.logger.debug("Processing the Files")
 
+    # A worker generates whatever the queue's coordinator enqueued; it does not discover files itself.
+    if Config.Worker_Queue_Path:
+        count = run_worker(Config.Worker_Queue_Path)
+        print(f"{Fore.GREEN}Generated {count} prompts from {Config.Worker_Queue_Path}{Style.RESET_ALL}")
+        return
+
+    if Config.Verify_Shard_Paths:
+        return verifyShardsProcess(Config.Verify_Shard_Paths)
+
+    # Directories are discovered lazily so the streaming pipeline can parse while the walk continues.
     paths = []
     if Config.FilePathProvided is False:
-        paths = get_file_paths(os.getcwd())
+        paths = iter_file_paths(os.getcwd())
     else:
         if os.path.isdir(Config.FilePath):
             Log.logger.debug(f"Directory provided: {Config.FilePath}")
-            paths = get_file_paths(Config.FilePath)
+            paths = iter_file_paths(Config.FilePath)
         else:
             paths = [Config.FilePath]
 
+    if Config.Where:
+        print_definitions(Config.Where, paths)
+        return
+
+    shard = None
+    if Config.Shard:
+        shard = Shard(*Config.Shard)
+        manifests = [Config.Shard_Manifest_Path, *(Config.Verify_Shard_Paths or [])]
+        paths = shard.select(paths, ContextIndex(regexPatterns, Config.Index_Path), manifests)
+
+    # Generation streams files through parse -> order -> generate; strict mode, parser-only mode, frozen
+    # mode, the job queue and batch files keep the phased flow that reports every error before anything
+    # is generated.
+    phased = (
+        Config.Strict
+        or Config.ParserOnly
+        or Config.Plan
+        or Config.Frozen
+        or Config.Queue_Path
+        or Config.Batch_Submit_Path
+        or Config.Batch_Collect_Path
+    )
+    if not phased:
+        return pipelineProcess(paths, shard)
+
+    paths = list(paths)
     Log.logger.debug(paths)
 
     try:
@@ -145,32 +494,145 @@ def contextProcess():
 
     # Semantic parsing (AST prompt ordering): collect per-file errors so the user can fix them in one pass.
     ast_errors = []
+    graph = PromptGraph()
     for task in tasks:
         try:
             build_prompt_order([task])
-        except PromptDependencyCycleError as e:
-            rel_path = os.path.relpath(getattr(e, "filepath", None) or task.filepath)
-            cyclic = getattr(e, "cyclic_prompts", None) or []
-            cyclic_part = f" Cyclic prompts: {cyclic}." if cyclic else ""
-            msg = (
-                "AST: prompt dependency cycle detected." + cyclic_part + " Prompt ordering requires an acyclic graph. "
-                "Break the cycle by splitting prompts into a one-way chain (e.g., A depends on B depends on C), "
-                "or remove the circular {PromptName} references."
-            )
-            ast_errors.append(f"Error in file {rel_path}: {msg}")
-            Log.logger.error(msg)
+            graph.add(task)
         except Exception as e:
-            # Keep behavior safe and user-friendly; we still include the file context.
-            rel_path = os.path.relpath(task.filepath)
-            msg = f"AST: unexpected error while ordering prompts: {e}"
-            ast_errors.append(f"Error in file {rel_path}: {msg}")
-            Log.logger.error(msg, exc_info=True)
+            ast_errors.append(ast_error_message(task, e))
+    for key, dependency in graph.unresolved():
+        Log.logger.warning(
+            f"{format_prompt_key(key)} references {format_prompt_key(dependency)}, which is not generated in this "
+            "run; its current contents in the file are used."
+        )
+    Log.logger.debug(f"Global prompt plan: {len(graph.layers())} layers")
 
     if ast_errors:
         print_formatted_errors(ast_errors)
         return
 
-    generate_code(tasks)
+    if Config.Plan:
+        print_plan(plan_run(tasks), Config.Plan)
+        return
+
+    if Config.Frozen:
+        return frozenProcess(tasks, shard)
+
+    if Config.Batch_Submit_Path:
+        count = submit_batch(tasks, Config.Batch_Submit_Path)
+        print(f"{Fore.GREEN}Wrote {count} batch requests to {Config.Batch_Submit_Path}{Style.RESET_ALL}")
+        return
+
+    if Config.Batch_Collect_Path:
+        summary = collect_batch(tasks, Config.Batch_Collect_Path)
+    elif Config.Queue_Path:
+        summary = queue_run(tasks, Config.Queue_Path, Config.Queue_Workers)
+    else:
+        summary = generate_code(tasks)
+    report_run(summary, shard)
+
+
+def frozenProcess(tasks, shard=None):
+    """Apply the lockfile; returns 1 (the process exit code) when prompts drifted from it."""
+
+    try:
+        summary = apply_lock(tasks)
+    except (ValueError, OSError) as e:
+        print(f"{Fore.RED}--frozen: {e}; nothing was written.{Style.RESET_ALL}")
+        for line in getattr(e, "drifted", []):
+            print(f"{Fore.RED}         • {line}{Style.RESET_ALL}")
+        return 1
+    report_run(summary, shard)
+    return 0
+
+
+def verifyShardsProcess(manifest_paths):
+    """Verify merged shard outputs; returns 1 (the process exit code) when any manifest does not match."""
+
+    problems = verify_manifests(manifest_paths)
+    if problems:
+        print(f"{Fore.RED}--verify-shards: the merged outputs do not match the shard manifests:{Style.RESET_ALL}")
+        for problem in problems:
+            print(f"{Fore.RED}         • {problem}{Style.RESET_ALL}")
+        return 1
+    print(f"{Fore.GREEN}Verified {len(manifest_paths)} shard manifests{Style.RESET_ALL}")
+    return 0
+
+
+def pipelineProcess(paths, shard=None):
+    """Generate code while files are still being discovered and parsed; errors are reported at the end."""
+
+    errors = []
+    run = RunState()
+    try:
+        summary = generate_code(stream_tasks(paths, errors, remaining=run.remaining), run)
+    except Exception as e:
+        Log.logger.error("An unexpected error occurred during the process.", exc_info=True)
+        print(f"Error encountered: {e}. Please check the log for more details.")
+        return
+
+    if errors:
+        print(f"{Fore.RED}These files were skipped because of errors:{Style.RESET_ALL}")
+        print_formatted_errors(errors)
+    report_run(summary, shard)
+
+
+def report_run(summary, shard=None):
+    print_run_summary(summary)
+    if shard is not None:
+        shard.write_manifest(Config.Shard_Manifest_Path, summary)
+        print(
+            f"{Fore.GREEN}Wrote the manifest of shard {shard.index}/{shard.count} to "
+            f"{Config.Shard_Manifest_Path}{Style.RESET_ALL}"
+        )
+
+
+def print_definitions(name, paths):
+    index = ContextIndex(regexPatterns, Config.Index_Path)
+    index.refresh(paths)
+    index.save()
+    definitions = index.where(name)
+    if not definitions:
+        print(f"{Fore.RED}Context variable '{name}' is not defined in any indexed file{Style.RESET_ALL}")
+    for path, start, end, digest in definitions:
+        print(f"{Fore.GREEN}{os.path.relpath(path)}: bytes {start}-{end} (sha256 {digest[:12]}){Style.RESET_ALL}")
+
+
+def print_plan(plan, output_format="text"):
+    if output_format == "json":
+        print(json.dumps(plan, indent=2))
+        return
+
+    print(f"{Fore.CYAN}Execution plan ({plan['model']}){Style.RESET_ALL}")
+    for entry in plan["prompts"]:
+        detail = entry.get("reason") or f"~{entry['input_tokens']} in / ~{entry['output_tokens']} out tokens"
+        print(
+            f"{Fore.GREEN}         • {entry['file']}::{entry['prompt']}: {entry['status']}, {detail}{Style.RESET_ALL}"
+        )
+    print(f"{Fore.CYAN}Layers{Style.RESET_ALL}")
+    for number, layer in enumerate(plan["layers"], start=1):
+        print(f"{Fore.GREEN}         {number}. {', '.join(layer)}{Style.RESET_ALL}")
+    print(
+        f"{Fore.CYAN}Critical path (~{plan['critical_path_seconds']:.0f}s):{Style.RESET_ALL} "
+        f"{' -> '.join(plan['critical_path'])}"
+    )
+    print(f"{Fore.CYAN}Tokens:{Style.RESET_ALL} ~{plan['input_tokens']} input, ~{plan['output_tokens']} output")
+    print(f"{Fore.CYAN}Estimated cost{Style.RESET_ALL}")
+    for model, cost in sorted(plan["cost_usd"].items()):
+        print(
+            f"{Fore.GREEN}         • {model}: {'unknown price' if cost is None else f'~${cost:.4f}'}{Style.RESET_ALL}"
+        )
+    for workers, seconds in plan["predicted_seconds"].items():
+        print(f"{Fore.CYAN}Predicted wall-clock time at concurrency {workers}:{Style.RESET_ALL} ~{seconds:.0f}s")
+    print(f"{Fore.MAGENTA}{'-'*80}{Style.RESET_ALL}")
+
+
+def print_run_summary(summary):
+    print(f"{Fore.CYAN}Run summary{Style.RESET_ALL}")
+    for line in summary.lines():
+        print(f"{Fore.GREEN}         • {line}{Style.RESET_ALL}")
+    print(f"{Fore.MAGENTA}{'-'*80}{Style.RESET_ALL}")
 
 
 def print_formatted_errors(errors):
@@ -215,7 +677,9 @@ def main():
     Log.logger.debug(f"Using OpenRouter model: {Config.Model}")
 
     # Run the context process
-    contextProcess()
+    exit_code = contextProcess()
+    if exit_code:
+        sys.exit(exit_code)
 
     Log.logger.info("PROCESSING SUCCESFULL!!!")
 
@@ -11,11 +11,15 @@
 #    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #    See the License for the specific language governing permissions and
 #    limitations under the License.
+import os
 import re
 
 from .log import Log
 
 _PLACEHOLDER_PATTERN = re.compile(r"{(\w+)}")
+# {path/to/file.py::PromptName}: the output of a prompt in another file. Paths are relative to the
+# working directory, like <import> paths.
+CROSS_FILE_PATTERN = re.compile(r"{([^{}\s]+?)::(\w+)}")
 
 
 class PromptDependencyCycleError(ValueError):
@@ -36,46 +40,187 @@ class PromptDependencyCycleError(ValueError):
 
 
 def build_prompt_order(tasks):
-    """Populate prompt_order and prompt_layers on each task.
+    """Populate prompt_order, prompt_layers, prompt_dependencies and prompt_external_dependencies on each task.
 
     Raises:
         PromptDependencyCycleError: if any task contains cyclic prompt dependencies.
     """
 
     for task in tasks:
-        task.prompt_order, task.prompt_layers = _order_prompts(task)
+        task.prompt_order, task.prompt_layers, task.prompt_dependencies = _order_prompts(task)
+        task.prompt_external_dependencies = _external_dependencies(task)
+
+
+def prompt_key(filepath, prompt_name):
+    """Identity of a prompt across files: (absolute path, prompt name)."""
+
+    return os.path.abspath(filepath), prompt_name
+
+
+def format_prompt_key(key):
+    return f"{os.path.relpath(key[0])}::{key[1]}"
+
+
+def _external_dependencies(task):
+    """{prompt name: [prompt_key of every prompt of another file it waits for]}, for prompts with any.
+
+    A prompt waits for every {file::Prompt} it references, and for every prompt of a file that one of
+    its context variables imports whole (<file:X>, <dir:X>, also through <import>): the variable is
+    read once that file is written, so the prompt sees the same content however the run is scheduled.
+    """
+
+    own_path = os.path.abspath(task.filepath)
+    writers = getattr(task, "context_writers", None) or {}
+    external = {}
+    for prompt_name, prompt_content in task.prompts.items():
+        keys = [prompt_key(path, name) for path, name in CROSS_FILE_PATTERN.findall(prompt_content)]
+        for key in keys:
+            if key[0] == own_path:
+                raise ValueError(
+                    f"Prompt '{prompt_name}' in {task.filepath} references its own file as "
+                    f"'{format_prompt_key(key)}'; use {{{key[1]}}} instead."
+                )
+            if not os.path.isfile(key[0]):
+                raise ValueError(
+                    f"Prompt '{prompt_name}' in {task.filepath} references '{format_prompt_key(key)}', "
+                    "but that file does not exist."
+                )
+        for placeholder in _PLACEHOLDER_PATTERN.findall(prompt_content):
+            keys += writers.get(placeholder, [])
+        if keys:
+            external[prompt_name] = list(dict.fromkeys(keys))
+    return external
+
+
+class PromptGraph:
+    """The prompts of every Task in a run as one DAG, including {file::Prompt} references between files.
+
+    Tasks are added one at a time (after build_prompt_order), so the graph also works while files are
+    streamed in. A Task that would close a cycle is rejected and left out of the graph. References to
+    files that are not (yet) in the graph stay open; see unresolved().
+    """
+
+    def __init__(self):
+        self._dependencies = {}
+
+    def add(self, task):
+        """Add the prompts of ``task``.
+
+        Raises:
+            PromptDependencyCycleError: if the task's prompts close a dependency cycle across files.
+        """
+
+        own = {}
+        external = getattr(task, "prompt_external_dependencies", None) or {}
+        dependencies = getattr(task, "prompt_dependencies", None) or {}
+        for prompt_name in task.prompts.keys():
+            key = prompt_key(task.filepath, prompt_name)
+            own[key] = [prompt_key(task.filepath, name) for name in dependencies.get(prompt_name, ())]
+            own[key] += external.get(prompt_name, [])
+        self._dependencies.update(own)
+
+        cycle = self._find_cycle(own)
+        if cycle:
+            for key in own:
+                del self._dependencies[key]
+            cyclic_prompts = [format_prompt_key(key) for key in cycle]
+            msg = (
+                f"Dependency cycle detected across files from {task.filepath}. Cyclic prompts: {cyclic_prompts}. "
+                "Please break the cycle instead of referencing prompts in both directions."
+            )
+            Log.logger.error(msg)
+            raise PromptDependencyCycleError(msg, filepath=task.filepath, cyclic_prompts=cyclic_prompts)
+
+    def _find_cycle(self, start_keys):
+        # The graph was acyclic before the last add, so any new cycle passes through one of its prompts.
+        # Iterative DFS: generated spec files can chain thousands of prompts.
+        done = set()
+        for start in start_keys:
+            if start in done:
+                continue
+            path, on_path, stack = [start], {start}, [iter(self._dependencies[start])]
+            while stack:
+                dependency = next(stack[-1], None)
+                if dependency is None:
+                    key = path.pop()
+                    on_path.discard(key)
+                    done.add(key)
+                    stack.pop()
+                elif dependency in on_path:
+                    return path[path.index(dependency) :]
+                elif dependency not in done and dependency in self._dependencies:
+                    path.append(dependency)
+                    on_path.add(dependency)
+                    stack.append(iter(self._dependencies[dependency]))
+        return None
+
+    def unresolved(self):
+        """(prompt, missing dependency) pairs whose dependency is not a prompt in the graph."""
+
+        return [
+            (key, dependency)
+            for key, dependencies in self._dependencies.items()
+            for dependency in dependencies
+            if dependency not in self._dependencies
+        ]
+
+    def layers(self):
+        """Global execution layers: every prompt runs after all of its dependencies' layers."""
+
+        in_degree = {}
+        dependents = {key: [] for key in self._dependencies}
+        for key, dependencies in self._dependencies.items():
+            present = [dependency for dependency in dependencies if dependency in self._dependencies]
+            in_degree[key] = len(present)
+            for dependency in present:
+                dependents[dependency].append(key)
+
+        layers = []
+        current_layer = [key for key, degree in in_degree.items() if degree == 0]
+        while current_layer:
+            layers.append(current_layer)
+            next_layer = []
+            for key in current_layer:
+                for dependent in dependents[key]:
+                    in_degree[dependent] -= 1
+                    if in_degree[dependent] == 0:
+                        next_layer.append(dependent)
+            current_layer = next_layer
+        return layers
 
 
 def _order_prompts(task):
+    # Kahn's algorithm: O(V + E). Layer order matches the original quadratic scan: each layer lists the
+    # prompts unblocked by the previous layer's prompts in turn, each group in prompt declaration order
+    # (dependents are appended while iterating prompts in declaration order).
     prompt_names = list(task.prompts.keys())
-    dependencies = {name: set() for name in prompt_names}
+    in_degree = dict.fromkeys(prompt_names, 0)
+    dependents = {name: [] for name in prompt_names}
+    dependencies = {name: [] for name in prompt_names}
 
     for prompt_name, prompt_content in task.prompts.items():
-        placeholders = _PLACEHOLDER_PATTERN.findall(prompt_content)
-        for placeholder in placeholders:
-            if placeholder in task.prompts and placeholder != prompt_name:
-                dependencies[prompt_name].add(placeholder)
+        for placeholder in dict.fromkeys(_PLACEHOLDER_PATTERN.findall(prompt_content)):
+            if placeholder in in_degree and placeholder != prompt_name:
+                dependents[placeholder].append(prompt_name)
+                dependencies[prompt_name].append(placeholder)
+                in_degree[prompt_name] += 1
 
-    ready = [name for name, deps in dependencies.items() if not deps]
     processed = []
     layers = []
-    remaining = {name: set(deps) for name, deps in dependencies.items()}
-
-    while ready:
-        current_layer = []
-        for name in list(ready):
-            ready.remove(name)
-            current_layer.append(name)
-            processed.append(name)
-            for other_name, deps in remaining.items():
-                if name in deps:
-                    deps.remove(name)
-                    if not deps and other_name not in processed and other_name not in ready:
-                        ready.append(other_name)
-        if current_layer:
-            layers.append(current_layer)
-
-    remaining_prompts = [name for name in prompt_names if name not in processed]
+    current_layer = [name for name in prompt_names if in_degree[name] == 0]
+
+    while current_layer:
+        layers.append(current_layer)
+        processed.extend(current_layer)
+        next_layer = []
+        for name in current_layer:
+            for dependent in dependents[name]:
+                in_degree[dependent] -= 1
+                if in_degree[dependent] == 0:
+                    next_layer.append(dependent)
+        current_layer = next_layer
+
+    remaining_prompts = [name for name in prompt_names if in_degree[name] > 0]
     if remaining_prompts:
         msg = (
             "Dependency cycle detected in prompts from "
@@ -86,4 +231,4 @@ def _order_prompts(task):
         Log.logger.error(msg)
         raise PromptDependencyCycleError(msg, filepath=task.filepath, cyclic_prompts=remaining_prompts)
 
-    return processed, layers
+    return processed, layers, dependencies
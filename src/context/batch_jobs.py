@@ -0,0 +1,73 @@
+#    Copyright 2023 Robert Mazurowski
+
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+"""Offline bulk generation through JSONL files in the OpenAI batch format.
+
+--batch-submit writes one request line per prompt; the file is uploaded to a batch API, and
+--batch-collect applies the output file through the normal write path.
+"""
+
+import json
+import os
+
+_CUSTOM_ID_SEPARATOR = "::"
+
+
+def make_custom_id(filepath: str, prompt_name: str) -> str:
+    return f"{os.path.relpath(filepath)}{_CUSTOM_ID_SEPARATOR}{prompt_name}"
+
+
+def split_custom_id(custom_id: str) -> tuple[str, str]:
+    filepath, _, prompt_name = custom_id.rpartition(_CUSTOM_ID_SEPARATOR)
+    return filepath, prompt_name
+
+
+def batch_request_line(custom_id: str, model: str, system: str, prompt: str) -> str:
+    request = {
+        "custom_id": custom_id,
+        "method": "POST",
+        "url": "/v1/chat/completions",
+        "body": {
+            "model": model,
+            "messages": [
+                {"role": "system", "content": system},
+                {"role": "user", "content": prompt},
+            ],
+        },
+    }
+    return json.dumps(request, ensure_ascii=False)
+
+
+def read_batch_results(path: str) -> tuple[dict[str, str], dict[str, str]]:
+    """Read a batch output file; returns ({custom_id: content}, {custom_id: error message})."""
+
+    results = {}
+    errors = {}
+    with open(path, encoding="utf-8") as file:
+        for line_number, line in enumerate(file, start=1):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+            custom_id = record.get("custom_id")
+            if custom_id is None:
+                raise ValueError(f"Batch result on line {line_number} of {path} has no custom_id.")
+
+            response = record.get("response") or {}
+            if record.get("error") or response.get("status_code") != 200:
+                errors[custom_id] = str(record.get("error") or f"status {response.get('status_code')}")
+                continue
+            try:
+                results[custom_id] = response["body"]["choices"][0]["message"]["content"]
+            except (KeyError, IndexError, TypeError):
+                errors[custom_id] = "response body has no message content"
+    return results, errors
@@ -0,0 +1,83 @@
+#    Copyright 2023 Robert Mazurowski
+
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+import hashlib
+import threading
+
+
+def content_digest(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+def content_key(*parts: str) -> str:
+    """Digest identifying a combination of texts (e.g. model, system message and prompt) for caching."""
+
+    digest = hashlib.sha256()
+    for part in parts:
+        encoded = part.encode("utf-8")
+        # Length-prefix each part so ("ab", "c") and ("a", "bc") get different keys.
+        digest.update(len(encoded).to_bytes(8, "big"))
+        digest.update(encoded)
+    return digest.hexdigest()
+
+
+class BlobRef:
+    """Lightweight reference to a value in a BlobStore; what a context variable holds once loaded."""
+
+    __slots__ = ("digest", "length")
+
+    def __init__(self, digest: str, length: int):
+        self.digest = digest
+        self.length = length
+
+    def __repr__(self):
+        return f"<blob {self.digest[:12]} {self.length} chars>"
+
+
+class BlobStore:
+    """Content-addressed store of context values: each distinct text is kept once, keyed by its sha256."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._blobs = {}
+        self.references = 0
+        self.stored_chars = 0
+
+    def put(self, text: str, digest: str | None = None) -> BlobRef:
+        digest = digest or content_digest(text)
+        with self._lock:
+            if digest not in self._blobs:
+                self._blobs[digest] = text
+                self.stored_chars += len(text)
+            self.references += 1
+        return BlobRef(digest, len(text))
+
+    def get(self, ref: BlobRef) -> str:
+        return self._blobs[ref.digest]
+
+    def ref(self, digest: str) -> BlobRef | None:
+        """A reference to already stored content with this digest, or None if it was never stored."""
+
+        text = self._blobs.get(digest)
+        if text is None:
+            return None
+        with self._lock:
+            self.references += 1
+        return BlobRef(digest, len(text))
+
+    def __len__(self):
+        return len(self._blobs)
+
+
+# Shared by every Task of the process so identical values are stored once.
+blob_store = BlobStore()
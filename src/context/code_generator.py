@@ -12,58 +12,711 @@
 #    See the License for the specific language governing permissions and
 #    limitations under the License.
 import json
+import threading
+import time
 import traceback
-
+from collections import ChainMap
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+
+from .ast import CROSS_FILE_PATTERN, PromptGraph, format_prompt_key, prompt_key
+from .batch_jobs import batch_request_line, make_custom_id, read_batch_results
+from .blob_store import content_digest, content_key
+from .concurrency import is_overload_error
+from .config import Config
+from .file_manager import write_file_atomically
+from .graph import pop_call_metrics, run_scope, system_message
+from .journal import RunJournal
+from .lazy_context import ContextLoadError
+from .lockfile import LockDriftError, Lockfile
 from .log import Log
-from .openai_interface import generate_code_with_chat
+from .openai_interface import build_batch_prompt, generate_batch_with_chat, generate_code_with_chat
+from .run_state import RunState
+from .scheduler import (
+    LatencyHistory,
+    PromptScheduler,
+)
+from .token_budget import (
+    VARIABLE_PRIORITIES,
+    PromptTooLargeError,
+    context_window,
+    estimate_tokens,
+    fit_prompt,
+    prompt_token_budget,
+)
+
+# How often a worker waiting for an LLM response checks whether the run was cancelled.
+_CANCEL_POLL_SECONDS = 0.1
+
+
+def generate_code(tasks, run=None):
+    """Generate code for every task and return the RunSummary of the run.
+
+    Prompts run concurrently once the prompts they depend on are written, critical path first across
+    all files (see scheduler.PromptScheduler); the number of in-flight LLM requests is bounded by the
+    run's adaptive limiter. ``tasks`` may be a lazy iterable (see pipeline.stream_tasks): each Task is
+    scheduled as soon as it arrives, and at most Config.Pipeline_Queue_Size files are in progress.
+    ``run`` is the RunState to use, e.g. the one whose deadline also bounds the wait for a streamed Task.
+    """
 
+    run = run or RunState()
+    run.journal = RunJournal(Config.Journal_Path) if Config.Journal_Path else None
+    run.lock = Lockfile(Config.Lock_Path) if Config.Lock_Path else None
+    history = LatencyHistory(Config.Latency_History_Path)
+    pool = ThreadPoolExecutor(max_workers=max(1, Config.Max_Concurrency), thread_name_prefix="context")
+    scheduler = PromptScheduler(
+        pool, run, __plan_file, lambda task, group: __run_prompt_group(task, group, run), history
+    )
+    pending = threading.BoundedSemaphore(max(1, Config.Pipeline_Queue_Size))
+    futures = {}
+    remaining_tasks = iter(tasks)
+    try:
+        for task in remaining_tasks:
+            if not pending.acquire(timeout=run.remaining()) or run.is_cancelled():
+                raise FuturesTimeoutError()
+            # A file waiting for a {file::Prompt} of a file not read yet gives its slot back, or files
+            # referencing a later file could fill every slot and wait for it forever.
+            release = __release_once(pending)
+            future = scheduler.add(task, on_parked=release)
+            future.add_done_callback(lambda _, release=release: release())
+            futures[future] = task
+        scheduler.finish_input()
+
+        for future in as_completed(futures, timeout=run.remaining()):
+            try:
+                future.result()
+            except Exception:
+                Log.logger.debug(f"Error while processing task from file {futures[future].filepath}:")
+                traceback.print_exc()
+    except (FuturesTimeoutError, TimeoutError):
+        Log.logger.warning("Run deadline reached; cancelling the remaining prompts.")
+        __cancel_run(run, futures, remaining_tasks, tasks)
+    except KeyboardInterrupt:
+        Log.logger.warning("Interrupted; cancelling the remaining prompts.")
+        __cancel_run(run, futures, remaining_tasks, tasks)
+    finally:
+        # Workers stop waiting for their requests once the run is cancelled; the requests themselves
+        # run on daemon threads (see __call_while_running) and are abandoned.
+        pool.shutdown(wait=True, cancel_futures=True)
+        run.close()
+        if run.journal is not None:
+            run.journal.close()
+
+    history.save()
+    if run.lock is not None:
+        run.lock.save()
+    run.summary.record_concurrency(run.limiter)
+    return run.summary
+
+
+def __release_once(semaphore):
+    lock = threading.Lock()
+    held = [True]
+
+    def release():
+        with lock:
+            if not held[0]:
+                return
+            held[0] = False
+        semaphore.release()
+
+    return release
+
+
+def __cancel_run(run, futures, remaining_tasks, tasks):
+    """Stop the run and list every prompt that has not been written yet as cancelled."""
+
+    # Tasks that were never submitted are listed too when they are already in memory; a streamed
+    # input is not drained, since that would parse the rest of the repository.
+    unsubmitted = list(remaining_tasks) if isinstance(tasks, list | tuple) else []
+
+    # Holding the commit lock guarantees no worker is half-way through writing a file while we
+    # decide what has been committed; workers check for cancellation under the same lock.
+    with run.commit_lock:
+        run.cancel()
+        for task in [task for future, task in futures.items() if not future.done() or future.cancelled()] + unsubmitted:
+            if not __has_outputs(task):
+                continue
+            prompt_names = getattr(task, "prompt_order", None) or list(task.prompts.keys())
+            pending = [name for name in prompt_names if not run.is_committed(task.filepath, name)]
+            run.summary.record_cancelled(task.filepath, pending)
+
+
+def __call_llm(final_prompt, prompt_name, run):
+    """Call the LLM once per distinct (model, system message, prompt) in the run.
+
+    Concurrent identical requests wait for the first one and reuse its response.
+    """
 
-def generate_code(tasks):
-    for task in tasks:
+    key = content_key(Config.Model, system_message(prompt_name), final_prompt)
+    return __shared_call(key, prompt_name, lambda: generate_code_with_chat(final_prompt, prompt_name), run)
+
+
+def __call_llm_batch(prompts, global_context, run):
+    """Send several independent prompts in one request; returns {prompt_name: response JSON}."""
+
+    key = content_key(Config.Model, "BATCH", global_context or "", *(part for item in prompts.items() for part in item))
+    label = f"batch {', '.join(prompts)}"
+    return __shared_call(key, label, lambda: generate_batch_with_chat(prompts, global_context), run)
+
+
+def __shared_call(key, label, call, run):
+    response, shared = run.single_flight.do(key, lambda: __call_with_retries(call, label, run))
+    if shared:
+        Log.logger.debug(f"Reusing the response of an identical request for {label}")
+        run.summary.record_deduplicated()
+    return response
+
+
+def __call_with_retries(call, label, run):
+    """Run one LLM call under the run's concurrency limiter, retrying on rate limits and timeouts."""
+
+    attempt = 1
+    while True:
+        if run.is_cancelled():
+            return None
+        with run.limiter.slot():
+            started = time.monotonic()
+            try:
+                outcome = __call_while_running(call, run)
+                if outcome is None:
+                    return None
+                response, call_metrics = outcome
+            except Exception as e:
+                if not is_overload_error(e) or attempt >= Config.Max_Retries:
+                    run.summary.record_failure()
+                    raise
+                run.limiter.on_overload()
+                run.summary.record_retry()
+                Log.logger.warning(
+                    f"Provider overloaded while generating {label} ({e}); "
+                    f"retrying with concurrency limit {run.limiter.limit}."
+                )
+            else:
+                latency = time.monotonic() - started
+                # Batched calls return {prompt name: response}.
+                output = response if isinstance(response, str) else json.dumps(response)
+                run.limiter.on_success(latency, estimate_tokens(output or "", Config.Model))
+                run.summary.record_success(latency)
+                if call_metrics is not None:
+                    run.summary.record_call_metrics(call_metrics)
+                return response
+
+        # Back off outside the slot so waiting retries do not hold concurrency, and never past the deadline.
+        if run.wait(Config.Retry_Backoff_Seconds * 2 ** (attempt - 1)):
+            return None
+        attempt += 1
+
+
+def __call_while_running(call, run):
+    """Run ``call`` on a daemon thread; returns (response, call metrics), or None once the run is cancelled.
+
+    A request abandoned by a cancelled run (deadline or Ctrl-C) cannot keep the process alive until it
+    times out: its thread is a daemon, and a streamed completion stops at its next chunk.
+    """
+
+    outcome = {}
+    done = threading.Event()
+
+    def target():
         try:
-            __single_file_flow(task)
-        except Exception:
-            Log.logger.debug(f"Error while processing task from file {task.filepath}:")
-            traceback.print_exc()
+            with run_scope(run):
+                outcome["response"] = call()
+                outcome["metrics"] = pop_call_metrics()
+        except BaseException as e:
+            outcome["error"] = e
+        finally:
+            done.set()
+
+    threading.Thread(target=target, name=f"{threading.current_thread().name}-call", daemon=True).start()
+    while not done.wait(_CANCEL_POLL_SECONDS):
+        if run.is_cancelled():
+            return None
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["response"], outcome["metrics"]
+
+
+def submit_batch(tasks, batch_path):
+    """Write the rendered prompts of the planned tasks that can run now to an OpenAI-format batch JSONL file.
+
+    No LLM calls are made, and prompts are rendered against the files as they are now: a prompt reading
+    the output of another prompt of the run is deferred to a later batch (see __split_batch) and logged.
+    Returns the number of requests written.
+    """
+
+    journal = RunJournal(Config.Journal_Path) if Config.Resume and Config.Journal_Path else None
+    submitted, deferred = __split_batch(tasks, journal)
+    count = 0
+    with open(batch_path, "w", encoding="utf-8") as batch_file:
+        for task, prompt_name in submitted:
+            try:
+                final_prompt = __render_prompt(task, prompt_name)
+            except (PromptTooLargeError, ContextLoadError) as e:
+                Log.logger.error(str(e))
+                continue
+            line = batch_request_line(
+                make_custom_id(task.filepath, prompt_name),
+                Config.Model,
+                system_message(prompt_name),
+                final_prompt,
+            )
+            batch_file.write(line + "\n")
+            count += 1
+    if deferred:
+        names = ", ".join(format_prompt_key(prompt_key(task.filepath, name)) for task, name in deferred)
+        Log.logger.warning(
+            f"Deferred {len(deferred)} prompts that need the output of prompts in this batch: {names}. "
+            "Collect this batch with --resume, then submit again with --resume."
+        )
+    return count
+
+
+def __split_batch(tasks, journal):
+    """The prompts of a batch run to submit now and those deferred to a later batch, in AST order.
+
+    A batch is rendered before any of its results exist, so a prompt that needs the output of another
+    prompt of the run (in its file, through {file::Prompt} or a whole-file import, or the previous writer
+    of its output tag) waits for a later batch. With a journal (--resume), prompts collected with
+    unchanged inputs are neither submitted nor deferred, and no longer hold back their dependents.
+    Returns ([(task, prompt name)] to submit, [(task, prompt name)] deferred).
+    """
+
+    tasks = [task for task in tasks if __has_outputs(task)]
+    prompts = {}
+    graph = PromptGraph()
+    for task in tasks:
+        __materialize(task)
+        prompts.update((prompt_key(task.filepath, name), (task, name)) for name in task.prompts)
+        graph.add(task)
+
+    # Dependencies first, so a prompt only counts as collected when everything it depends on is.
+    collected = set()
+    if journal is not None:
+        for key in (key for layer in graph.layers() for key in layer):
+            task, name = prompts[key]
+            if __plan_resumed(task, name, journal, collected, batched=True):
+                collected.add(key)
+
+    submitted, deferred = [], []
+    for task in tasks:
+        for prompt_name in getattr(task, "prompt_order", None) or list(task.prompts.keys()):
+            key = prompt_key(task.filepath, prompt_name)
+            if key in collected:
+                continue
+            waits = set(__batch_dependencies(task, prompt_name)) & prompts.keys() - collected
+            (deferred if waits else submitted).append((task, prompt_name))
+    return submitted, deferred
+
+
+def __batch_dependencies(task, prompt_name):
+    dependencies = [
+        prompt_key(task.filepath, name)
+        for name in (getattr(task, "prompt_dependencies", None) or {}).get(prompt_name, ())
+    ]
+    dependencies += (getattr(task, "prompt_external_dependencies", None) or {}).get(prompt_name, [])
+    output_target = getattr(task, "prompt_output_targets", {}).get(prompt_name)
+    if output_target is not None:
+        writers = __tag_writers(task, output_target)
+        dependencies += [prompt_key(task.filepath, name) for name in writers[: writers.index(prompt_name)]]
+    return dependencies
 
 
-def __single_file_flow(task):
+def collect_batch(tasks, results_path):
+    """Apply a batch output file to the tasks through the normal write path, in AST order.
+
+    Only the prompts submit_batch wrote for the same files and journal are expected; deferred ones are
+    left alone. Returns a RunSummary: applied prompts count as completed; failed or missing results as
+    failed.
+    """
+
+    results, errors = read_batch_results(results_path)
+    run = RunState()
+    run.journal = RunJournal(Config.Journal_Path) if Config.Journal_Path else None
+    run.lock = Lockfile(Config.Lock_Path) if Config.Lock_Path else None
+    # Split before anything is written, as submit_batch did.
+    submitted, _ = __split_batch(tasks, run.journal if Config.Resume else None)
+    for task, prompt_name in submitted:
+        custom_id = make_custom_id(task.filepath, prompt_name)
+        if custom_id not in results:
+            Log.logger.error(f"No batch result for {custom_id}: {errors.get(custom_id, 'missing from results')}")
+            run.summary.record_failure()
+            continue
+        __commit_response(task, prompt_name, json.dumps({"code": results[custom_id]}), run)
+        run.summary.record_applied()
+    if run.journal is not None:
+        run.journal.close()
+    if run.lock is not None:
+        run.lock.save()
+    return run.summary
+
+
+def apply_lock(tasks):
+    """Write every prompt's output from the lockfile (Config.Lock_Path) without calling the provider.
+
+    All prompts are checked first: when any of them is missing from the lock, was locked for another
+    model, or its inputs changed since it was locked, LockDriftError lists them and nothing is written.
+    Returns a RunSummary.
+    """
+
+    lock = Lockfile(Config.Lock_Path)
+    planned = []
+    drifted = []
+    for task in tasks:
+        for group in __plan_file(task):
+            for prompt_name in group:
+                key = prompt_key(task.filepath, prompt_name)
+                reason = __lock_drift(task, prompt_name, lock)
+                if reason:
+                    drifted.append(f"{lock.name(key)}: {reason}")
+                else:
+                    planned.append((task, prompt_name, lock.entry(key)["code"]))
+    if drifted:
+        raise LockDriftError(f"{len(drifted)} prompts drifted from {Config.Lock_Path}", drifted)
+
+    run = RunState()
+    # In AST order per file, so output-target prompts apply over the prompts they refine.
+    for task, prompt_name, code in planned:
+        if code:
+            __apply_code(code, task, prompt_name)
+        run.summary.record_locked()
+    return run.summary
+
+
+def __lock_drift(task, prompt_name, lock):
+    """Why the prompt cannot be applied from the lock, or None when its locked output is current."""
+
+    entry = lock.entry(prompt_key(task.filepath, prompt_name))
+    if entry is None:
+        return "not in the lockfile"
+    if entry["model"] != Config.Model:
+        return f"locked for {entry['model']}, not {Config.Model}"
+    try:
+        input_key = __input_key(task, prompt_name, lock)
+    except ContextLoadError as e:
+        return f"its inputs cannot be read: {e}"
+    if entry["input"] != input_key:
+        return "its inputs changed since it was locked"
+    return None
+
+
+def __plan_resumed(task, prompt_name, journal, resumed, batched=False):
+    dependencies = [
+        prompt_key(task.filepath, name)
+        for name in (getattr(task, "prompt_dependencies", None) or {}).get(prompt_name, ())
+    ]
+    dependencies += (getattr(task, "prompt_external_dependencies", None) or {}).get(prompt_name, [])
+    if any(dependency not in resumed for dependency in dependencies):
+        return False
+    try:
+        input_key = __input_key(task, prompt_name, journal)
+    except ContextLoadError:
+        return False
+    return journal.is_done(prompt_key(task.filepath, prompt_name), input_key) and __journaled_output_on_disk(
+        task, prompt_name, journal, batched
+    )
+
+
+def __materialize(task):
+    # Parsed Tasks keep tag texts as offsets into their file; read them before the first write moves them.
+    materialize = getattr(task, "materialize", None)
+    if materialize is None:
+        return
+    try:
+        materialize()
+    except ContextLoadError as e:
+        # Edited since it was parsed: each prompt needing a text from the file is skipped when it renders.
+        Log.logger.warning(str(e))
+
+
+def __has_outputs(task):
+    return bool(task.prompt_outputs or task.prompt_outputs_tags or getattr(task, "prompt_output_targets", {}))
+
+
+def __single_file_flow(task, run=None):
+    """Generate one file's prompts one after another, in AST order."""
+
+    run = run or RunState()
+
+    # Process each prompt (or batch of independent prompts) in the task
+    for group in __plan_file(task):
+        if run.is_cancelled():
+            return
+        __run_prompt_group(task, group, run)
+
+
+def __plan_file(task):
+    """The task's prompt groups in AST order; none when the task has nothing to write."""
+
     # If there are no prompt outputs / output tags / output-target mappings in the task, skip this task
-    if not task.prompt_outputs and not task.prompt_outputs_tags and not getattr(task, "prompt_output_targets", {}):
+    if not __has_outputs(task):
         Log.logger.debug(f"No prompt outputs or output tags in task from file {task.filepath}. Skipping this task.")
-        return
+        return []
+    __materialize(task)
+    return __plan_prompt_groups(task)
+
+
+def __run_prompt_group(task, group, run):
+    if Config.Resume and run.journal is not None:
+        group = [name for name in group if not __resume(task, name, run)]
+        if not group:
+            return
+    if len(group) == 1:
+        __run_single_prompt(task, group[0], run)
+    else:
+        __run_prompt_batch(task, group, run)
+
+
+def __resume(task, prompt_name, run):
+    """Skip a prompt whose latest journal entry has the same inputs; returns whether it was skipped."""
+
+    try:
+        input_key = __input_key(task, prompt_name, run.journal)
+    except ContextLoadError:
+        # Let the normal path report the unreadable import.
+        return False
+    if not run.journal.is_done(prompt_key(task.filepath, prompt_name), input_key):
+        return False
+    if not __journaled_output_on_disk(task, prompt_name, run.journal):
+        Log.logger.debug(f"Not resuming {prompt_name} in {task.filepath}: its output is no longer in the file")
+        return False
+    Log.logger.debug(f"Resuming: {prompt_name} in {task.filepath} is already journaled with the same inputs")
+    with run.commit_lock:
+        run.mark_committed(task.filepath, prompt_name)
+    run.summary.record_resumed()
+    return True
+
+
+def __journaled_output_on_disk(task, prompt_name, journal, batched=False):
+    """Whether the file still holds what the journal says was written for the prompt.
+
+    A {placeholder} still in the file was never (or no longer) replaced. An output tag must hold the
+    journaled output of its last writer; earlier writers of the tag were overwritten on purpose.
+    ``batched`` runs write one writer of a tag per batch, so the output of any later writer will do.
+    """
+
+    if prompt_name in task.prompt_outputs:
+        return False
+    tag = __output_tag(task, prompt_name)
+    if tag is None:
+        return True
+    writers = __tag_writers(task, tag)
+    try:
+        current = __read_tag_contents_from_file(task.filepath, tag)
+    except (OSError, ValueError):
+        return False
+    written = writers[writers.index(prompt_name) :] if batched else writers[-1:]
+    return content_digest(current) in {journal.output_digest(prompt_key(task.filepath, name)) for name in written}
+
+
+def __output_tag(task, prompt_name):
+    output_target = getattr(task, "prompt_output_targets", {}).get(prompt_name)
+    return output_target or (prompt_name if prompt_name in task.prompt_outputs_tags else None)
+
+
+def __tag_writers(task, tag):
+    """Prompts writing output tag ``tag``, in declaration order (the order they run in)."""
+
+    return [name for name in task.prompts if __output_tag(task, name) == tag]
+
+
+def __input_key(task, prompt_name, outputs):
+    """Key of everything the prompt's output depends on, as recorded in the run journal and lockfile.
+
+    The prompt text, model, system message, global context and referenced context variables are
+    hashed, together with the recorded output hashes (``outputs.output_digest``, from the journal or
+    the lockfile) of the prompts it depends on (in this file or via {file::Prompt}), so a dependency
+    that regenerated different code invalidates its dependents.
+    Output tags written by prompts of the file are outputs, not inputs, and are left out. The
+    CODE_TO_MODIFY of an output-target prompt is the output of the tag's previous writer; the first
+    writer replaces the tag's hand-written contents, so later edits to them fail the on-disk check.
+    """
+
+    prompt = task.prompts[prompt_name]
+    written = set(task.prompts) | set(getattr(task, "prompt_output_targets", {}).values())
+    variables = ChainMap(task.prompt_outputs_tags, task.context_dict)
+    inputs = []
+    for name in sorted(variables):
+        if name in written or "{" + name + "}" not in prompt:
+            continue
+        digest = None
+        if name not in task.prompt_outputs_tags and hasattr(task.context_dict, "digest"):
+            digest = task.context_dict.digest(name)
+        inputs.append(f"{name}={digest or content_digest(variables[name])}")
+
+    dependencies = [
+        prompt_key(task.filepath, name)
+        for name in (getattr(task, "prompt_dependencies", None) or {}).get(prompt_name, ())
+    ]
+    dependencies += (getattr(task, "prompt_external_dependencies", None) or {}).get(prompt_name, [])
+    inputs += [f"{path}::{name}={outputs.output_digest((path, name))}" for path, name in dependencies]
+
+    output_target = getattr(task, "prompt_output_targets", {}).get(prompt_name)
+    if output_target is not None:
+        writers = __tag_writers(task, output_target)
+        previous = writers[: writers.index(prompt_name)]
+        previous_output = outputs.output_digest(prompt_key(task.filepath, previous[-1])) if previous else ""
+        inputs.append(f"CODE_TO_MODIFY={previous_output}")
+    return content_key(Config.Model, system_message(prompt_name), prompt, task.global_context or "", *inputs)
+
+
+def __plan_prompt_groups(task):
+    """Split the task's prompts into execution groups, in AST order.
+
+    Without --batch-prompts every prompt is its own group. With it, small prompts of the same
+    prompt_layers layer (which never depend on each other) are packed together, up to
+    Config.Batch_Max_Size per request. Output-target prompts always run alone because they
+    read the current contents of their target tag, and so does a prompt waiting for prompts of
+    other files, or whose imports fail to load: it fails on its own instead of taking the rest of
+    the file with it.
+    """
 
-    # Process each prompt in the task
     prompt_names = getattr(task, "prompt_order", None) or list(task.prompts.keys())
-    for prompt_name in prompt_names:
-        prompt = task.prompts[prompt_name]
+    layers = getattr(task, "prompt_layers", None)
+    if not Config.Batch_Prompts or not layers:
+        return [[name] for name in prompt_names]
+
+    groups = []
+    for layer in layers:
+        batchable = [name for name in layer if __is_batchable(task, name)]
+        for i in range(0, len(batchable), Config.Batch_Max_Size):
+            groups.append(batchable[i : i + Config.Batch_Max_Size])
+        groups.extend([name] for name in layer if name not in batchable)
+    return groups
+
+
+def __is_batchable(task, prompt_name):
+    prompt = task.prompts[prompt_name]
+    if prompt_name in getattr(task, "prompt_output_targets", {}) or CROSS_FILE_PATTERN.search(prompt):
+        return False
+    # Its imports must not be read (and cached) before the other files' prompts it waits for are written.
+    if prompt_name in (getattr(task, "prompt_external_dependencies", None) or {}):
+        return False
+    try:
+        return len(__process_prompt(prompt, task, include_global_context=False)) <= Config.Batch_Max_Prompt_Chars
+    except ContextLoadError:
+        return False
+
+
+def __render_prompt(task, prompt_name, run=None, code_to_modify=None):
+    """Assemble the full prompt, trimmed to the token budget and checked against it before any call.
+
+    ``code_to_modify`` replaces the target tag's contents on disk for output-target prompts whose
+    previous writer has not been written to the file yet (queue workers).
+    """
 
-        # Assemble the prompt
-        final_prompt = __process_prompt(prompt, task)
+    prompt = task.prompts[prompt_name]
 
-        # If this prompt writes into a different output-tag variable via "->",
-        # include the current contents of that target tag so the LLM can revise it.
-        output_target = getattr(task, "prompt_output_targets", {}).get(prompt_name)
-        if output_target is not None:
+    # If this prompt writes into a different output-tag variable via "->",
+    # include the current contents of that target tag so the LLM can revise it.
+    code_to_modify_section = ""
+    output_target = getattr(task, "prompt_output_targets", {}).get(prompt_name)
+    if output_target is not None:
+        if code_to_modify is None:
             code_to_modify = __read_tag_contents_from_file(task.filepath, output_target)
-            final_prompt += f"\n\nCODE_TO_MODIFY:\n{code_to_modify}"
+        code_to_modify_section = f"\n\nCODE_TO_MODIFY:\n{code_to_modify}"
+
+    # Assemble the prompt, leaving room for CODE_TO_MODIFY (which is never trimmed)
+    final_prompt, trimmed = __assemble_prompt(
+        prompt, task, reserved_tokens=estimate_tokens(code_to_modify_section, Config.Model), run=run
+    )
+    final_prompt += code_to_modify_section
+    if trimmed:
+        Log.logger.warning(f"{prompt_name}: trimmed {', '.join(trimmed)} ({Config.Trim_Strategy}) to fit the budget")
+
+    try:
+        tokens = __check_prompt_size(final_prompt, prompt_name, task)
+    except PromptTooLargeError as e:
+        if run is not None:
+            run.summary.record_prompt_size(e.tokens, trimmed, rejected=True)
+        raise
+    if run is not None:
+        run.summary.record_prompt_size(tokens, trimmed)
+    return final_prompt
+
+
+def __run_single_prompt(task, prompt_name, run):
+    try:
+        final_prompt = __render_prompt(task, prompt_name, run)
+    except PromptTooLargeError as e:
+        # Skip only this prompt; the rest of the file can still be generated.
+        Log.logger.error(str(e))
+        run.summary.record_failure()
+        return
+    except ContextLoadError as e:
+        Log.logger.error(f"Skipping {prompt_name} in {task.filepath}: {e}")
+        run.summary.record_failure()
+        return
 
-        # Generate the output
-        response = generate_code_with_chat(final_prompt, prompt_name)
+    # Generate the output
+    response = __call_llm(final_prompt, prompt_name, run)
 
-        # Proceed only if response is not None
-        if response is not None:
-            # Parse the response JSON
-            response_json = json.loads(response)
+    # Proceed only if response is not None
+    if response is not None:
+        __commit_response(task, prompt_name, response, run)
 
-            # Extract the generated code
-            code = response_json.get("code", "").strip()
 
-            # For now mock the code change
-            Log.logger.debug(f"Generated code for {prompt_name}:\n{code}\n")
+def __run_prompt_batch(task, prompt_names, run):
+    try:
+        prompts = {
+            name: __process_prompt(task.prompts[name], task, include_global_context=False) for name in prompt_names
+        }
+    except ContextLoadError:
+        # Let each prompt report (and skip) its own unreadable import.
+        for prompt_name in prompt_names:
+            __run_single_prompt(task, prompt_name, run)
+        return
+    label = f"batch {', '.join(prompt_names)}"
+    try:
+        tokens = __check_prompt_size(build_batch_prompt(prompts, task.global_context), label, task)
+    except PromptTooLargeError:
+        # The prompts may still fit one by one (each is trimmed and checked on its own).
+        Log.logger.debug(f"{label} in {task.filepath} is over the token budget; generating its prompts individually.")
+        for prompt_name in prompt_names:
+            __run_single_prompt(task, prompt_name, run)
+        return
+    run.summary.record_prompt_size(tokens, [])
+    responses = __call_llm_batch(prompts, task.global_context, run)
+    if responses is None:
+        return
 
-            if code:  # Ensure there's generated code
-                __apply_code(code, task, prompt_name)
+    run.summary.record_batch(len(prompt_names), len(responses))
+    for prompt_name in prompt_names:
+        if prompt_name in responses:
+            __commit_response(task, prompt_name, responses[prompt_name], run)
+        else:
+            Log.logger.debug(f"Batch response for {prompt_name} missing or invalid; generating it individually.")
+            __run_single_prompt(task, prompt_name, run)
+
+
+def __commit_response(task, prompt_name, response, run):
+    # Parse the response JSON
+    response_json = json.loads(response)
+
+    # Extract the generated code
+    code = response_json.get("code", "").strip()
+
+    # For now mock the code change
+    Log.logger.debug(f"Generated code for {prompt_name}:\n{code}\n")
+
+    with run.commit_lock:
+        # A response that lands after the deadline or Ctrl-C is discarded (already listed as cancelled).
+        if run.is_cancelled():
+            return
+        if code:  # Ensure there's generated code
+            __apply_code(code, task, prompt_name)
+        run.mark_committed(task.filepath, prompt_name)
+        run.outputs[prompt_key(task.filepath, prompt_name)] = code
+        if run.journal is not None:
+            # Journaled as it reads back from its output tag, for the on-disk check of --resume.
+            run.journal.record(
+                prompt_key(task.filepath, prompt_name),
+                __input_key(task, prompt_name, run.journal),
+                code.strip("\n"),
+            )
+        if run.lock is not None:
+            key = prompt_key(task.filepath, prompt_name)
+            run.lock.record(key, Config.Model, __input_key(task, prompt_name, run.lock), code)
 
 
 def __find_tag_block_lines(*, lines: list[str], filepath: str, tag_name: str) -> tuple[int, int]:
@@ -108,27 +761,86 @@ def __read_tag_contents_from_file(filepath: str, tag_name: str) -> str:
     return "".join(content_lines).strip("\n")
 
 
-def __process_prompt(prompt, task):
-    # Copy the prompt to avoid modifying the original
-    constructedPrompt = prompt
+def __process_prompt(prompt, task, include_global_context=True):
+    return __assemble_prompt(prompt, task, include_global_context)[0]
+
+
+def __assemble_prompt(prompt, task, include_global_context=True, reserved_tokens=0, run=None):
+    """Build the prompt text; returns (prompt, names of variables trimmed to fit the token budget)."""
+
+    def assemble(variables):
+        # Copy the prompt to avoid modifying the original
+        constructedPrompt = prompt
+
+        # Replace {contextVar} in the prompt with contextVar content, then with outputVariables.
+        # Content is only read for placeholders that are present, so unused lazy imports are never loaded.
+        for var_name in variables:
+            placeholder = "{" + var_name + "}"
+            if placeholder not in constructedPrompt:
+                continue
+            formatted_var_content = f"\n\n{var_name}:\n{variables[var_name]}"
+            constructedPrompt = constructedPrompt.replace(placeholder, formatted_var_content)
 
-    # Replace {contextVar} in the prompt with contextVar content
-    for var_name, var_content in task.context_dict.items():
-        placeholder = "{" + var_name + "}"
-        formatted_var_content = f"\n\n{var_name}:\n{var_content}"
-        constructedPrompt = constructedPrompt.replace(placeholder, formatted_var_content)
+        # Append global context if present (batched requests send it once for all prompts instead)
+        if include_global_context and task.global_context:
+            constructedPrompt += "\n" + "GLOBAL_CONTEXT:\n" + task.global_context
 
-    # Replace {contextVar} in the prompt with outputVariables
-    for var_name, var_content in task.prompt_outputs_tags.items():
-        placeholder = "{" + var_name + "}"
-        formatted_var_content = f"\n\n{var_name}:\n{var_content}"
-        constructedPrompt = constructedPrompt.replace(placeholder, formatted_var_content)
+        return constructedPrompt
 
-    # Append global context if present
-    if task.global_context:
-        constructedPrompt += "\n" + "GLOBAL_CONTEXT:\n" + task.global_context
+    # ChainMap keeps lazily imported context variables unread; output tags shadow context variables.
+    cross_file_outputs = __cross_file_outputs(prompt, run)
+    variables = ChainMap(cross_file_outputs, task.prompt_outputs_tags, task.context_dict)
+    sources = getattr(task, "context_sources", {})
+    priorities = {name: VARIABLE_PRIORITIES[sources.get(name, "context")] for name in task.context_dict}
+    priorities.update({name: VARIABLE_PRIORITIES["output"] for name in task.prompt_outputs_tags})
+    priorities.update({name: VARIABLE_PRIORITIES["output"] for name in cross_file_outputs})
+    # Only variables the prompt actually references can shrink it.
+    referenced = {name: variables[name] for name in variables if "{" + name + "}" in prompt}
 
-    return constructedPrompt
+    def assemble_referenced(trimmed):
+        return assemble(ChainMap(trimmed, variables))
+
+    budget = prompt_token_budget(Config.Model) - reserved_tokens
+    return fit_prompt(assemble_referenced, referenced, priorities, budget, Config.Trim_Strategy, Config.Model)
+
+
+def __cross_file_outputs(prompt, run):
+    """{"path::Prompt": code} for every {path::Prompt} reference in the prompt.
+
+    The code written by that prompt in this run if there is any, otherwise the current contents of
+    its <Prompt> output tag in the other file.
+    """
+
+    outputs = {}
+    for path, name in CROSS_FILE_PATTERN.findall(prompt):
+        key = prompt_key(path, name)
+        if run is not None and key in run.outputs:
+            outputs[f"{path}::{name}"] = run.outputs[key]
+            continue
+        try:
+            outputs[f"{path}::{name}"] = __read_tag_contents_from_file(path, name)
+        except (OSError, ValueError) as e:
+            raise ContextLoadError(
+                f"{format_prompt_key(key)} was not generated in this run and has no readable <{name}> output tag: {e}"
+            ) from e
+    return outputs
+
+
+def __check_prompt_size(final_prompt, prompt_name, task):
+    """Pre-flight check: fail before the provider round trip when a prompt cannot fit the model."""
+
+    tokens = estimate_tokens(final_prompt, Config.Model)
+    budget = prompt_token_budget(Config.Model)
+    window = context_window(Config.Model)
+    Log.logger.debug(f"{prompt_name}: ~{tokens} prompt tokens, budget {budget}, {Config.Model} window {window}")
+    if tokens > budget:
+        raise PromptTooLargeError(
+            f"Prompt '{prompt_name}' in {task.filepath} is ~{tokens} tokens, over the {budget}-token budget "
+            f"for {Config.Model}. Use --trim-strategy head|tail|drop or reduce the referenced context.",
+            tokens=tokens,
+            budget=budget,
+        )
+    return tokens
 
 
 def __apply_code(code, task, prompt_name):
@@ -178,6 +890,5 @@ def __apply_code(code, task, prompt_name):
 
     Log.logger.debug(f"Final code:\n{updated_code}\n")
 
-    # Overwrite the file with the updated code
-    with open(task.filepath, "w") as file:
-        file.write(updated_code)
+    # Overwrite the file with the updated code; files still being parsed may import it.
+    write_file_atomically(task.filepath, updated_code)
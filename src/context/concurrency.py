@@ -0,0 +1,230 @@
+#    Copyright 2023 Robert Mazurowski
+
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from contextlib import contextmanager
+
+# HTTP statuses that mean "the provider is overloaded, slow down" rather than "this request is wrong".
+_OVERLOAD_STATUS_CODES = {408, 429, 502, 503, 504}
+# Latencies are compared per output token, counting at least this many tokens, so the fixed round trip
+# of a short answer does not look like congestion next to long answers.
+_MIN_NORMALIZED_TOKENS = 256
+
+
+def is_overload_error(exc: BaseException) -> bool:
+    """Return True if the exception signals rate limiting or a timeout from the provider.
+
+    Checked by duck typing so it works for openai/httpx errors without importing them here.
+    """
+
+    if isinstance(exc, TimeoutError):
+        return True
+    status = getattr(exc, "status_code", None) or getattr(getattr(exc, "response", None), "status_code", None)
+    if status in _OVERLOAD_STATUS_CODES:
+        return True
+    name = type(exc).__name__
+    return "RateLimit" in name or "Timeout" in name
+
+
+class AdaptiveConcurrencyLimiter:
+    """Bounds the number of in-flight LLM requests with an AIMD controller.
+
+    The limit grows by about one slot per window of fast successful responses (additive increase)
+    and is cut multiplicatively on rate limits, timeouts, or when the smoothed latency per output token
+    rises well above its baseline: the best smoothed value of the last ``baseline_window`` responses,
+    so the baseline follows the provider when its normal speed changes.
+    """
+
+    def __init__(
+        self,
+        initial: int = 4,
+        minimum: int = 1,
+        maximum: int = 16,
+        backoff: float = 0.5,
+        latency_tolerance: float = 3.0,
+        baseline_window: int = 100,
+    ):
+        if minimum < 1 or maximum < minimum:
+            raise ValueError(f"Invalid concurrency bounds: minimum={minimum}, maximum={maximum}.")
+
+        self.minimum = minimum
+        self.maximum = maximum
+        self._limit = float(min(max(initial, minimum), maximum))
+        self._backoff = backoff
+        self._latency_tolerance = latency_tolerance
+        self._in_flight = 0
+        self._smoothed_latency = None
+        self._smoothed_cost = None
+        self._recent_costs = deque(maxlen=baseline_window)
+        self._last_decrease = float("-inf")
+        self._cond = threading.Condition()
+        self.peak = self.limit
+
+    @property
+    def limit(self) -> int:
+        return int(self._limit)
+
+    @property
+    def in_flight(self) -> int:
+        return self._in_flight
+
+    def acquire(self) -> None:
+        with self._cond:
+            while self._in_flight >= self.limit:
+                self._cond.wait()
+            self._in_flight += 1
+
+    def try_acquire(self) -> bool:
+        """Take a slot only if one is free right now."""
+
+        with self._cond:
+            if self._in_flight >= self.limit:
+                return False
+            self._in_flight += 1
+            return True
+
+    def release(self) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            self._cond.notify_all()
+
+    @contextmanager
+    def slot(self):
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def on_success(self, latency: float, output_tokens: int | None = None) -> None:
+        """Record a successful response; ``output_tokens`` (when known) normalizes its latency."""
+
+        cost = latency / max(output_tokens, _MIN_NORMALIZED_TOKENS) if output_tokens is not None else latency
+        with self._cond:
+            if self._smoothed_latency is None:
+                self._smoothed_latency = latency
+                self._smoothed_cost = cost
+            else:
+                self._smoothed_latency = 0.8 * self._smoothed_latency + 0.2 * latency
+                self._smoothed_cost = 0.8 * self._smoothed_cost + 0.2 * cost
+            self._recent_costs.append(self._smoothed_cost)
+
+            if self._smoothed_cost > min(self._recent_costs) * self._latency_tolerance:
+                self._decrease()
+            else:
+                self._limit = min(self.maximum, self._limit + 1.0 / self._limit)
+                self.peak = max(self.peak, self.limit)
+            self._cond.notify_all()
+
+    def on_overload(self) -> None:
+        with self._cond:
+            self._decrease()
+
+    def _decrease(self) -> None:
+        # Requests that were already in flight when we backed off report the same congestion;
+        # react at most once per smoothed-latency window so one burst does not collapse the limit.
+        now = time.monotonic()
+        if now - self._last_decrease < (self._smoothed_latency or 0.0):
+            return
+        self._last_decrease = now
+        self._limit = max(float(self.minimum), self._limit * self._backoff)
+
+
+class _Flight:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Collapses calls with the same key into one execution whose result is shared by every caller.
+
+    Successful results are kept for the lifetime of the object (one generation run), so identical
+    requests that arrive later are also served without another call. Failures and None results are
+    not kept, so a later caller can try again.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def do(self, key, fn):
+        """Return (result, shared) where shared is True if another caller's execution was reused."""
+
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result, True
+
+        try:
+            flight.result = fn()
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            if flight.error is not None or flight.result is None:
+                with self._lock:
+                    self._flights.pop(key, None)
+            flight.done.set()
+        return flight.result, False
+
+
+class DaemonExecutor:
+    """Runs each submitted call on a daemon thread of its own.
+
+    The interpreter joins ThreadPoolExecutor threads at exit, so a request still running there keeps a
+    finished or cancelled run alive until the request times out; a daemon thread does not. Threads only
+    exist while their call runs, and the number of calls is bounded by the caller (the run's limiter).
+    """
+
+    def __init__(self, thread_name_prefix: str):
+        self._thread_name_prefix = thread_name_prefix
+        self._lock = threading.Lock()
+        self._started = 0
+        self._shutdown = False
+
+    def submit(self, fn, *args) -> Future:
+        future = Future()
+        with self._lock:
+            if self._shutdown:
+                raise RuntimeError("cannot schedule new calls after shutdown")
+            self._started += 1
+            name = f"{self._thread_name_prefix}_{self._started}"
+
+        def run():
+            if not future.set_running_or_notify_cancel():
+                return
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
+
+        threading.Thread(target=run, name=name, daemon=True).start()
+        return future
+
+    def shutdown(self) -> None:
+        """Refuse new calls; calls still running are abandoned."""
+
+        with self._lock:
+            self._shutdown = True
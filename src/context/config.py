@@ -27,5 +27,99 @@ class Config:
     # Intended for end-to-end/integration tests.
     MockLLM = False
 
+    # Adaptive (AIMD) concurrency for LLM requests. Concurrency is the starting limit;
+    # the limiter moves between Min_Concurrency and Max_Concurrency based on provider feedback.
+    Concurrency = 4
+    Min_Concurrency = 1
+    Max_Concurrency = 16
+    # Back off once the smoothed latency exceeds this multiple of the best latency seen.
+    Latency_Tolerance = 3.0
+    # Attempts per prompt when the provider rate-limits (429) or times out.
+    Max_Retries = 3
+    Retry_Backoff_Seconds = 1.0
+
+    # Seconds before a single LLM request is abandoned, and optional wall-clock budget for the whole run.
+    Request_Timeout = 300.0
+    Deadline = None
+
+    # Hedged requests: once Hedge_Min_Samples latencies are known, a request still running after the
+    # Hedge_Percentile latency gets a duplicate; duplicates are capped at Hedge_Max_Fraction of all requests.
+    Hedge = False
+    Hedge_Percentile = 95
+    Hedge_Min_Samples = 10
+    Hedge_Max_Fraction = 0.1
+
+    # Prompt batching: small independent prompts of one prompt layer share a single request.
+    Batch_Prompts = False
+    Batch_Max_Size = 8
+    Batch_Max_Prompt_Chars = 4000
+
+    # Offline batch jobs: write rendered prompts to a batch JSONL file, or apply a batch output file.
+    Batch_Submit_Path = None
+    Batch_Collect_Path = None
+
+    # Pre-flight prompt size check. The prompt budget is Max_Prompt_Tokens if set, otherwise the model's
+    # context window minus Output_Token_Reserve. Trim_Strategy is one of: none, head, tail, drop.
+    Max_Prompt_Tokens = None
+    Output_Token_Reserve = 8192
+    Trim_Strategy = "none"
+
+    # Default size budget of a <dir:NAME>glob<dir:NAME/> import; files past the budget are left out.
+    Dir_Import_Max_Bytes = 256 * 1024
+
+    # Streaming pipeline: files are parsed while earlier ones are generated, with at most
+    # Pipeline_Queue_Size parsed files waiting. Strict mode parses everything first and stops on any error.
+    Strict = False
+    Pipeline_Queue_Size = 32
+
+    # Prompt scheduling ranks ready prompts by their longest remaining dependency chain, estimated from
+    # latencies recorded in Latency_History_Path (if set) or from prompt size.
+    Latency_History_Path = None
+
+    # --plan: print (or emit as JSON) what a run would do without calling the LLM. Output tokens of a prompt
+    # without an existing output tag are estimated as Plan_Output_Tokens.
+    Plan = None
+    Plan_Output_Tokens = 1000
+
+    # Run journal: every written prompt is appended to Journal_Path; with Resume, prompts whose latest
+    # journal entry has the same inputs are skipped.
+    Journal_Path = None
+    Default_Journal_Path = ".context_journal.jsonl"
+    Resume = False
+
+    # Lockfile: every written prompt's output is recorded in Lock_Path with the inputs and model it came
+    # from. Frozen applies the locked outputs without calling the provider and fails if any input drifted.
+    Lock_Path = None
+    Default_Lock_Path = "context.lock"
+    Frozen = False
+
+    # Job queue (--queue): every prompt is a job in a SQLite file, claimed by Queue_Workers local worker
+    # processes and by any --worker process sharing the file. A worker holds its job under a lease renewed
+    # every Queue_Heartbeat_Seconds; a job whose lease expires Queue_Max_Attempts times fails.
+    # Worker_Queue_Path runs this process as a worker only.
+    Queue_Path = None
+    Queue_Workers = 4
+    Worker_Queue_Path = None
+    Queue_Lease_Seconds = 120.0
+    Queue_Heartbeat_Seconds = 30.0
+    Queue_Max_Attempts = 3
+    Queue_Poll_Seconds = 1.0
+
+    # Sharding (--shard K/N): only the files whose dependency group hashes to shard K of N are generated,
+    # and a result manifest is written to Shard_Manifest_Path. Verify_Shard_Paths lists the manifests of
+    # every shard to check once their outputs are merged.
+    Shard = None
+    Shard_Manifest_Path = None
+    Default_Shard_Manifest_Path = "context-shard-{index}-of-{count}.json"
+    Verify_Shard_Paths = None
+
+    # Context variable index: persisted to Index_Path (if set) so later runs only rescan changed files.
+    Index_Path = None
+    Where = None
+
+    # Streaming mode: consume completions chunk by chunk and report progress every N seconds.
+    Stream = False
+    Stream_Progress_Interval = 5.0
+
     Model = "openai/gpt-5.2"
     Supported_Models = ["openai/gpt-5.2", "openai/gpt-3.5-turbo"]
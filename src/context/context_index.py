@@ -0,0 +1,144 @@
+#    Copyright 2023 Robert Mazurowski
+
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+import json
+import os
+import re
+
+from .blob_store import content_digest
+from .log import Log
+
+_INDEX_VERSION = 3
+
+
+def _normalize_value(raw: bytes) -> str:
+    # Same text a parsed <context:X> value gets, so index hashes match blob store digests.
+    return raw.decode().replace("\r\n", "\n").strip()
+
+
+class ContextIndex:
+    """Where every context variable and import declaration lives, per file.
+
+    Each entry records the file's mtime and size, the byte span and sha256 of every <context:X> value,
+    the file's <import>, <import:X>, <file:X> and <dir:X> declarations, and the names of its prompts.
+    A file is rescanned only when its mtime or size changed, so a persisted index makes later runs
+    incremental. Values are read back by seeking to their span instead of re-parsing the file.
+    """
+
+    def __init__(self, patterns, path=None):
+        self._patterns = {tag: re.compile(pattern.encode()) for tag, pattern in patterns.items()}
+        self.path = path
+        self._files = {}
+        self.scanned = 0
+        if path and os.path.exists(path):
+            self._load(path)
+
+    def _load(self, path):
+        try:
+            with open(path, encoding="utf-8") as file:
+                data = json.load(file)
+        except (OSError, ValueError) as e:
+            Log.logger.warning(f"Ignoring unreadable context index {path}: {e}")
+            return
+        if data.get("version") == _INDEX_VERSION:
+            self._files = data.get("files", {})
+
+    def save(self):
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = self.path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump({"version": _INDEX_VERSION, "files": self._files}, file)
+        os.replace(temp_path, self.path)
+
+    def entry(self, path: str) -> dict:
+        """The index entry of ``path``, rescanning the file first if it changed since it was indexed."""
+
+        key = os.path.abspath(path)
+        stat = os.stat(key)
+        entry = self._files.get(key)
+        if entry is None or entry["mtime_ns"] != stat.st_mtime_ns or entry["size"] != stat.st_size:
+            entry = self._files[key] = self._scan(key, stat)
+        return entry
+
+    def _scan(self, path, stat, content=None) -> dict:
+        Log.logger.debug(f"CONTEXT INDEX: scanning {path}")
+        self.scanned += 1
+        if content is None:
+            with open(path, "rb") as file:
+                content = file.read()
+
+        def declarations(tag):
+            return [[m.group(1).decode(), m.group(2).decode().strip()] for m in self._patterns[tag].finditer(content)]
+
+        context = {}
+        duplicates = []
+        for match in self._patterns["Context_Variables"].finditer(content):
+            name = match.group(1).decode()
+            if name in context:
+                duplicates.append(name)
+                continue
+            start, end = match.span(2)
+            context[name] = [start, end, content_digest(_normalize_value(content[start:end]))]
+
+        return {
+            "mtime_ns": stat.st_mtime_ns,
+            "size": stat.st_size,
+            "context": context,
+            "duplicates": duplicates,
+            "imports": [
+                m.group(1).decode().strip() for m in self._patterns["Import_Context_Variables"].finditer(content)
+            ],
+            "specific_imports": declarations("Import_Specific_Context_Variable"),
+            "files": declarations("Import_File_Context_Variables"),
+            "dirs": declarations("Import_Directory_Context_Variables"),
+            # <prompt:C->A> is prompt C.
+            "prompts": [m.group(1).decode().split("->")[0] for m in self._patterns["Prompts"].finditer(content)],
+        }
+
+    def read_variable(self, path: str, name: str) -> str:
+        """Read one context value by seeking to its indexed byte span."""
+
+        start, end, digest = self.entry(path)["context"][name]
+        with open(path, "rb") as file:
+            file.seek(start)
+            value = _normalize_value(file.read(end - start))
+        if content_digest(value) == digest:
+            return value
+        # The file was rewritten since it was scanned (e.g. by a prompt of this run): read it whole again.
+        key = os.path.abspath(path)
+        with open(key, "rb") as file:
+            content = file.read()
+        entry = self._files[key] = self._scan(key, os.stat(key), content)
+        start, end, _ = entry["context"][name]
+        return _normalize_value(content[start:end])
+
+    def refresh(self, file_paths) -> None:
+        """Index every file in ``file_paths`` and forget indexed files that no longer exist."""
+
+        for path in file_paths:
+            try:
+                self.entry(path)
+            except (OSError, UnicodeDecodeError) as e:
+                Log.logger.debug(f"CONTEXT INDEX: skipping {path}: {e}")
+        self._files = {key: entry for key, entry in self._files.items() if os.path.exists(key)}
+
+    def where(self, name: str) -> list[tuple[str, int, int, str]]:
+        """(file, start byte, end byte, sha256) of every indexed definition of context variable ``name``."""
+
+        return [
+            (path, *entry["context"][name]) for path, entry in sorted(self._files.items()) if name in entry["context"]
+        ]
@@ -0,0 +1,174 @@
+#    Copyright 2023 Robert Mazurowski
+
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+import csv
+import io
+import json
+import os
+import re
+
+_INTEGER_PATTERN = re.compile(r"^[+-]?\d+$")
+_FLOAT_PATTERN = re.compile(r"^[+-]?(\d+\.\d*|\.\d+|\d+)([eE][+-]?\d+)?$")
+_DATE_PATTERN = re.compile(r"^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2}(\.\d+)?)?)?")
+_BOOLEAN_VALUES = {"true", "false"}
+
+# Columns/keys tracked per file; wider files are summarized with the first ones only.
+_MAX_COLUMNS = 200
+_DELIMITERS = {".csv": ",", ".tsv": "\t"}
+_JSON_LINES_EXTENSIONS = {".jsonl", ".ndjson"}
+
+
+def _infer_value_type(value: str) -> str | None:
+    value = value.strip()
+    if not value:
+        return None
+    if _INTEGER_PATTERN.match(value):
+        return "integer"
+    if _FLOAT_PATTERN.match(value):
+        return "float"
+    if value.lower() in _BOOLEAN_VALUES:
+        return "boolean"
+    if _DATE_PATTERN.match(value):
+        return "datetime"
+    return "string"
+
+
+def _merge_types(current: str | None, new: str | None) -> str | None:
+    if new is None or current == new:
+        return current
+    if current is None:
+        return new
+    if {current, new} == {"integer", "float"}:
+        return "float"
+    return "string"
+
+
+def _json_type(value) -> str | None:
+    if value is None:
+        return None
+    if isinstance(value, bool):
+        return "boolean"
+    if isinstance(value, int):
+        return "integer"
+    if isinstance(value, float):
+        return "float"
+    if isinstance(value, str):
+        return _infer_value_type(value) or "string"
+    return "array" if isinstance(value, list) else "object"
+
+
+class _ColumnStats:
+    def __init__(self):
+        self.type = None
+        self.empty = 0
+
+    def describe(self, name: str) -> str:
+        text = f"- {name}: {self.type or 'empty'}"
+        if self.empty:
+            text += f" ({self.empty} empty)"
+        return text
+
+
+def summarize_data_file(path: str, sample_rows: int = 5) -> str:
+    """Stream a CSV/TSV/JSONL file once and describe it compactly for a prompt.
+
+    The summary holds the row count, the inferred type of each column (integer, float, boolean,
+    datetime, string) and the first ``sample_rows`` rows. Memory use does not depend on the file size.
+    """
+
+    extension = os.path.splitext(path)[1].lower()
+    if extension in _JSON_LINES_EXTENSIONS:
+        return _summarize_json_lines(path, sample_rows)
+    if extension in _DELIMITERS:
+        return _summarize_delimited(path, _DELIMITERS[extension], sample_rows)
+    raise ValueError(f"SCHEMA import supports .csv, .tsv, .jsonl and .ndjson files, got '{path}'.")
+
+
+def _summarize_delimited(path: str, delimiter: str, sample_rows: int) -> str:
+    with open(path, newline="", encoding="utf-8") as file:
+        reader = csv.reader(file, delimiter=delimiter)
+        header = next(reader, None)
+        if header is None:
+            return f"FORMAT: {os.path.splitext(path)[1][1:]}\nROWS: 0\n"
+
+        columns = [_ColumnStats() for _ in header[:_MAX_COLUMNS]]
+        sample = []
+        rows = 0
+        for row in reader:
+            rows += 1
+            if len(sample) < sample_rows:
+                sample.append(row)
+            for index, stats in enumerate(columns):
+                # Short rows count their missing trailing cells as empty.
+                value_type = _infer_value_type(row[index]) if index < len(row) else None
+                if value_type is None:
+                    stats.empty += 1
+                stats.type = _merge_types(stats.type, value_type)
+
+    sample_text = io.StringIO()
+    writer = csv.writer(sample_text, delimiter=delimiter, lineterminator="\n")
+    writer.writerow(header)
+    writer.writerows(sample)
+
+    lines = [f"FORMAT: {os.path.splitext(path)[1][1:]}", f"ROWS: {rows}", f"COLUMNS ({len(header)}):"]
+    lines += [stats.describe(name) for name, stats in zip(header, columns, strict=False)]
+    if len(header) > _MAX_COLUMNS:
+        lines.append(f"- ... {len(header) - _MAX_COLUMNS} more columns")
+    lines.append(f"SAMPLE (first {len(sample)} rows):")
+    return "\n".join(lines) + "\n" + sample_text.getvalue()
+
+
+def _summarize_json_lines(path: str, sample_rows: int) -> str:
+    keys = {}
+    sample = []
+    rows = 0
+    malformed = 0
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            if not line.strip():
+                continue
+            # A truncated or hand-edited line should not lose the summary of the rest of the file.
+            try:
+                record = json.loads(line)
+            except ValueError:
+                malformed += 1
+                continue
+            rows += 1
+            if len(sample) < sample_rows:
+                sample.append(line.rstrip("\n"))
+            if not isinstance(record, dict):
+                continue
+            for key, value in record.items():
+                stats = keys.get(key)
+                if stats is None:
+                    if len(keys) >= _MAX_COLUMNS:
+                        continue
+                    # Keys first seen late were missing (empty) in every earlier row.
+                    stats = keys[key] = _ColumnStats()
+                    stats.empty = rows - 1
+                value_type = _json_type(value)
+                if value_type is None:
+                    stats.empty += 1
+                stats.type = _merge_types(stats.type, value_type)
+            for key, stats in keys.items():
+                if key not in record:
+                    stats.empty += 1
+
+    lines = [f"FORMAT: {os.path.splitext(path)[1][1:]}", f"ROWS: {rows}"]
+    if malformed:
+        lines.append(f"MALFORMED LINES (skipped): {malformed}")
+    lines.append(f"KEYS ({len(keys)}):")
+    lines += [stats.describe(name) for name, stats in keys.items()]
+    lines.append(f"SAMPLE (first {len(sample)} rows):")
+    lines += sample
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,185 @@
+#    Copyright 2023 Robert Mazurowski
+
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+"""Reading the contents of <file:NAME>path | MODIFIER args<file:NAME/> imports.
+
+Without a modifier the whole file is imported. Modifiers:
+    HEAD n          the first n lines
+    TAIL n          the last n lines, read backwards from the end of the file
+    MID start end   lines start..end (1-based, inclusive)
+    SCHEMA [rows]   compact summary of a CSV/TSV/JSONL file: row count, column types and a head sample
+
+HEAD and MID stop reading once the requested lines are collected and TAIL only reads the blocks it needs,
+so slicing a large log costs the size of the slice rather than the size of the file.
+
+<dir:NAME>glob | MAX_BYTES n<dir:NAME/> (or MAX_TOKENS n) concatenates every file matching a recursive glob,
+in sorted order and each under a header line, until the budget (Config.Dir_Import_Max_Bytes by default) is used.
+"""
+
+import itertools
+import os
+
+from .config import Config
+from .data_summary import summarize_data_file
+from .file_manager import glob_file_paths
+from .token_budget import chars_per_token
+
+_DEFAULT_SAMPLE_ROWS = 5
+_TAIL_BLOCK_SIZE = 64 * 1024
+MODIFIERS = ("HEAD", "TAIL", "MID", "SCHEMA")
+
+
+def parse_file_import(spec: str) -> tuple[str, str | None, list[int]]:
+    """Split an import body into (path, MODIFIER or None, integer arguments)."""
+
+    path, separator, modifier_text = spec.partition("|")
+    path = path.strip()
+    if not separator:
+        return path, None, []
+
+    words = modifier_text.split()
+    if not words:
+        raise ValueError(f"File import '{spec.strip()}' has an empty modifier after '|'.")
+    modifier = words[0].upper()
+    try:
+        arguments = [int(word) for word in words[1:]]
+    except ValueError:
+        raise ValueError(f"File import modifier '{modifier_text.strip()}' expects integer arguments.") from None
+    if any(argument < 0 for argument in arguments):
+        raise ValueError(f"File import modifier '{modifier_text.strip()}' expects non-negative arguments.")
+    return path, modifier, arguments
+
+
+def read_head(path: str, count: int) -> str:
+    with open(path) as file:
+        return "".join(itertools.islice(file, count))
+
+
+def read_lines(path: str, start: int, end: int) -> str:
+    with open(path) as file:
+        return "".join(itertools.islice(file, start - 1, end))
+
+
+def read_tail(path: str, count: int) -> str:
+    if count == 0:
+        return ""
+    with open(path, "rb") as file:
+        position = file.seek(0, os.SEEK_END)
+        data = b""
+        # One extra newline is needed to find the start of the first kept line; a trailing newline
+        # terminates the last line rather than starting a new one.
+        while position > 0 and data.count(b"\n") <= count:
+            step = min(_TAIL_BLOCK_SIZE, position)
+            position -= step
+            file.seek(position)
+            data = file.read(step) + data
+
+    lines = data.splitlines(keepends=True)
+    if position > 0:
+        # The first line may have been cut by the block boundary; enough complete lines follow it.
+        lines = lines[1:]
+    return b"".join(lines[-count:]).decode().replace("\r\n", "\n")
+
+
+def _expect_arguments(modifier: str, arguments: list[int], usage: str, minimum: int, maximum: int) -> None:
+    if not minimum <= len(arguments) <= maximum:
+        raise ValueError(f"{modifier} expects {usage}, got {len(arguments)} arguments.")
+
+
+def check_file_import(spec: str) -> tuple[str, str | None, list[int]]:
+    """parse_file_import, also checking the modifier name and its arguments; nothing is read."""
+
+    path, modifier, arguments = parse_file_import(spec)
+    if modifier in ("HEAD", "TAIL"):
+        _expect_arguments(modifier, arguments, "one argument: the number of lines", 1, 1)
+    elif modifier == "MID":
+        _expect_arguments(modifier, arguments, "two arguments: the first and last line", 2, 2)
+        start, end = arguments
+        if start < 1 or end < start:
+            raise ValueError(f"MID expects 1 <= start <= end, got {start} {end}.")
+    elif modifier == "SCHEMA":
+        _expect_arguments(modifier, arguments, "at most one argument: the number of sample rows", 0, 1)
+    elif modifier is not None:
+        raise ValueError(f"Unknown file import modifier '{modifier}'. Supported modifiers are: {', '.join(MODIFIERS)}.")
+    return path, modifier, arguments
+
+
+def read_file_import(spec: str) -> str:
+    path, modifier, arguments = check_file_import(spec)
+    if modifier is None:
+        with open(path) as file:
+            return file.read()
+    if modifier == "HEAD":
+        return read_head(path, arguments[0])
+    if modifier == "TAIL":
+        return read_tail(path, arguments[0])
+    if modifier == "MID":
+        return read_lines(path, *arguments)
+    return summarize_data_file(path, arguments[0] if arguments else _DEFAULT_SAMPLE_ROWS)
+
+
+def import_paths(spec: str, directory: bool = False) -> tuple[str, ...]:
+    """Absolute paths of the files a <file:> (or, with ``directory``, <dir:>) import reads; () if it is invalid."""
+
+    try:
+        if directory:
+            return tuple(os.path.abspath(path) for path in glob_file_paths(parse_dir_import(spec)[0]))
+        return (os.path.abspath(check_file_import(spec)[0]),)
+    except ValueError:
+        return ()
+
+
+def parse_dir_import(spec: str) -> tuple[str, int]:
+    """Split a <dir:> import body into (glob pattern, byte budget)."""
+
+    pattern, modifier, arguments = parse_file_import(spec)
+    if not pattern:
+        raise ValueError("Directory import needs a glob pattern, e.g. src/api/**/*.py.")
+    if modifier is None:
+        return pattern, Config.Dir_Import_Max_Bytes
+    if modifier in ("MAX_BYTES", "MAX_TOKENS"):
+        _expect_arguments(modifier, arguments, "one argument: the budget", 1, 1)
+        if modifier == "MAX_BYTES":
+            return pattern, arguments[0]
+        return pattern, int(arguments[0] * chars_per_token(Config.Model))
+    raise ValueError(f"Unknown directory import modifier '{modifier}'. Supported modifiers are: MAX_BYTES, MAX_TOKENS.")
+
+
+def read_dir_import(spec: str) -> str:
+    pattern, budget = parse_dir_import(spec)
+    file_paths = glob_file_paths(pattern)
+    if not file_paths:
+        raise ValueError(f"Directory import '{pattern}' does not match any files.")
+
+    parts = []
+    remaining = budget
+    for index, file_path in enumerate(file_paths):
+        header = f"# File: {file_path}\n"
+        if len(header) > remaining:
+            parts.append(f"[... {len(file_paths) - index} more files omitted: budget of {budget} bytes reached ...]\n")
+            break
+        remaining -= len(header)
+        with open(file_path, "rb") as file:
+            # Read one byte past the budget to know whether the file had to be cut.
+            data = file.read(remaining + 1)
+        truncated = len(data) > remaining
+        data = data[:remaining]
+        remaining -= len(data)
+
+        text = data.decode("utf-8", errors="replace")
+        parts.append(header + text + ("" if text.endswith("\n") else "\n"))
+        if truncated:
+            omitted = len(file_paths) - index - 1
+            parts.append(f"[... truncated; {omitted} more files omitted: budget of {budget} bytes reached ...]\n")
+            break
+    return "".join(parts)
@@ -12,26 +12,53 @@
 #    See the License for the specific language governing permissions and
 #    limitations under the License.
 
+import glob
 import os
+import shutil
+import threading
 
 from gitignore_parser import parse_gitignore
 
-ignore_list = ["Context_Logs"]
+from .config import Config
 
+# Names never discovered as input: the log directory and the files a run keeps its own state in.
+ignore_list = ["Context_Logs", Config.Default_Journal_Path, Config.Default_Lock_Path]
 
-def get_file_paths(directory):
-    file_paths = []
+# Suffix of the temporary files write_file_atomically renames over their target; never discovered as input.
+TEMP_SUFFIX = ".context-tmp"
+
+
+def ignore_paths(*paths):
+    """Add the file names of ``paths`` (None entries are skipped) to ignore_list."""
+
+    for path in paths:
+        if path and os.path.basename(path) not in ignore_list:
+            ignore_list.append(os.path.basename(path))
 
+
+def _gitignore_matcher(directory):
     # Construct the path to the .gitignore file
     gitignore_path = os.path.join(directory, ".gitignore")
 
     # Check if .gitignore exists in the directory and parse it
     if os.path.exists(gitignore_path):
-        matches = parse_gitignore(gitignore_path)
-    else:
-        # If no .gitignore, default to not matching any files.
-        def matches(_: str) -> bool:
-            return False
+        return parse_gitignore(gitignore_path)
+
+    # If no .gitignore, default to not matching any files.
+    def matches(_: str) -> bool:
+        return False
+
+    return matches
+
+
+def get_file_paths(directory):
+    return list(iter_file_paths(directory))
+
+
+def iter_file_paths(directory):
+    """Yield file paths under ``directory`` as they are discovered (see get_file_paths)."""
+
+    matches = _gitignore_matcher(directory)
 
     # Traverse the directory recursively
     for root, directories, files in os.walk(directory):
@@ -42,7 +69,44 @@ def get_file_paths(directory):
             file_path = os.path.join(root, file)
 
             # Ignore files based on ignore_list and .gitignore rules
+            if file.endswith(TEMP_SUFFIX):
+                continue
             if os.path.basename(file_path) not in ignore_list and not matches(file_path):
-                file_paths.append(file_path)
+                yield file_path
+
 
+def glob_file_paths(pattern, root="."):
+    """Files matching a recursive glob, sorted, minus ignore_list entries and root's .gitignore rules."""
+
+    matches = _gitignore_matcher(root)
+    root_prefix = os.path.join(os.path.abspath(root), "")
+    file_paths = []
+    for file_path in sorted(glob.glob(pattern, recursive=True)):
+        if not os.path.isfile(file_path):
+            continue
+        parts = os.path.normpath(file_path).split(os.sep)
+        absolute_path = os.path.abspath(file_path)
+        # .gitignore rules only apply below the directory that holds the .gitignore.
+        ignored = absolute_path.startswith(root_prefix) and matches(absolute_path)
+        if ignored or any(part in ignore_list for part in parts):
+            continue
+        file_paths.append(file_path)
     return file_paths
+
+
+def write_file_atomically(path, text):
+    """Replace ``path`` with ``text`` through a temporary file, so readers see the old or new file, never a part."""
+
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}{TEMP_SUFFIX}"
+    try:
+        with open(temp_path, "w") as file:
+            file.write(text)
+        try:
+            shutil.copymode(path, temp_path)
+        except OSError:
+            pass
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.unlink(temp_path)
+        raise
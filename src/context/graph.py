@@ -12,19 +12,94 @@
 #    See the License for the specific language governing permissions and
 #    limitations under the License.
 
+import threading
+import time
+from collections import deque
+from collections.abc import Callable
+from concurrent.futures import FIRST_COMPLETED, CancelledError, wait
+from contextlib import closing, contextmanager
 from typing import TypedDict
 
 from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
 from langchain_openai import ChatOpenAI
 from langgraph.graph import END, START, StateGraph
 
+from .concurrency import DaemonExecutor
 from .config import Config
+from .log import Log
+from .run_state import percentile
 
 
-class GraphState(TypedDict):
+class GraphState(TypedDict, total=False):
     prompt: str
     prompt_name: str
     response: str
+    # Optional system message override (batched requests); defaults to system_message(prompt_name).
+    system: str
+    # Streaming mode only: {"ttft": seconds, "tokens": chunk count, "duration": seconds}.
+    stream_metrics: dict
+    # Streaming mode only: returns True once the run is cancelled; checked between chunks.
+    cancelled: Callable[[], bool]
+
+
+# Metrics of the last completion, per calling thread (see pop_call_metrics).
+_last_call_metrics = threading.local()
+
+
+# RunState of the request being made by this thread, if any (see run_scope).
+_call_run = threading.local()
+
+
+@contextmanager
+def run_scope(run):
+    """Make the requests this thread sends part of ``run`` (a run_state.RunState).
+
+    Hedged requests run on the run's hedge pool and their duplicates take a slot of its concurrency
+    limiter too; a streamed completion stops at its next chunk once the run is cancelled.
+    """
+
+    _call_run.value = run
+    try:
+        yield
+    finally:
+        _call_run.value = None
+
+
+class _HedgeTracker:
+    """Latency history and hedge spend shared by every request made by this process."""
+
+    def __init__(self, window: int = 200):
+        self._lock = threading.Lock()
+        self._latencies = deque(maxlen=window)
+        self.requests = 0
+        self.hedges = 0
+
+    def record_latency(self, latency: float) -> None:
+        with self._lock:
+            self._latencies.append(latency)
+
+    def count_request(self) -> None:
+        with self._lock:
+            self.requests += 1
+
+    def hedge_delay(self):
+        """Seconds to wait before hedging, or None until enough latencies have been observed."""
+
+        with self._lock:
+            if len(self._latencies) < Config.Hedge_Min_Samples:
+                return None
+            return percentile(list(self._latencies), Config.Hedge_Percentile)
+
+    def try_reserve_hedge(self) -> bool:
+        # Cap the extra spend: duplicates may not exceed Hedge_Max_Fraction of all requests.
+        with self._lock:
+            if self.hedges + 1 > Config.Hedge_Max_Fraction * self.requests:
+                return False
+            self.hedges += 1
+            return True
+
+
+_hedge_tracker = _HedgeTracker()
 
 
 PROMPTS = {
@@ -44,27 +119,106 @@ Follow these specific guidelines:
 - Return the whole modified code if no specific tags guide the insertion or modification point.
 
 Remember, your goal is to assist in generating accurate, efficient code based on the provided instructions and context.
-"""
+""",
+    "Batch": """
+You are a Coding Assistant. Your main role is to generate code based on user commands and context information.
+
+You will receive several independent code generation tasks at once, as a JSON object that maps each
+task name to its instructions and context. Solve every task on its own; tasks do not share state.
+Any GLOBAL_CONTEXT given after the tasks applies to all of them.
+
+Reply with a single JSON object and nothing else: the keys are exactly the task names and each value
+is a string containing only the generated code for that task.
+""",
 }
 
 
+def system_message(prompt_name: str) -> str:
+    return PROMPTS["System"].replace("<<<TAGNAME>>>", prompt_name)
+
+
+def batch_system_message() -> str:
+    """The batch format, followed by the guidelines a prompt sent on its own gets, for every task."""
+
+    guidelines = PROMPTS["System"].replace("<<<TAGNAME>>>", "<<<TASKNAME>>>")
+    return f"{PROMPTS['Batch']}\nFor every task, where TASKNAME is the task's name:\n{guidelines}"
+
+
 def _call_openrouter(state: GraphState) -> GraphState:
     # OpenRouter is OpenAI-compatible; use the LangChain OpenAI integration and point it at OpenRouter.
     llm = ChatOpenAI(
         api_key=Config.Api_Key,
         model=Config.Model,
         base_url="https://openrouter.ai/api/v1",
+        timeout=Config.Request_Timeout,
     )
 
     messages = [
-        SystemMessage(content=PROMPTS["System"].replace("<<<TAGNAME>>>", state["prompt_name"])),
+        SystemMessage(content=state.get("system") or system_message(state["prompt_name"])),
         HumanMessage(content=state["prompt"]),
     ]
+    if Config.Stream:
+        content, metrics = _stream_completion(llm, messages, state["prompt_name"], state.get("cancelled"))
+        return {**state, "response": content, "stream_metrics": metrics}
+
     response = llm.invoke(messages)
     content = response.content if isinstance(response, AIMessage) else str(response)
     return {**state, "response": content}
 
 
+def _stream_completion(llm, messages, prompt_name: str, cancelled=None) -> tuple[str, dict]:
+    """Consume the completion chunk by chunk, logging progress while it arrives.
+
+    Nothing is written to disk here; the caller only sees the text once the stream has ended.
+    OpenAI-compatible providers send roughly one token per chunk, so chunks are counted as tokens.
+    The client's timeout only bounds each read, so the whole stream is bounded by Config.Request_Timeout
+    here (TimeoutError), and it is closed with CancelledError once ``cancelled()`` returns True.
+    """
+
+    started = time.monotonic()
+    last_report = started
+    first_token_at = None
+    parts = []
+
+    with closing(llm.stream(messages)) as stream:
+        for chunk in stream:
+            now = time.monotonic()
+            if cancelled is not None and cancelled():
+                raise CancelledError(f"{prompt_name}: the run was cancelled while streaming")
+            if now - started > Config.Request_Timeout:
+                raise TimeoutError(f"{prompt_name}: streaming took longer than {Config.Request_Timeout}s")
+            content = chunk.content if isinstance(chunk.content, str) else str(chunk.content)
+            if not content:
+                continue
+            if first_token_at is None:
+                first_token_at = now
+                Log.logger.info(f"{prompt_name}: first token after {now - started:.2f}s")
+            parts.append(content)
+            if now - last_report >= Config.Stream_Progress_Interval:
+                last_report = now
+                rate = len(parts) / max(now - first_token_at, 1e-6)
+                Log.logger.info(f"{prompt_name}: streaming, {len(parts)} tokens so far ({rate:.1f} tok/s)")
+
+    finished = time.monotonic()
+    metrics = {
+        "ttft": (first_token_at or finished) - started,
+        "tokens": len(parts),
+        "duration": finished - started,
+    }
+    return "".join(parts), metrics
+
+
+def pop_call_metrics() -> dict | None:
+    """Return (and clear) the metrics of the last run_generation_graph call made by this thread.
+
+    Keys: "stream" (streaming metrics or None), "hedged" and "hedge_won".
+    """
+
+    metrics = getattr(_last_call_metrics, "value", None)
+    _last_call_metrics.value = None
+    return metrics
+
+
 def build_graph():
     graph_builder = StateGraph(GraphState)
     graph_builder.add_node("openrouter_call", _call_openrouter)
@@ -73,7 +227,89 @@ def build_graph():
     return graph_builder.compile()
 
 
-def run_generation_graph(prompt: str, prompt_name: str) -> str:
-    graph = build_graph()
-    result = graph.invoke({"prompt": prompt, "prompt_name": prompt_name, "response": ""})
+def _invoke_graph(state: GraphState) -> tuple[GraphState, float]:
+    started = time.monotonic()
+    result = build_graph().invoke(state)
+    return result, time.monotonic() - started
+
+
+def _invoke_hedged(state: GraphState) -> tuple[GraphState, float, bool, bool]:
+    """Send a duplicate request if the first one is slower than the configured latency percentile.
+
+    The first successful response wins, and the losing request is cancelled: a streamed one stops at
+    its next chunk, a plain one cannot be interrupted mid-flight and is abandoned on its daemon thread.
+    Both run on the hedge pool of the caller's run (see run_scope). The duplicate holds a slot of the
+    run's concurrency limiter and is not sent when none is free, so hedging never adds load the
+    limiter cannot see.
+    """
+
+    _hedge_tracker.count_request()
+    delay = _hedge_tracker.hedge_delay()
+    if delay is None:
+        return (*_invoke_graph(state), False, False)
+
+    run = getattr(_call_run, "value", None)
+    limiter = run.limiter if run is not None else None
+    pool = run.hedge_pool() if run is not None else DaemonExecutor(thread_name_prefix="context-hedge")
+    primary, primary_lost = _submit_cancellable(pool, state)
+    done, _ = wait([primary], timeout=delay)
+    if done or (limiter is not None and not limiter.try_acquire()):
+        return (*primary.result(), False, False)
+    if not _hedge_tracker.try_reserve_hedge():
+        if limiter is not None:
+            limiter.release()
+        return (*primary.result(), False, False)
+
+    Log.logger.info(
+        f"{state['prompt_name']}: no response after {delay:.2f}s (p{Config.Hedge_Percentile}); sending a hedged request"
+    )
+    hedge, hedge_lost = _submit_cancellable(pool, state)
+    if limiter is not None:
+        # Held until the duplicate finishes, even when the primary wins first.
+        hedge.add_done_callback(lambda _: limiter.release())
+    lost = {primary: primary_lost, hedge: hedge_lost}
+    pending = {primary, hedge}
+    error = None
+    while pending:
+        done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                for other in pending:
+                    other.cancel()
+                    lost[other].set()
+                result, latency = future.result()
+                return result, latency, True, future is hedge
+            error = future.exception()
+    raise error
+
+
+def _submit_cancellable(pool, state):
+    """Submit one copy of the request; setting the returned event stops it like cancelling its run."""
+
+    lost = threading.Event()
+    run_cancelled = state.get("cancelled")
+    state = {**state, "cancelled": lambda: lost.is_set() or (run_cancelled is not None and run_cancelled())}
+    return pool.submit(_invoke_graph, state), lost
+
+
+def run_generation_graph(prompt: str, prompt_name: str, system: str | None = None) -> str:
+    state = {"prompt": prompt, "prompt_name": prompt_name, "response": ""}
+    if system is not None:
+        state["system"] = system
+    run = getattr(_call_run, "value", None)
+    if run is not None:
+        # Passed in the state because langgraph may run nodes on its own worker threads.
+        state["cancelled"] = run.is_cancelled
+    if Config.Hedge:
+        result, latency, hedged, hedge_won = _invoke_hedged(state)
+    else:
+        (result, latency), hedged, hedge_won = _invoke_graph(state), False, False
+    _hedge_tracker.record_latency(latency)
+
+    # Stored here (not in the node) because langgraph may run nodes on its own worker threads.
+    _last_call_metrics.value = {
+        "stream": result.get("stream_metrics"),
+        "hedged": hedged,
+        "hedge_won": hedge_won,
+    }
     return result["response"]
@@ -0,0 +1,112 @@
+#    Copyright 2023 Robert Mazurowski
+
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+import functools
+import os
+
+from .context_index import ContextIndex
+from .file_imports import import_paths, read_dir_import, read_file_import
+from .lazy_context import LazyValue
+
+
+class ImportCycleError(ValueError):
+    """Raised when context imports between files contain a cycle.
+
+    A file's exported context includes everything it imports, so a cycle has no well-defined
+    result; we fail fast while parsing, like PromptDependencyCycleError does for prompts.
+
+    Attributes:
+        filepath: File whose import started the cycle.
+        cycle: Files on the cycle, in import order, starting and ending with the same file.
+    """
+
+    def __init__(self, message: str, filepath: str | None = None, cycle: list[str] | None = None):
+        super().__init__(message)
+        self.filepath = filepath
+        self.cycle = cycle or []
+
+
+class ImportGraph:
+    """Context exported by files reached through <import> tags, resolved transitively.
+
+    A file exports its own <context:X> blocks plus everything it declares through <import>,
+    <import:X>, <file:X> and <dir:X>. Exports are computed once per file and shared by every importer
+    in the run. Declarations come from the ContextIndex, so an unchanged file is not re-parsed, and every
+    value stays lazy until a prompt uses it; each one is loaded at most once.
+    """
+
+    def __init__(self, patterns, index=None):
+        self.index = index or ContextIndex(patterns)
+        self._exports = {}
+        self._visiting = []
+
+    def exports(self, path: str) -> dict:
+        """{name: str or LazyValue} for every context variable visible to importers of ``path``."""
+
+        key = os.path.abspath(path)
+        if key in self._exports:
+            return self._exports[key]
+        if key in self._visiting:
+            cycle = [os.path.relpath(p) for p in self._visiting[self._visiting.index(key) :]] + [os.path.relpath(key)]
+            raise ImportCycleError(
+                f"Context import cycle detected: {' -> '.join(cycle)}.",
+                filepath=os.path.relpath(self._visiting[0]),
+                cycle=cycle,
+            )
+
+        self._visiting.append(key)
+        try:
+            exports = self._collect(path)
+        finally:
+            self._visiting.pop()
+        self._exports[key] = exports
+        return exports
+
+    def _collect(self, path: str) -> dict:
+        entry = self.index.entry(path)
+        exports = {}
+
+        def declare(name, value):
+            if name in exports:
+                raise ValueError(f"Context variable '{name}' is declared more than once in scope of '{path}'.")
+            exports[name] = value
+
+        # Same precedence as a parsed file: imports first, then the file's own declarations.
+        for import_path in entry["imports"]:
+            for name, value in self.exports(import_path).items():
+                declare(name, value)
+        for name, import_path in entry["specific_imports"]:
+            declare(name, self.lookup(import_path, name))
+        for name, spec in entry["files"]:
+            declare(name, _shared_lazy(read_file_import, spec, f"<file:{name}> {spec}", import_paths(spec)))
+        for name, spec in entry["dirs"]:
+            declare(name, _shared_lazy(read_dir_import, spec, f"<dir:{name}> {spec}", import_paths(spec, True)))
+        for name, (_, _, digest) in entry["context"].items():
+            loader = functools.cache(functools.partial(self.index.read_variable, path, name))
+            declare(name, LazyValue(loader, path, digest))
+        if entry["duplicates"]:
+            raise ValueError(
+                f"Context variable '{entry['duplicates'][0]}' is declared more than once in scope of '{path}'."
+            )
+        return exports
+
+    def lookup(self, path: str, name: str):
+        exports = self.exports(path)
+        if name not in exports:
+            raise ValueError(f"Context variable '{name}' does not exists in '{path}'.")
+        return exports[name]
+
+
+def _shared_lazy(reader, spec, description, paths):
+    # One cached loader per declaration, so every importer shares a single read.
+    return LazyValue(functools.cache(functools.partial(reader, spec)), description, paths=paths)
@@ -0,0 +1,248 @@
+#    Copyright 2023 Robert Mazurowski
+
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+import os
+import sqlite3
+import threading
+import time
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    file TEXT NOT NULL,
+    prompt TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    rank REAL NOT NULL,
+    state TEXT NOT NULL DEFAULT 'pending',
+    waiting INTEGER NOT NULL,
+    worker TEXT,
+    lease_until REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT
+);
+CREATE TABLE IF NOT EXISTS dependencies (
+    job TEXT NOT NULL,
+    dependency TEXT NOT NULL,
+    PRIMARY KEY (job, dependency)
+);
+CREATE INDEX IF NOT EXISTS jobs_ready ON jobs (state, waiting, rank);
+CREATE INDEX IF NOT EXISTS dependents ON dependencies (dependency);
+"""
+
+
+class JobQueue:
+    """SQLite-backed queue of prompt jobs shared by worker processes, on one machine or a shared filesystem.
+
+    Each job is one prompt, named "path::Prompt" with paths relative to the queue's directory. A job
+    can be claimed once every job it depends on is finished; workers take the claimable job with the
+    highest rank (longest remaining chain) and hold it under a lease that they extend with heartbeats.
+    A job whose lease expires (its worker died) is claimed again, up to ``max_attempts`` times.
+    Results stay in the queue until the coordinator writes them to the files, so every file has a
+    single writer. A failed job fails the jobs depending on it; a skipped one (e.g. a prompt over its
+    token budget) lets them run against the file's current contents, as generate_code does.
+
+    Claims run in IMMEDIATE transactions, so two workers never hold the same job. The rollback journal
+    is used rather than WAL, which needs shared memory and does not work across machines.
+    """
+
+    def __init__(self, path: str, lease_seconds: float = 120.0, max_attempts: int = 3):
+        self.path = path
+        self._base = os.path.dirname(os.path.abspath(path))
+        self.lease_seconds = lease_seconds
+        self.max_attempts = max_attempts
+        self._local = threading.local()
+        self._connection().executescript(_SCHEMA)
+
+    def name(self, key) -> str:
+        """The "path::Prompt" name of prompt ``key`` (an ast.prompt_key) in this queue."""
+
+        path, prompt_name = key
+        return f"{os.path.relpath(path, self._base).replace(os.sep, '/')}::{prompt_name}"
+
+    def key(self, name: str):
+        """The ast.prompt_key of job ``name``."""
+
+        path, prompt_name = name.rsplit("::", 1)
+        return os.path.normpath(os.path.join(self._base, path)), prompt_name
+
+    def _connection(self):
+        # sqlite3 connections may not be shared between threads (heartbeats run on their own thread).
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=60, isolation_level=None)
+            self._local.connection = connection
+        return connection
+
+    def _transaction(self):
+        return _Transaction(self._connection())
+
+    def close(self) -> None:
+        connection = getattr(self._local, "connection", None)
+        if connection is not None:
+            connection.close()
+            self._local.connection = None
+
+    def reset(self, jobs) -> None:
+        """Replace the queue's contents with ``jobs``: (prompt key, rank, keys of the prompts it waits for).
+
+        Dependencies on prompts that are not jobs do not wait.
+        """
+
+        with self._transaction() as db:
+            db.execute("DELETE FROM jobs")
+            db.execute("DELETE FROM dependencies")
+            names = {self.name(key) for key, _, _ in jobs}
+            for seq, (key, rank, dependencies) in enumerate(jobs):
+                name = self.name(key)
+                waits = sorted({self.name(dependency) for dependency in dependencies} & names - {name})
+                db.execute(
+                    "INSERT INTO jobs (id, file, prompt, seq, rank, waiting) VALUES (?, ?, ?, ?, ?, ?)",
+                    (name, name.rsplit("::", 1)[0], key[1], seq, rank, len(waits)),
+                )
+                db.executemany(
+                    "INSERT INTO dependencies (job, dependency) VALUES (?, ?)", [(name, wait) for wait in waits]
+                )
+
+    def claim(self, worker: str):
+        """Lease the claimable job with the highest rank to ``worker``.
+
+        Returns (prompt key, keys of the prompts it waits for), or None when no job can be claimed now.
+        """
+
+        now = time.time()
+        with self._transaction() as db:
+            expired = db.execute(
+                "SELECT id FROM jobs WHERE state = 'leased' AND lease_until < ? AND attempts >= ?",
+                (now, self.max_attempts),
+            ).fetchall()
+            for (name,) in expired:
+                self._fail(db, name, f"its lease expired {self.max_attempts} times")
+
+            row = db.execute(
+                "SELECT id FROM jobs "
+                "WHERE waiting = 0 AND (state = 'pending' OR (state = 'leased' AND lease_until < ?)) "
+                "ORDER BY rank DESC, seq LIMIT 1",
+                (now,),
+            ).fetchone()
+            if row is None:
+                return None
+            (name,) = row
+            db.execute(
+                "UPDATE jobs SET state = 'leased', worker = ?, lease_until = ?, attempts = attempts + 1 WHERE id = ?",
+                (worker, now + self.lease_seconds, name),
+            )
+            dependencies = db.execute("SELECT dependency FROM dependencies WHERE job = ?", (name,)).fetchall()
+        return self.key(name), [self.key(dependency) for (dependency,) in dependencies]
+
+    def heartbeat(self, key, worker: str) -> bool:
+        """Extend the lease of ``worker`` on the job; False when the job is no longer leased to it."""
+
+        with self._transaction() as db:
+            cursor = db.execute(
+                "UPDATE jobs SET lease_until = ? WHERE id = ? AND worker = ? AND state = 'leased'",
+                (time.time() + self.lease_seconds, self.name(key), worker),
+            )
+            return cursor.rowcount == 1
+
+    def complete(self, key, worker: str, result: str) -> bool:
+        """Store the job's generated code and release its dependents; False when ``worker`` lost the lease."""
+
+        return self._finish(key, worker, "done", result, None)
+
+    def skip(self, key, worker: str, reason: str) -> bool:
+        """Finish the job without a result and release its dependents; False when ``worker`` lost the lease."""
+
+        return self._finish(key, worker, "skipped", None, reason)
+
+    def fail(self, key, worker: str, error: str) -> bool:
+        """Fail the job and every job depending on it; False when ``worker`` lost the lease."""
+
+        with self._transaction() as db:
+            if not self._owns(db, key, worker):
+                return False
+            self._fail(db, self.name(key), error)
+            return True
+
+    def _owns(self, db, key, worker):
+        row = db.execute(
+            "SELECT 1 FROM jobs WHERE id = ? AND worker = ? AND state = 'leased'", (self.name(key), worker)
+        ).fetchone()
+        return row is not None
+
+    def _finish(self, key, worker, state, result, error):
+        name = self.name(key)
+        with self._transaction() as db:
+            if not self._owns(db, key, worker):
+                return False
+            db.execute(
+                "UPDATE jobs SET state = ?, result = ?, error = ?, lease_until = NULL WHERE id = ?",
+                (state, result, error, name),
+            )
+            db.execute(
+                "UPDATE jobs SET waiting = waiting - 1 WHERE id IN (SELECT job FROM dependencies WHERE dependency = ?)",
+                (name,),
+            )
+            return True
+
+    def _fail(self, db, name, error):
+        failed = [(name, error)]
+        while failed:
+            name, error = failed.pop()
+            db.execute("UPDATE jobs SET state = 'failed', error = ?, lease_until = NULL WHERE id = ?", (error, name))
+            dependents = db.execute(
+                "SELECT job FROM dependencies JOIN jobs ON jobs.id = dependencies.job "
+                "WHERE dependency = ? AND state = 'pending'",
+                (name,),
+            ).fetchall()
+            failed += [(dependent, f"it depends on {name}, which failed") for (dependent,) in dependents]
+
+    def results(self, keys) -> dict:
+        """{prompt key: generated code} of the given jobs that are done."""
+
+        results = {}
+        for key in keys:
+            state, result, _ = self.outcome(key)
+            if state == "done":
+                results[key] = result
+        return results
+
+    def outcome(self, key) -> tuple:
+        """(state, generated code, error) of a job; state is pending, leased, done, skipped, failed or missing."""
+
+        row = (
+            self._connection()
+            .execute("SELECT state, result, error FROM jobs WHERE id = ?", (self.name(key),))
+            .fetchone()
+        )
+        return tuple(row) if row is not None else ("missing", None, None)
+
+    def unfinished(self) -> int:
+        """Number of jobs that are pending or leased."""
+
+        row = self._connection().execute("SELECT COUNT(*) FROM jobs WHERE state IN ('pending', 'leased')").fetchone()
+        return row[0]
+
+
+class _Transaction:
+    # BEGIN IMMEDIATE takes the write lock up front, so a claim's read and update cannot interleave.
+    def __init__(self, connection):
+        self._connection = connection
+
+    def __enter__(self):
+        self._connection.execute("BEGIN IMMEDIATE")
+        return self._connection
+
+    def __exit__(self, exc_type, exc, traceback):
+        self._connection.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
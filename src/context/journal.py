@@ -0,0 +1,95 @@
+#    Copyright 2023 Robert Mazurowski
+
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+import json
+import os
+import threading
+import time
+
+from .blob_store import content_digest
+from .log import Log
+
+
+class RunJournal:
+    """Append-only JSONL record of every prompt whose output was written.
+
+    Each line holds the prompt (absolute file path and name), the key of the inputs it was generated
+    from and the sha256 of the written code. Lines are flushed as they are written, so a run that dies
+    halfway leaves every completed prompt journaled; a torn last line is ignored when the journal is
+    read back. The latest entry of a prompt wins.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._latest = {}
+        self._file = None
+        if os.path.exists(path):
+            self._load(path)
+
+    def _load(self, path):
+        with open(path, encoding="utf-8") as file:
+            for number, line in enumerate(file, start=1):
+                try:
+                    entry = json.loads(line)
+                    self._latest[(entry["file"], entry["prompt"])] = entry
+                except (ValueError, KeyError, TypeError):
+                    Log.logger.warning(f"Ignoring unreadable line {number} of run journal {path}")
+
+    def record(self, key, input_key: str, code: str) -> None:
+        """Journal that prompt ``key`` (an ast.prompt_key) wrote ``code``, generated from ``input_key``."""
+
+        entry = {
+            "file": key[0],
+            "prompt": key[1],
+            "input": input_key,
+            "output": content_digest(code),
+            "at": time.time(),
+        }
+        with self._lock:
+            if self._file is None:
+                # Opened on the first write and kept open for the run; reading the journal never creates it.
+                directory = os.path.dirname(self.path)
+                if directory:
+                    os.makedirs(directory, exist_ok=True)
+                self._file = open(self.path, "a", encoding="utf-8")
+                if self._file.tell() and not _ends_with_newline(self.path):
+                    # Start after a line torn by a crash instead of appending to it.
+                    self._file.write("\n")
+            self._file.write(json.dumps(entry) + "\n")
+            self._file.flush()
+            self._latest[key] = entry
+
+    def is_done(self, key, input_key: str) -> bool:
+        """Whether the latest journaled run of prompt ``key`` used exactly these inputs."""
+
+        entry = self._latest.get(key)
+        return entry is not None and entry["input"] == input_key
+
+    def output_digest(self, key) -> str:
+        """sha256 of the latest journaled output of prompt ``key``, or "" when it never completed."""
+
+        entry = self._latest.get(key)
+        return entry["output"] if entry else ""
+
+    def close(self) -> None:
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def _ends_with_newline(path):
+    with open(path, "rb") as file:
+        file.seek(-1, os.SEEK_END)
+        return file.read(1) == b"\n"
@@ -0,0 +1,108 @@
+#    Copyright 2023 Robert Mazurowski
+
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+from collections.abc import MutableMapping
+
+from .blob_store import BlobRef, blob_store
+
+
+class ContextLoadError(ValueError):
+    """Raised when a lazily imported context variable cannot be loaded."""
+
+
+class LazyValue:
+    """A context variable whose content is loaded by ``loader()`` the first time it is read.
+
+    ``digest`` is the content hash when it is already known (e.g. from the context index); content that is
+    already in the blob store is then reused without calling the loader. ``paths`` are the files a
+    <file:> or <dir:> import reads whole, whose generated outputs would change the value.
+    """
+
+    __slots__ = ("loader", "description", "digest", "paths")
+
+    def __init__(self, loader, description: str, digest: str | None = None, paths=()):
+        self.loader = loader
+        self.description = description
+        self.digest = digest
+        self.paths = paths
+
+    def __repr__(self):
+        return f"<lazy {self.description}>"
+
+
+class LazyContextDict(MutableMapping):
+    """Context variables where <file:> and <import:NAME> values stay unread until a prompt uses them.
+
+    Reading a LazyValue entry loads it; iteration, ``in`` and repr never trigger a load. Loaded values
+    are interned in the content-addressed blob store and held as BlobRefs, so many Tasks importing the
+    same text share one copy.
+    """
+
+    def __init__(self, store=None):
+        self._store = store if store is not None else blob_store
+        self._values = {}
+
+    def set_lazy(self, name: str, loader, description: str, digest: str | None = None, paths=()) -> None:
+        self._values[name] = LazyValue(loader, description, digest, paths)
+
+    def is_loaded(self, name: str) -> bool:
+        return not isinstance(self._values[name], LazyValue)
+
+    def paths(self, name: str):
+        """The files an unread <file:> or <dir:> value will be read from (see LazyValue.paths)."""
+
+        value = self._values[name]
+        return value.paths if isinstance(value, LazyValue) else ()
+
+    def digest(self, name: str) -> str | None:
+        """Content hash of a variable without loading it, when known; usable as a cache key."""
+
+        value = self._values[name]
+        return value.digest
+
+    def __getitem__(self, name):
+        value = self._values[name]
+        if isinstance(value, LazyValue):
+            ref = self._store.ref(value.digest) if value.digest else None
+            if ref is None:
+                try:
+                    loaded = value.loader()
+                except Exception as e:
+                    raise ContextLoadError(
+                        f"Could not load context variable '{name}' from {value.description}: {e}"
+                    ) from e
+                ref = self._store.put(loaded)
+            self._values[name] = value = ref
+        return self._store.get(value)
+
+    def __setitem__(self, name, value):
+        if isinstance(value, str):
+            value = self._store.put(value)
+        elif not isinstance(value, LazyValue | BlobRef):
+            raise TypeError(f"Context variable '{name}' must be a str, LazyValue or BlobRef, got {type(value)}.")
+        self._values[name] = value
+
+    def __delitem__(self, name):
+        del self._values[name]
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def __contains__(self, name):
+        return name in self._values
+
+    def __repr__(self):
+        return repr(self._values)
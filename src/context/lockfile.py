@@ -0,0 +1,98 @@
+#    Copyright 2023 Robert Mazurowski
+
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+import json
+import os
+import threading
+
+from .blob_store import content_digest
+from .log import Log
+
+_LOCK_VERSION = 1
+
+
+class LockDriftError(ValueError):
+    """Raised by --frozen when prompts are missing from the lockfile or their inputs changed."""
+
+    def __init__(self, message, drifted):
+        super().__init__(message)
+        self.drifted = drifted
+
+
+class Lockfile:
+    """context.lock: the generated output of every prompt, with the inputs and model it came from.
+
+    Prompts are keyed "path::Prompt", with paths relative to the lockfile's directory so the lock is
+    valid in any checkout. Each entry holds the model, the key of the prompt's inputs, and the sha256
+    and full text of the code written. The file is sorted, indented JSON, so regenerated outputs show
+    up as reviewable diffs.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._base = os.path.dirname(os.path.abspath(path))
+        self._lock = threading.Lock()
+        self._entries = {}
+        self._changed = False
+        if os.path.exists(path):
+            self._load(path)
+
+    def _load(self, path):
+        with open(path, encoding="utf-8") as file:
+            data = json.load(file)
+        if data.get("version") != _LOCK_VERSION:
+            raise ValueError(f"Unsupported lockfile version {data.get('version')!r} in {path}.")
+        self._entries = data.get("prompts", {})
+
+    def name(self, key) -> str:
+        """The "path::Prompt" name of prompt ``key`` (an ast.prompt_key) in this lockfile."""
+
+        path, prompt_name = key
+        return f"{os.path.relpath(path, self._base).replace(os.sep, '/')}::{prompt_name}"
+
+    def entry(self, key) -> dict | None:
+        return self._entries.get(self.name(key))
+
+    def output_digest(self, key) -> str:
+        """sha256 of the locked output of prompt ``key``, or "" when it is not locked."""
+
+        entry = self.entry(key)
+        return entry["output"] if entry else ""
+
+    def record(self, key, model: str, input_key: str, code: str) -> None:
+        entry = {"model": model, "input": input_key, "output": content_digest(code), "code": code}
+        with self._lock:
+            name = self.name(key)
+            if self._entries.get(name) != entry:
+                self._entries[name] = entry
+                self._changed = True
+
+    def save(self) -> None:
+        """Write the lock if it changed, dropping prompts of files that no longer exist."""
+
+        with self._lock:
+            entries = {
+                name: entry
+                for name, entry in self._entries.items()
+                if os.path.exists(os.path.join(self._base, name.rsplit("::", 1)[0]))
+            }
+            if not self._changed and len(entries) == len(self._entries):
+                return
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as file:
+                json.dump({"version": _LOCK_VERSION, "prompts": entries}, file, indent=2, sort_keys=True)
+                file.write("\n")
+            os.replace(temp_path, self.path)
+            self._entries = entries
+            self._changed = False
+        Log.logger.debug(f"Wrote {len(entries)} locked prompts to {self.path}")
@@ -12,11 +12,14 @@
 #    See the License for the specific language governing permissions and
 #    limitations under the License.
 import json
+import re
 
 from .config import Config
-from .graph import run_generation_graph
+from .graph import batch_system_message, run_generation_graph
 from .log import Log
 
+_CODE_FENCE_PATTERN = re.compile(r"^\s*```(?:json)?\s*(.*?)\s*```\s*$", re.DOTALL)
+
 
 def generate_code_with_chat(prompt, prompt_name):
     Log.logger.debug(f"Generated Prompt:\n{prompt}")
@@ -40,3 +43,60 @@ def generate_code_with_chat(prompt, prompt_name):
     Log.logger.debug("---------------------------------------")
 
     return json.dumps({"code": generated_code})
+
+
+def generate_batch_with_chat(prompts, global_context=None):
+    """Generate several independent prompts with a single request.
+
+    Returns a dict mapping prompt name -> response JSON (the same shape generate_code_with_chat returns).
+    Prompts that are missing or invalid in the model's answer are left out, so the caller can
+    fall back to generating them individually.
+    """
+
+    batch_prompt = build_batch_prompt(prompts, global_context)
+    Log.logger.debug(f"Generated Batch Prompt:\n{batch_prompt}")
+
+    if Config.MockLLM:
+        return {name: json.dumps({"code": f"MOCK_LLM_RESPONSE({name})"}) for name in prompts}
+
+    try:
+        raw_response = run_generation_graph(batch_prompt, "BATCH", system=batch_system_message())
+    except Exception as e:
+        Log.logger.error("Unable to generate batch graph response")
+        Log.logger.error(f"Exception: {e}")
+        raise
+
+    Log.logger.debug("OPENROUTER BATCH RESPONSE------------------------------")
+    Log.logger.debug(raw_response)
+    Log.logger.debug("---------------------------------------")
+
+    return parse_batch_response(raw_response, prompts)
+
+
+def build_batch_prompt(prompts, global_context=None):
+    batch_prompt = "TASKS:\n" + json.dumps(prompts, indent=2, ensure_ascii=False)
+    if global_context:
+        batch_prompt += "\n" + "GLOBAL_CONTEXT:\n" + global_context
+    return batch_prompt
+
+
+def parse_batch_response(raw_response, prompts):
+    """Split a batched JSON answer into per-prompt responses, dropping anything that does not validate."""
+
+    fenced = _CODE_FENCE_PATTERN.match(raw_response)
+    if fenced:
+        raw_response = fenced.group(1)
+    try:
+        answer = json.loads(raw_response)
+    except json.JSONDecodeError:
+        Log.logger.error("Batch response is not valid JSON; all prompts will be generated individually.")
+        return {}
+    if not isinstance(answer, dict):
+        Log.logger.error("Batch response is not a JSON object; all prompts will be generated individually.")
+        return {}
+
+    return {
+        name: json.dumps({"code": answer[name]})
+        for name in prompts
+        if isinstance(answer.get(name), str) and answer[name].strip()
+    }
@@ -0,0 +1,127 @@
+#    Copyright 2023 Robert Mazurowski
+
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+"""Staged pipeline: discovery -> parsing and prompt ordering -> generation, connected by bounded queues.
+
+A background thread walks the file tree, parses each file and orders its prompts as soon as it is
+found; every valid Task is handed to generate_code right away, so the first LLM request does not wait
+for the whole repository to be parsed. Files with errors are skipped and their errors collected.
+"""
+
+import os
+import queue
+import threading
+
+from .ast import PromptDependencyCycleError, PromptGraph, build_prompt_order
+from .config import Config
+from .log import Log
+from .tag_parser import iter_parse_tags
+
+_DONE = object()
+# How often a blocked producer checks whether the consumer has stopped.
+_PUT_POLL_SECONDS = 0.1
+
+
+class _ProducerFailure:
+    __slots__ = ("error",)
+
+    def __init__(self, error):
+        self.error = error
+
+
+def ast_error_message(task, error) -> str:
+    """The user-facing error line for a Task whose prompts could not be ordered."""
+
+    if isinstance(error, PromptDependencyCycleError):
+        rel_path = os.path.relpath(getattr(error, "filepath", None) or task.filepath)
+        cyclic = getattr(error, "cyclic_prompts", None) or []
+        cyclic_part = f" Cyclic prompts: {cyclic}." if cyclic else ""
+        msg = (
+            "AST: prompt dependency cycle detected." + cyclic_part + " Prompt ordering requires an acyclic graph. "
+            "Break the cycle by splitting prompts into a one-way chain (e.g., A depends on B depends on C), "
+            "or remove the circular {PromptName} references."
+        )
+        Log.logger.error(msg)
+    elif isinstance(error, ValueError):
+        rel_path = os.path.relpath(task.filepath)
+        msg = f"AST: {error}"
+        Log.logger.error(msg)
+    else:
+        # Keep behavior safe and user-friendly; we still include the file context.
+        rel_path = os.path.relpath(task.filepath)
+        msg = f"AST: unexpected error while ordering prompts: {error}"
+        Log.logger.error(msg, exc_info=True)
+    return f"Error in file {rel_path}: {msg}"
+
+
+def stream_tasks(paths, errors, queue_size=None, remaining=None):
+    """Yield ordered, error-free Tasks while discovery and parsing continue in a background thread.
+
+    ``paths`` may be a lazy iterable (e.g. file_manager.iter_file_paths). Parse and ordering errors
+    are appended to ``errors``; the files they belong to are not yielded. At most ``queue_size`` parsed
+    Tasks wait for the consumer, so parsing never runs arbitrarily far ahead of generation.
+    ``remaining()`` returns the seconds left to wait for the next Task (None: no limit, e.g.
+    RunState.remaining); TimeoutError is raised when no Task arrives in time.
+    """
+
+    tasks = queue.Queue(maxsize=queue_size or Config.Pipeline_Queue_Size)
+    stopped = threading.Event()
+
+    def put(item):
+        while not stopped.is_set():
+            try:
+                tasks.put(item, timeout=_PUT_POLL_SECONDS)
+                return
+            except queue.Full:
+                continue
+
+    def produce():
+        # Cross-file ({file::Prompt}) cycles are checked as each file arrives; a file closing one is skipped.
+        graph = PromptGraph()
+        try:
+            for _, task, file_errors in iter_parse_tags(paths):
+                if stopped.is_set():
+                    return
+                if file_errors:
+                    errors.extend(file_errors)
+                    continue
+                if task is None:
+                    continue
+                try:
+                    build_prompt_order([task])
+                    graph.add(task)
+                except Exception as e:
+                    errors.append(ast_error_message(task, e))
+                    continue
+                put(task)
+        except BaseException as e:
+            put(_ProducerFailure(e))
+        finally:
+            put(_DONE)
+
+    producer = threading.Thread(target=produce, name="context-parser", daemon=True)
+    producer.start()
+    try:
+        while True:
+            try:
+                item = tasks.get(timeout=remaining() if remaining is not None else None)
+            except queue.Empty:
+                raise TimeoutError("No parsed file arrived before the run deadline.") from None
+            if item is _DONE:
+                break
+            if isinstance(item, _ProducerFailure):
+                raise item.error
+            yield item
+    finally:
+        # Lets a producer blocked on a full queue exit when the consumer stops early.
+        stopped.set()
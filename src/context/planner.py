@@ -0,0 +1,161 @@
+#    Copyright 2023 Robert Mazurowski
+
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+import os
+
+from .ast import prompt_key
+from .blob_store import content_key
+from .code_generator import __plan_file, __plan_resumed, __render_prompt
+from .config import Config
+from .graph import system_message
+from .journal import RunJournal
+from .lazy_context import ContextLoadError
+from .run_state import RunState
+from .scheduler import (
+    LatencyHistory,
+    critical_path,
+    critical_path_ranks,
+    estimate_seconds,
+    execution_layers,
+    group_dependencies,
+    simulate_run_seconds,
+)
+from .token_budget import MODEL_PRICES, PromptTooLargeError, chars_per_token, estimate_cost, estimate_tokens
+
+
+def plan_run(tasks):
+    """Describe what generate_code would do for the ordered ``tasks``, without calling the LLM.
+
+    Every prompt is rendered as it would be sent now. Prompts whose rendered request repeats an earlier
+    one are reported as deduplicated (the run shares one call for them); with --resume, prompts the
+    journal already has with the same inputs (and whose dependencies are resumed too) as resumed.
+    Output tokens are estimated from the current output tag contents, or Config.Plan_Output_Tokens.
+    Group latencies come from the latency history or prompt size, and the wall-clock time is simulated
+    at the configured concurrency. Returns a JSON-serializable dict.
+    """
+
+    run = RunState()
+    journal = RunJournal(Config.Journal_Path) if Config.Resume and Config.Journal_Path else None
+    units, durations, dependencies = __run_graph(tasks, LatencyHistory(Config.Latency_History_Path))
+
+    # Prompts referencing {file::Prompt} outputs generated in this run see stand-in text of the estimated size.
+    output_tokens = {}
+    for task, group in units:
+        for name in group:
+            key = prompt_key(task.filepath, name)
+            output_tokens[key] = __estimate_output_tokens(task, name)
+            run.outputs[key] = "x" * round(output_tokens[key] * chars_per_token(Config.Model))
+
+    # Dependencies first, so a prompt is only reported as resumed when everything it depends on is.
+    prompts = []
+    requests = set()
+    resumed = set()
+    for index in (index for layer in execution_layers(dependencies) for index in layer):
+        task, group = units[index]
+        for name in group:
+            key = prompt_key(task.filepath, name)
+            if journal is not None and __plan_resumed(task, name, journal, resumed):
+                resumed.add(key)
+                prompts.append(__plan_entry(task, name, index, status="resumed", input_tokens=0, output_tokens=0))
+            else:
+                prompts.append(__plan_prompt(task, name, index, output_tokens[key], requests, run))
+        if all(prompt_key(task.filepath, name) in resumed for name in group):
+            durations[index] = 0.0
+
+    prompts.sort(key=lambda entry: entry["group"])
+    return __plan_summary(prompts, durations, dependencies)
+
+
+def __run_graph(tasks, history):
+    """Every (task, group) of the run, with its estimated seconds and the indexes of the groups it waits for.
+
+    Groups wait for the groups of their file they depend on (scheduler.group_dependencies) and for the
+    groups writing the {file::Prompt} outputs they reference, when those files are part of the run.
+    """
+
+    units = []
+    durations = []
+    dependencies = []
+    external_keys = []
+    unit_of = {}
+    for task in tasks:
+        groups = __plan_file(task)
+        offset = len(units)
+        external = getattr(task, "prompt_external_dependencies", None) or {}
+        for index, waits in enumerate(group_dependencies(task, groups)):
+            group = groups[index]
+            units.append((task, group))
+            durations.append(estimate_seconds(task, group, history))
+            dependencies.append({offset + wait for wait in waits})
+            external_keys.append({key for name in group for key in external.get(name, ())})
+            unit_of.update((prompt_key(task.filepath, name), offset + index) for name in group)
+    # Cross-file dependencies on prompts outside the run do not wait.
+    for waits, keys in zip(dependencies, external_keys, strict=True):
+        waits.update(unit_of[key] for key in keys if key in unit_of)
+    return units, durations, dependencies
+
+
+def __plan_entry(task, prompt_name, group, **fields):
+    return {"file": os.path.relpath(task.filepath), "prompt": prompt_name, "group": group, **fields}
+
+
+def __plan_prompt(task, prompt_name, group, output_tokens, requests, run):
+    try:
+        final_prompt = __render_prompt(task, prompt_name, run)
+    except (PromptTooLargeError, ContextLoadError) as e:
+        return __plan_entry(task, prompt_name, group, status="skipped", reason=str(e), input_tokens=0, output_tokens=0)
+
+    key = content_key(Config.Model, system_message(prompt_name), final_prompt)
+    entry = __plan_entry(
+        task,
+        prompt_name,
+        group,
+        status="deduplicated" if key in requests else "run",
+        input_tokens=estimate_tokens(system_message(prompt_name) + final_prompt, Config.Model),
+        output_tokens=output_tokens,
+    )
+    requests.add(key)
+    return entry
+
+
+def __plan_summary(prompts, durations, dependencies):
+    billed = [entry for entry in prompts if entry["status"] == "run"]
+    input_tokens = sum(entry["input_tokens"] for entry in billed)
+    output_tokens = sum(entry["output_tokens"] for entry in billed)
+    names = [[] for _ in durations]
+    for entry in prompts:
+        names[entry["group"]].append(f"{entry['file']}::{entry['prompt']}")
+
+    return {
+        "model": Config.Model,
+        "prompts": prompts,
+        "layers": [[name for index in layer for name in names[index]] for layer in execution_layers(dependencies)],
+        "critical_path": [name for index in critical_path(durations, dependencies) for name in names[index]],
+        "critical_path_seconds": max(critical_path_ranks(durations, dependencies), default=0.0),
+        "input_tokens": input_tokens,
+        "output_tokens": output_tokens,
+        "cost_usd": {
+            model: estimate_cost(model, input_tokens, output_tokens) for model in {Config.Model, *MODEL_PRICES}
+        },
+        "predicted_seconds": {
+            str(workers): simulate_run_seconds(durations, dependencies, workers)
+            for workers in sorted({Config.Concurrency, Config.Max_Concurrency})
+        },
+    }
+
+
+def __estimate_output_tokens(task, prompt_name):
+    # A prompt rewriting an output tag is expected to produce about as much as the tag holds now.
+    tag = getattr(task, "prompt_output_targets", {}).get(prompt_name) or prompt_name
+    current = task.prompt_outputs_tags[tag] if tag in task.prompt_outputs_tags else ""
+    return estimate_tokens(current, Config.Model) if current else Config.Plan_Output_Tokens
@@ -0,0 +1,230 @@
+#    Copyright 2023 Robert Mazurowski
+
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+import json
+import multiprocessing
+import os
+import socket
+import threading
+import time
+
+from .ast import build_prompt_order, format_prompt_key, prompt_key
+from .code_generator import __call_llm, __commit_response, __materialize, __render_prompt, __tag_writers
+from .config import Config
+from .job_queue import JobQueue
+from .journal import RunJournal
+from .lazy_context import ContextLoadError
+from .lockfile import Lockfile
+from .log import Log, configure_logger
+from .planner import __run_graph
+from .run_state import RunState
+from .scheduler import LatencyHistory, critical_path_ranks, execution_layers
+from .tag_parser import parse_tags
+from .token_budget import PromptTooLargeError
+
+
+def queue_run(tasks, queue_path, workers):
+    """Generate the ordered ``tasks`` through the SQLite job queue at ``queue_path``; returns the RunSummary.
+
+    Every prompt becomes a job ranked by its critical path and waiting for the prompts it depends on
+    (see __run_graph). ``workers`` local worker processes (run_worker) claim and generate them, joined
+    by any ``--worker`` processes on machines sharing the filesystem. Workers only store results in
+    the queue: once it drains, this process writes every file in dependency order, so each file has a
+    single writer. Prompts not finished by the deadline are cancelled.
+    """
+
+    queue = JobQueue(queue_path, Config.Queue_Lease_Seconds, Config.Queue_Max_Attempts)
+    units, durations, dependencies = __run_graph(tasks, LatencyHistory(Config.Latency_History_Path))
+    ranks = critical_path_ranks(durations, dependencies)
+    keys = [[prompt_key(task.filepath, name) for name in group] for task, group in units]
+    # Prompts of one batch group do not depend on each other, so every prompt is a job of its own.
+    queue.reset(
+        [
+            (key, ranks[index], [wait_key for wait in dependencies[index] for wait_key in keys[wait]])
+            for index in range(len(units))
+            for key in keys[index]
+        ]
+    )
+
+    spawn = multiprocessing.get_context("spawn")
+    settings = {name: value for name, value in vars(Config).items() if name[:1].isupper()}
+    processes = []
+    drained = False
+    run = RunState()
+    try:
+        try:
+            for _ in range(workers):
+                process = spawn.Process(target=run_worker, args=(queue_path, settings), daemon=True)
+                process.start()
+                processes.append(process)
+            drained = __wait_for_queue(queue, processes)
+        finally:
+            # Stopped before the merge, so no result lands while (or after) the files are written.
+            for process in processes:
+                if process.is_alive() and not drained:
+                    process.terminate()
+                process.join()
+
+        # The merge writes everything the workers finished, even once the deadline has passed.
+        run.deadline = None
+        run.journal = RunJournal(Config.Journal_Path) if Config.Journal_Path else None
+        run.lock = Lockfile(Config.Lock_Path) if Config.Lock_Path else None
+        for index in (index for layer in execution_layers(dependencies) for index in layer):
+            task, group = units[index]
+            for name, key in zip(group, keys[index], strict=True):
+                state, code, error = queue.outcome(key)
+                if state == "done":
+                    __commit_response(task, name, json.dumps({"code": code}), run)
+                    run.summary.record_applied()
+                elif state in ("skipped", "failed"):
+                    Log.logger.error(f"{format_prompt_key(key)} was not generated: {error}")
+                    run.summary.record_failure()
+                else:
+                    run.summary.record_cancelled(task.filepath, [name])
+        if run.lock is not None:
+            run.lock.save()
+    finally:
+        if run.journal is not None:
+            run.journal.close()
+        queue.close()
+    return run.summary
+
+
+def __wait_for_queue(queue, processes):
+    """Wait until every job is finished; returns False when the deadline, Ctrl-C or dead workers stop the wait."""
+
+    deadline = time.monotonic() + Config.Deadline if Config.Deadline else None
+    try:
+        while queue.unfinished():
+            if deadline is not None and time.monotonic() >= deadline:
+                Log.logger.warning("Run deadline reached; cancelling the remaining prompts.")
+                return False
+            if processes and not any(process.is_alive() for process in processes):
+                Log.logger.error("Every worker process exited before the queue was drained.")
+                return False
+            time.sleep(Config.Queue_Poll_Seconds)
+    except KeyboardInterrupt:
+        Log.logger.warning("Interrupted; cancelling the remaining prompts.")
+        return False
+    return True
+
+
+def run_worker(queue_path, settings=None):
+    """Claim and generate prompts from the job queue at ``queue_path`` until every job is finished.
+
+    ``settings`` are Config attributes to apply first (local workers are spawned with the
+    coordinator's). Files are parsed as they are on disk, which the coordinator only writes once the
+    queue drains; the code of the prompts a job depends on comes from the queue. The worker never
+    writes source files. Returns the number of prompts it generated.
+    """
+
+    for name, value in (settings or {}).items():
+        setattr(Config, name, value)
+    if Log.logger is None:
+        Log.logger = configure_logger(Config.Debug, Config.Log)
+
+    queue = JobQueue(queue_path, Config.Queue_Lease_Seconds, Config.Queue_Max_Attempts)
+    worker = f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+    run = RunState()
+    tasks = {}
+    generated = 0
+    try:
+        while not run.is_cancelled():
+            job = queue.claim(worker)
+            if job is None:
+                if not queue.unfinished():
+                    break
+                time.sleep(Config.Queue_Poll_Seconds)
+                continue
+            key, dependencies = job
+            stop_heartbeat = threading.Event()
+            heartbeat = threading.Thread(
+                target=__heartbeat, args=(queue, key, worker, stop_heartbeat), name="context-heartbeat", daemon=True
+            )
+            heartbeat.start()
+            try:
+                generated += __run_job(queue, worker, key, dependencies, tasks, run)
+            finally:
+                stop_heartbeat.set()
+                heartbeat.join()
+    finally:
+        run.close()
+        queue.close()
+    Log.logger.debug(f"Worker {worker} generated {generated} prompts")
+    return generated
+
+
+def __heartbeat(queue, key, worker, stopped):
+    try:
+        while not stopped.wait(Config.Queue_Heartbeat_Seconds):
+            if not queue.heartbeat(key, worker):
+                Log.logger.warning(f"Lost the lease on {format_prompt_key(key)}; another worker will generate it.")
+                return
+    finally:
+        queue.close()
+
+
+def __run_job(queue, worker, key, dependencies, tasks, run):
+    """Generate one claimed prompt and store the result in the queue; returns 1 if it was stored, else 0."""
+
+    path, prompt_name = key
+    try:
+        task = tasks.get(path) or __load_task(path)
+        tasks[path] = task
+        run.outputs.update(queue.results(dependencies))
+        final_prompt = __render_prompt(task, prompt_name, run, __queued_code_to_modify(queue, task, prompt_name))
+    except (PromptTooLargeError, ContextLoadError) as e:
+        Log.logger.error(f"Skipping {prompt_name} in {path}: {e}")
+        queue.skip(key, worker, str(e))
+        return 0
+    except Exception as e:
+        queue.fail(key, worker, str(e))
+        return 0
+
+    try:
+        response = __call_llm(final_prompt, prompt_name, run)
+        if response is None:
+            queue.fail(key, worker, "the worker's deadline was reached")
+            return 0
+        code = json.loads(response).get("code", "").strip()
+    except Exception as e:
+        queue.fail(key, worker, f"{type(e).__name__}: {e}")
+        return 0
+    if not queue.complete(key, worker, code):
+        Log.logger.warning(f"Discarding {format_prompt_key(key)}: its lease expired and it was claimed again.")
+        return 0
+    return 1
+
+
+def __load_task(path):
+    tasks, errors = parse_tags([path], Config.Comment_Characters)
+    if errors:
+        raise ValueError("; ".join(errors))
+    build_prompt_order(tasks)
+    __materialize(tasks[0])
+    return tasks[0]
+
+
+def __queued_code_to_modify(queue, task, prompt_name):
+    """CODE_TO_MODIFY of an output-target prompt whose earlier writers are in the queue, not yet in the file.
+
+    The code of the tag's last earlier writer that produced any; None (read the file) when there is none.
+    """
+
+    output_target = getattr(task, "prompt_output_targets", {}).get(prompt_name)
+    if output_target is None:
+        return None
+    writers = __tag_writers(task, output_target)
+    previous = [prompt_key(task.filepath, writer) for writer in writers[: writers.index(prompt_name)]]
+    codes = queue.results(previous)
+    return next((codes[key] for key in reversed(previous) if codes.get(key)), None)
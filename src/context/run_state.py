@@ -0,0 +1,241 @@
+#    Copyright 2023 Robert Mazurowski
+
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+import math
+import os
+import threading
+import time
+
+from .concurrency import AdaptiveConcurrencyLimiter, DaemonExecutor, SingleFlight
+from .config import Config
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of ``values`` (``pct`` in 0..100). Returns None for an empty list."""
+
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+class RunSummary:
+    """Thread-safe counters collected while generating code, printed at the end of a run."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = []
+        self.completed = 0
+        self.failed = 0
+        self.retries = 0
+        self.concurrency_limit = None
+        self.concurrency_peak = None
+        self.ttfts = []
+        self.tokens_per_second = []
+        self.cancelled = {}
+        self.hedges_sent = 0
+        self.hedges_won = 0
+        self.deduplicated = 0
+        self.resumed = 0
+        self.locked = 0
+        self.batches = 0
+        self.batched_prompts = 0
+        self.batch_fallbacks = 0
+        self.largest_prompt_tokens = 0
+        self.trimmed_prompts = 0
+        self.rejected_prompts = 0
+
+    def record_success(self, latency: float) -> None:
+        with self._lock:
+            self.completed += 1
+            self.latencies.append(latency)
+
+    def record_applied(self) -> None:
+        """Count a prompt whose output was applied without a live LLM call (e.g. from a batch file)."""
+
+        with self._lock:
+            self.completed += 1
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.failed += 1
+
+    def record_retry(self) -> None:
+        with self._lock:
+            self.retries += 1
+
+    def record_call_metrics(self, metrics: dict) -> None:
+        """Record the per-call metrics reported by graph.pop_call_metrics."""
+
+        with self._lock:
+            stream = metrics.get("stream")
+            if stream:
+                self.ttfts.append(stream["ttft"])
+                generation_time = stream["duration"] - stream["ttft"]
+                if stream["tokens"] and generation_time > 0:
+                    self.tokens_per_second.append(stream["tokens"] / generation_time)
+            if metrics.get("hedged"):
+                self.hedges_sent += 1
+                self.hedges_won += bool(metrics.get("hedge_won"))
+
+    def record_prompt_size(self, tokens: int, trimmed, rejected: bool = False) -> None:
+        with self._lock:
+            self.largest_prompt_tokens = max(self.largest_prompt_tokens, tokens)
+            self.trimmed_prompts += bool(trimmed)
+            self.rejected_prompts += rejected
+
+    def record_batch(self, prompt_count: int, valid_count: int) -> None:
+        with self._lock:
+            self.batches += 1
+            self.batched_prompts += valid_count
+            self.batch_fallbacks += prompt_count - valid_count
+
+    def record_deduplicated(self) -> None:
+        with self._lock:
+            self.deduplicated += 1
+
+    def record_resumed(self) -> None:
+        with self._lock:
+            self.resumed += 1
+
+    def record_locked(self) -> None:
+        with self._lock:
+            self.locked += 1
+
+    def record_cancelled(self, filepath: str, prompt_names) -> None:
+        if not prompt_names:
+            return
+        with self._lock:
+            self.cancelled.setdefault(filepath, []).extend(prompt_names)
+
+    def record_concurrency(self, limiter: AdaptiveConcurrencyLimiter) -> None:
+        with self._lock:
+            self.concurrency_limit = limiter.limit
+            self.concurrency_peak = limiter.peak
+
+    def latency_percentile(self, pct):
+        with self._lock:
+            return percentile(self.latencies, pct)
+
+    def lines(self) -> list[str]:
+        lines = [f"Prompts: {self.completed} completed, {self.failed} failed, {self.retries} retried"]
+        if self.concurrency_limit is not None:
+            lines.append(f"Concurrency: final limit {self.concurrency_limit}, peak {self.concurrency_peak}")
+        if self.latencies:
+            p50, p90, p99 = (self.latency_percentile(p) for p in (50, 90, 99))
+            lines.append(f"Latency: p50 {p50:.2f}s, p90 {p90:.2f}s, p99 {p99:.2f}s")
+        if self.ttfts:
+            ttft_p50, ttft_p90 = percentile(self.ttfts, 50), percentile(self.ttfts, 90)
+            line = f"Streaming: time to first token p50 {ttft_p50:.2f}s, p90 {ttft_p90:.2f}s"
+            if self.tokens_per_second:
+                line += f", {sum(self.tokens_per_second) / len(self.tokens_per_second):.1f} tok/s average"
+            lines.append(line)
+        if self.largest_prompt_tokens:
+            lines.append(
+                f"Prompt size: largest ~{self.largest_prompt_tokens} tokens, {self.trimmed_prompts} trimmed, "
+                f"{self.rejected_prompts} rejected as too large"
+            )
+        if self.batches:
+            lines.append(
+                f"Batching: {self.batched_prompts} prompts answered by {self.batches} batched requests, "
+                f"{self.batch_fallbacks} fell back to individual requests"
+            )
+        if self.deduplicated:
+            lines.append(f"Deduplicated: {self.deduplicated} identical prompts reused another request")
+        if self.resumed:
+            lines.append(f"Resumed: {self.resumed} prompts skipped, already journaled with unchanged inputs")
+        if self.locked:
+            lines.append(f"Frozen: {self.locked} prompts written from the lockfile without calling the provider")
+        if self.hedges_sent:
+            lines.append(f"Hedging: {self.hedges_sent} duplicate requests sent, {self.hedges_won} won")
+        if self.cancelled:
+            count = sum(len(names) for names in self.cancelled.values())
+            lines.append(f"Cancelled: {count} prompts were not written")
+            for filepath, names in sorted(self.cancelled.items()):
+                lines.append(f"    {os.path.relpath(filepath)}: {', '.join(names)}")
+        return lines
+
+
+class RunState:
+    """State shared by every worker of a single generate_code run."""
+
+    def __init__(self):
+        self.limiter = AdaptiveConcurrencyLimiter(
+            initial=Config.Concurrency,
+            minimum=Config.Min_Concurrency,
+            maximum=Config.Max_Concurrency,
+            latency_tolerance=Config.Latency_Tolerance,
+        )
+        self.summary = RunSummary()
+        # Identical (model, system message, prompt) requests share one LLM call per run.
+        self.single_flight = SingleFlight()
+        self.deadline = time.monotonic() + Config.Deadline if Config.Deadline else None
+        # Serializes file writes against cancellation so "written" and "cancelled" never overlap.
+        self.commit_lock = threading.Lock()
+        self._cancel_event = threading.Event()
+        self._committed = set()
+        # Code written by each prompt, by (absolute path, prompt name), for {file::Prompt} references.
+        self.outputs = {}
+        # journal.RunJournal recording every written prompt, when Config.Journal_Path is set.
+        self.journal = None
+        # lockfile.Lockfile recording every written prompt, when Config.Lock_Path is set.
+        self.lock = None
+        self._hedge_pool = None
+        self._hedge_pool_lock = threading.Lock()
+
+    def remaining(self):
+        """Seconds left before the run deadline, or None when the run has no deadline."""
+
+        if self.deadline is None:
+            return None
+        return max(0.0, self.deadline - time.monotonic())
+
+    def cancel(self) -> None:
+        self._cancel_event.set()
+
+    def is_cancelled(self) -> bool:
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self._cancel_event.set()
+        return self._cancel_event.is_set()
+
+    def wait(self, seconds: float) -> bool:
+        """Sleep up to ``seconds``, waking early when the run is cancelled or reaches its deadline.
+
+        Returns whether the run is cancelled.
+        """
+
+        remaining = self.remaining()
+        self._cancel_event.wait(seconds if remaining is None else min(seconds, remaining))
+        return self.is_cancelled()
+
+    def hedge_pool(self) -> DaemonExecutor:
+        """Executor of the run's hedged requests (see graph.run_scope), created on first use."""
+
+        with self._hedge_pool_lock:
+            if self._hedge_pool is None:
+                self._hedge_pool = DaemonExecutor(thread_name_prefix="context-hedge")
+            return self._hedge_pool
+
+    def close(self) -> None:
+        """Shut down the run's hedge pool once the run is over; duplicates still running are abandoned."""
+
+        with self._hedge_pool_lock:
+            if self._hedge_pool is not None:
+                self._hedge_pool.shutdown()
+
+    def mark_committed(self, filepath: str, prompt_name: str) -> None:
+        self._committed.add((filepath, prompt_name))
+
+    def is_committed(self, filepath: str, prompt_name: str) -> bool:
+        return (filepath, prompt_name) in self._committed
@@ -0,0 +1,407 @@
+#    Copyright 2023 Robert Mazurowski
+
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+import heapq
+import itertools
+import json
+import os
+import threading
+import time
+from concurrent.futures import Future, InvalidStateError
+
+from .ast import format_prompt_key, prompt_key
+from .blob_store import content_key
+from .config import Config
+from .log import Log
+from .token_budget import estimate_tokens
+
+# Latency estimate for a prompt group never seen before: a fixed round trip plus a cost per prompt token.
+_BASE_SECONDS = 2.0
+_SECONDS_PER_TOKEN = 0.002
+# Weight of the newest observation in the smoothed per-prompt latency.
+_HISTORY_SMOOTHING = 0.5
+
+
+class LatencyHistory:
+    """Smoothed latency of every prompt group seen in earlier runs, persisted as JSON when ``path`` is set."""
+
+    def __init__(self, path=None):
+        self.path = path
+        self._lock = threading.Lock()
+        self._latencies = {}
+        if path and os.path.exists(path):
+            try:
+                with open(path, encoding="utf-8") as file:
+                    self._latencies = json.load(file)
+            except (OSError, ValueError) as e:
+                Log.logger.warning(f"Ignoring unreadable latency history {path}: {e}")
+
+    @staticmethod
+    def key(filepath: str, prompt_names) -> str:
+        return content_key(os.path.abspath(filepath), *prompt_names)
+
+    def get(self, key: str) -> float | None:
+        return self._latencies.get(key)
+
+    def record(self, key: str, seconds: float) -> None:
+        with self._lock:
+            previous = self._latencies.get(key)
+            if previous is not None:
+                seconds = _HISTORY_SMOOTHING * seconds + (1 - _HISTORY_SMOOTHING) * previous
+            self._latencies[key] = seconds
+
+    def save(self) -> None:
+        if not self.path:
+            return
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        temp_path = self.path + ".tmp"
+        with self._lock, open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(self._latencies, file)
+        os.replace(temp_path, self.path)
+
+
+def estimate_seconds(task, group, history) -> float:
+    """Expected latency of one prompt group: its recorded latency, or a guess from the prompt size."""
+
+    recorded = history.get(history.key(task.filepath, group))
+    if recorded is not None:
+        return recorded
+    # Only the prompt text itself; loading lazy context variables just to rank prompts would defeat them.
+    tokens = sum(estimate_tokens(task.prompts[name], Config.Model) for name in group)
+    return _BASE_SECONDS + tokens * _SECONDS_PER_TOKEN
+
+
+def group_dependencies(task, groups) -> list[set[int]]:
+    """For every group, the indexes of the groups that must be written before it runs.
+
+    Groups follow AST order. Besides prompt dependencies, prompts writing (or, for output targets, reading)
+    the same output tag keep their declaration order. Tasks without prompt_dependencies run sequentially.
+    """
+
+    dependencies = getattr(task, "prompt_dependencies", None)
+    if dependencies is None:
+        return [{index - 1} if index else set() for index in range(len(groups))]
+
+    group_of = {name: index for index, group in enumerate(groups) for name in group}
+    output_targets = getattr(task, "prompt_output_targets", {})
+    last_writer = {}
+    result = []
+    for index, group in enumerate(groups):
+        waits = set()
+        for name in group:
+            waits.update(group_of[dep] for dep in dependencies.get(name, ()) if dep in group_of)
+            tag = output_targets.get(name) or (name if name in task.prompt_outputs_tags else None)
+            if tag is not None:
+                if tag in last_writer:
+                    waits.add(last_writer[tag])
+                last_writer[tag] = index
+        waits.discard(index)
+        result.append(waits)
+    return result
+
+
+def critical_path_ranks(durations, dependencies) -> list[float]:
+    """Length of the longest chain (in estimated seconds) starting at each group.
+
+    ``dependencies[i]`` holds the indexes group ``i`` waits for; they must form a DAG.
+    """
+
+    ranks = list(durations)
+    for index in reversed(_topological_order(dependencies)):
+        for dependency in dependencies[index]:
+            ranks[dependency] = max(ranks[dependency], durations[dependency] + ranks[index])
+    return ranks
+
+
+def critical_path(durations, dependencies) -> list[int]:
+    """Indexes of the groups on the longest chain, in execution order."""
+
+    if not durations:
+        return []
+    ranks = critical_path_ranks(durations, dependencies)
+    dependents = _dependents(dependencies)
+    roots = [index for index, waits in enumerate(dependencies) if not waits]
+    path = [max(roots, key=ranks.__getitem__)]
+    while dependents[path[-1]]:
+        path.append(max(dependents[path[-1]], key=ranks.__getitem__))
+    return path
+
+
+def execution_layers(dependencies) -> list[list[int]]:
+    """Groups in layers that could run in parallel: each layer only waits for earlier layers."""
+
+    waiting = [len(waits) for waits in dependencies]
+    dependents = _dependents(dependencies)
+    layers = []
+    current_layer = [index for index, count in enumerate(waiting) if count == 0]
+    while current_layer:
+        layers.append(current_layer)
+        next_layer = []
+        for index in current_layer:
+            for dependent in dependents[index]:
+                waiting[dependent] -= 1
+                if waiting[dependent] == 0:
+                    next_layer.append(dependent)
+        current_layer = next_layer
+    return layers
+
+
+def simulate_run_seconds(durations, dependencies, workers) -> float:
+    """Predicted wall-clock time of running the groups on ``workers`` slots, critical path first."""
+
+    ranks = critical_path_ranks(durations, dependencies)
+    waiting = [len(waits) for waits in dependencies]
+    dependents = _dependents(dependencies)
+    ready = [(-ranks[index], index) for index, count in enumerate(waiting) if count == 0]
+    heapq.heapify(ready)
+    running = []
+    now = 0.0
+    while ready or running:
+        while ready and len(running) < max(1, workers):
+            _, index = heapq.heappop(ready)
+            heapq.heappush(running, (now + durations[index], index))
+        now, index = heapq.heappop(running)
+        for dependent in dependents[index]:
+            waiting[dependent] -= 1
+            if waiting[dependent] == 0:
+                heapq.heappush(ready, (-ranks[dependent], dependent))
+    return now
+
+
+def _dependents(dependencies):
+    dependents = [[] for _ in dependencies]
+    for index, waits in enumerate(dependencies):
+        for dependency in waits:
+            dependents[dependency].append(index)
+    return dependents
+
+
+def _topological_order(dependencies):
+    return [index for layer in execution_layers(dependencies) for index in layer]
+
+
+class _FilePlan:
+    __slots__ = ("task", "groups", "ranks", "waiting", "dependents", "remaining", "future", "failed")
+
+    def __init__(self, task, groups, durations, dependencies, future):
+        self.task = task
+        self.groups = groups
+        self.ranks = critical_path_ranks(durations, dependencies)
+        self.waiting = [len(waits) for waits in dependencies]
+        self.dependents = _dependents(dependencies)
+        self.remaining = len(groups)
+        self.future = future
+        self.failed = False
+
+
+class PromptScheduler:
+    """Runs the prompt groups of many files on a thread pool, longest remaining dependency chain first.
+
+    Each file is planned by ``plan(task)`` (its prompt groups in AST order), then every group whose
+    dependencies are written becomes ready. A free worker always takes the ready group with the longest
+    estimated chain still ahead of it, across all files, so deep chains are not queued behind many
+    independent leaf prompts. ``run_group(task, group)`` executes one group; latencies are recorded
+    in ``history`` for later runs.
+
+    Groups referencing {file::Prompt} also wait for that prompt when its file is part of the run. Once
+    finish_input() is called, references to files that were never added no longer block; if the
+    referenced file fails, the referencing file fails too.
+    """
+
+    def __init__(self, pool, run, plan, run_group, history):
+        self._pool = pool
+        self._run = run
+        self._plan = plan
+        self._run_group = run_group
+        self._history = history
+        self._lock = threading.Lock()
+        self._ready = []
+        self._sequence = itertools.count()
+        self._files = set()
+        self._planned = {}
+        self._failed = set()
+        self._written = set()
+        self._waiters = {}
+        self._input_done = False
+
+    def add(self, task, on_parked=None) -> Future:
+        """Schedule every prompt of ``task``; the returned Future completes once the whole file is written.
+
+        ``on_parked()`` is called once the file is planned if it waits for a prompt of a file that has not
+        been added yet: it cannot finish before more files are added, so callers bounding the files in
+        progress should not count it.
+        """
+
+        future = Future()
+        future.set_running_or_notify_cancel()
+        with self._lock:
+            self._files.add(os.path.abspath(task.filepath))
+        self._pool.submit(self._plan_file, task, future, on_parked)
+        return future
+
+    def finish_input(self) -> None:
+        """No more files will be added: stop waiting for prompts of files that are not in the run."""
+
+        with self._lock:
+            self._input_done = True
+            ready = self._release([key for key in self._waiters if key[0] not in self._files])
+        self._push(ready)
+
+    def _plan_file(self, task, future, on_parked=None):
+        try:
+            self._plan_file_groups(task, future, on_parked)
+        except Exception as e:
+            # An unexpected error must fail the file; a Future that never completes hangs the run.
+            _set_failures([(future, e)])
+
+    def _plan_file_groups(self, task, future, on_parked):
+        path = os.path.abspath(task.filepath)
+        failures = []
+        parked = False
+        try:
+            groups = self._plan(task)
+            durations = [estimate_seconds(task, group, self._history) for group in groups]
+            plan = _FilePlan(task, groups, durations, group_dependencies(task, groups), future)
+        except Exception as e:
+            with self._lock:
+                failures.append((future, e))
+                self._fail_file(path, failures)
+            _set_failures(failures)
+            return
+
+        external = getattr(task, "prompt_external_dependencies", None) or {}
+        with self._lock:
+            self._planned[path] = {name for group in groups for name in group}
+            for index, group in enumerate(groups):
+                for key in {key for name in group for key in external.get(name, ())}:
+                    if key[0] in self._failed:
+                        self._fail(plan, _dependency_failed(task, group, key), failures)
+                    elif self._is_pending(key):
+                        plan.waiting[index] += 1
+                        self._waiters.setdefault(key, []).append((plan, index))
+                        parked = parked or key[0] not in self._files
+            # Prompts other files wait for but this file does not write are read from the file as it is.
+            ready = self._release(
+                [key for key in self._waiters if key[0] == path and key[1] not in self._planned[path]]
+            )
+            if not plan.failed:
+                ready += [(plan, index) for index, waiting in enumerate(plan.waiting) if waiting == 0]
+        _set_failures(failures)
+        if parked and on_parked is not None:
+            on_parked()
+        if not groups:
+            future.set_result(None)
+            return
+        Log.logger.debug(f"Critical path of {task.filepath}: ~{max(plan.ranks):.1f}s over {len(groups)} groups")
+        self._push(ready)
+
+    def _is_pending(self, key) -> bool:
+        # Under self._lock: whether a {file::Prompt} dependency still has to be written in this run.
+        if key in self._written:
+            return False
+        if key[0] in self._planned:
+            return key[1] in self._planned[key[0]]
+        return key[0] in self._files or not self._input_done
+
+    def _release(self, keys):
+        # Under self._lock: stop waiting for ``keys``; returns the groups that became ready.
+        ready = []
+        for key in keys:
+            for plan, index in self._waiters.pop(key, []):
+                plan.waiting[index] -= 1
+                if plan.waiting[index] == 0 and not plan.failed:
+                    ready.append((plan, index))
+        return ready
+
+    def _fail(self, plan, error, failures):
+        # Under self._lock: abandon ``plan``, and every file waiting for one of its prompts.
+        if plan.failed:
+            return
+        plan.failed = True
+        failures.append((plan.future, error))
+        self._fail_file(os.path.abspath(plan.task.filepath), failures)
+
+    def _fail_file(self, path, failures):
+        self._failed.add(path)
+        for key in [key for key in self._waiters if key[0] == path and key not in self._written]:
+            for waiter, index in self._waiters.pop(key):
+                self._fail(waiter, _dependency_failed(waiter.task, waiter.groups[index], key), failures)
+
+    def _push(self, items):
+        with self._lock:
+            for plan, index in items:
+                heapq.heappush(self._ready, (-plan.ranks[index], next(self._sequence), plan, index))
+        for _ in items:
+            if self._run.is_cancelled():
+                return
+            try:
+                self._pool.submit(self._run_next)
+            except RuntimeError:
+                # The pool was shut down by a cancelled run.
+                return
+
+    def _run_next(self):
+        with self._lock:
+            if not self._ready:
+                return
+            _, _, plan, index = heapq.heappop(self._ready)
+        if plan.failed or self._run.is_cancelled():
+            return
+        try:
+            self._run_plan_group(plan, index)
+        except Exception as e:
+            # The rest of the file is abandoned, as when its prompts ran one by one.
+            failures = []
+            with self._lock:
+                self._fail(plan, e, failures)
+            _set_failures(failures)
+
+    def _run_plan_group(self, plan, index):
+        group = plan.groups[index]
+        started = time.monotonic()
+        self._run_group(plan.task, group)
+        if self._run.is_cancelled():
+            return
+        self._history.record(self._history.key(plan.task.filepath, group), time.monotonic() - started)
+
+        with self._lock:
+            plan.remaining -= 1
+            finished = plan.remaining == 0
+            ready = []
+            for dependent in plan.dependents[index]:
+                plan.waiting[dependent] -= 1
+                if plan.waiting[dependent] == 0:
+                    ready.append((plan, dependent))
+            keys = [prompt_key(plan.task.filepath, name) for name in group]
+            self._written.update(keys)
+            ready += self._release(keys)
+        if finished:
+            plan.future.set_result(None)
+        self._push(ready)
+
+
+def _dependency_failed(task, group, key):
+    return ValueError(
+        f"{', '.join(group)} in {os.path.relpath(task.filepath)} depends on {format_prompt_key(key)}, which failed."
+    )
+
+
+def _set_failures(failures):
+    for future, error in failures:
+        try:
+            future.set_exception(error)
+        except InvalidStateError:
+            # Already completed, e.g. the error came after the file's last group was written.
+            pass
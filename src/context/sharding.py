@@ -0,0 +1,209 @@
+#    Copyright 2023 Robert Mazurowski
+
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+import hashlib
+import json
+import os
+import re
+
+from .ast import CROSS_FILE_PATTERN
+from .config import Config
+from .file_imports import check_file_import, parse_dir_import
+from .file_manager import glob_file_paths
+from .log import Log
+
+_MANIFEST_VERSION = 1
+_CROSS_FILE_REFERENCE = re.compile(CROSS_FILE_PATTERN.pattern.encode())
+# Manifests at the default path, written by shards run earlier in the same checkout.
+_DEFAULT_MANIFEST = re.compile(
+    re.escape(Config.Default_Shard_Manifest_Path).replace(r"\{index\}", r"\d+").replace(r"\{count\}", r"\d+")
+)
+
+
+def parse_shard(spec: str) -> tuple[int, int]:
+    """Parse a --shard value "K/N" into (K, N), with 1 <= K <= N."""
+
+    try:
+        index, count = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"--shard expects K/N, e.g. 1/4, got '{spec}'.") from None
+    if count < 1 or not 1 <= index <= count:
+        raise ValueError(f"--shard {spec}: K must be between 1 and N.")
+    return index, count
+
+
+def _name(path):
+    return os.path.relpath(path).replace(os.sep, "/")
+
+
+def _sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for chunk in iter(lambda: file.read(1 << 20), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class Shard:
+    """Shard K of N of a run: a deterministic subset of the discovered files, and its result manifest.
+
+    Files are grouped with every file they depend on or that depends on them: context imports (<import>,
+    <import:X>, <file:X>, <dir:X>) and {file::Prompt} references. A group goes to the shard given by a
+    sha256 of its first path (relative to the working directory), so every CI job computes the same
+    split without talking to the others, and a file always sees the generated outputs it depends on.
+    """
+
+    def __init__(self, index: int, count: int):
+        self.index = index
+        self.count = count
+        self.files = []
+        self.tree = None
+
+    def select(self, paths, context_index, manifest_paths=()) -> list:
+        """The paths of this shard, in discovery order; ``context_index`` supplies each file's imports.
+
+        Shard manifests are not part of the run: those at the default path and every path in
+        ``manifest_paths`` (None entries are skipped). Manifests written to other custom paths inside
+        the tree must be listed there, or every shard would hash a different file list.
+        """
+
+        manifests = {os.path.abspath(path) for path in manifest_paths if path}
+        paths = [
+            path
+            for path in paths
+            if os.path.abspath(path) not in manifests and not _DEFAULT_MANIFEST.fullmatch(os.path.basename(path))
+        ]
+        names = {os.path.abspath(path): _name(path) for path in paths}
+        parent = {name: name for name in names.values()}
+
+        def root(name):
+            while parent[name] != name:
+                parent[name] = parent[parent[name]]
+                name = parent[name]
+            return name
+
+        for path, name in names.items():
+            for dependency in self._dependencies(path, context_index):
+                if dependency in names:
+                    first, second = sorted((root(name), root(names[dependency])))
+                    parent[second] = first
+
+        self.tree = hashlib.sha256("\n".join(sorted(parent)).encode()).hexdigest()
+        self.files = [path for path in paths if self._shard_of(root(names[os.path.abspath(path)])) == self.index]
+        Log.logger.debug(f"Shard {self.index}/{self.count}: {len(self.files)} of {len(paths)} files")
+        return self.files
+
+    def _shard_of(self, name):
+        return int(hashlib.sha256(name.encode()).hexdigest(), 16) % self.count + 1
+
+    @staticmethod
+    def _dependencies(path, context_index):
+        """Absolute paths of the files ``path`` imports or references; unreadable declarations are skipped."""
+
+        dependencies = set()
+        try:
+            entry = context_index.entry(path)
+            with open(path, "rb") as file:
+                content = file.read()
+        except (OSError, UnicodeDecodeError, ValueError):
+            return dependencies
+        dependencies.update(entry["imports"])
+        dependencies.update(import_path for _, import_path in entry["specific_imports"])
+        for _, spec in entry["files"]:
+            try:
+                dependencies.add(check_file_import(spec)[0])
+            except ValueError:
+                continue
+        for _, spec in entry["dirs"]:
+            try:
+                dependencies.update(glob_file_paths(parse_dir_import(spec)[0]))
+            except ValueError:
+                continue
+        dependencies.update(match[0].decode(errors="replace") for match in _CROSS_FILE_REFERENCE.findall(content))
+        return {os.path.abspath(dependency) for dependency in dependencies}
+
+    def write_manifest(self, path: str, summary) -> None:
+        """Write the result manifest: this shard's files with their sha256 after the run, and its prompt counts."""
+
+        manifest = {
+            "version": _MANIFEST_VERSION,
+            "shard": self.index,
+            "count": self.count,
+            "tree": self.tree,
+            "files": {_name(file): _sha256(file) for file in self.files},
+            "prompts": {
+                "completed": summary.completed,
+                "failed": summary.failed,
+                "cancelled": sum(len(names) for names in summary.cancelled.values()),
+            },
+        }
+        temp_path = path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            json.dump(manifest, file, indent=2, sort_keys=True)
+            file.write("\n")
+        os.replace(temp_path, path)
+        Log.logger.debug(f"Wrote the manifest of shard {self.index}/{self.count} to {path}")
+
+
+def verify_manifests(manifest_paths) -> list[str]:
+    """Check the manifests of a sharded run after its outputs were merged; returns the problems found.
+
+    Every shard 1..N must be present exactly once, computed from the same file list, without failed or
+    cancelled prompts, and every file must belong to one shard and hold the content its shard wrote.
+    """
+
+    problems = []
+    manifests = []
+    for path in manifest_paths:
+        try:
+            with open(path, encoding="utf-8") as file:
+                manifest = json.load(file)
+        except (OSError, ValueError) as e:
+            problems.append(f"{path}: unreadable manifest: {e}")
+            continue
+        if manifest.get("version") != _MANIFEST_VERSION:
+            problems.append(f"{path}: unsupported manifest version {manifest.get('version')!r}")
+            continue
+        manifests.append((path, manifest))
+    if not manifests:
+        return problems or ["No shard manifests to verify."]
+
+    count = manifests[0][1]["count"]
+    tree = manifests[0][1]["tree"]
+    shards = {}
+    owners = {}
+    for path, manifest in manifests:
+        label = f"{path} (shard {manifest['shard']}/{manifest['count']})"
+        if manifest["count"] != count or manifest["tree"] != tree:
+            problems.append(f"{label}: sharded from a different run than {manifests[0][0]}")
+        if manifest["shard"] in shards:
+            problems.append(f"{label}: shard {manifest['shard']} is also in {shards[manifest['shard']]}")
+        shards[manifest["shard"]] = path
+        prompts = manifest["prompts"]
+        if prompts["failed"] or prompts["cancelled"]:
+            problems.append(f"{label}: {prompts['failed']} prompts failed and {prompts['cancelled']} were cancelled")
+        for name, digest in sorted(manifest["files"].items()):
+            if name in owners:
+                problems.append(f"{label}: {name} also belongs to {owners[name]}")
+            owners[name] = path
+            try:
+                current = _sha256(name)
+            except OSError:
+                problems.append(f"{label}: {name} is missing")
+                continue
+            if current != digest:
+                problems.append(f"{label}: {name} differs from the output of its shard")
+    missing = sorted(set(range(1, count + 1)) - set(shards))
+    if missing:
+        problems.append(f"Missing manifests for shards {', '.join(map(str, missing))} of {count}")
+    return problems
@@ -0,0 +1,87 @@
+#    Copyright 2023 Robert Mazurowski
+
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+import os
+from collections.abc import Mapping
+
+from .lazy_context import ContextLoadError
+
+
+class SourceFile:
+    """A parsed file, remembered by path and stat so tag text can be re-read from it later.
+
+    The file is opened again rather than kept mapped: write_file_atomically replaces files with
+    os.replace, which fails on Windows while the old file is mapped.
+    """
+
+    __slots__ = ("path", "mtime_ns", "size")
+
+    def __init__(self, path: str):
+        stat = os.stat(path)
+        self.path = path
+        self.mtime_ns = stat.st_mtime_ns
+        self.size = stat.st_size
+
+    def read(self) -> str:
+        stat = os.stat(self.path)
+        if (stat.st_mtime_ns, stat.st_size) != (self.mtime_ns, self.size):
+            raise ContextLoadError(f"{os.path.relpath(self.path)} changed after it was parsed; run Context again.")
+        with open(self.path) as file:
+            return file.read()
+
+
+class SpanDict(Mapping):
+    """{name: stripped text} backed by (start, end) offsets into a SourceFile.
+
+    Only the offsets are kept after parsing. The texts are read from the file on first access (or by
+    materialize) in a single pass, which must happen before the file is rewritten.
+    """
+
+    __slots__ = ("_source", "_spans", "_texts")
+
+    def __init__(self, source: SourceFile):
+        self._source = source
+        self._spans = {}
+        self._texts = None
+
+    def add(self, name: str, start: int, end: int) -> None:
+        self._spans[name] = (start, end)
+
+    @property
+    def is_materialized(self) -> bool:
+        return self._texts is not None
+
+    def materialize(self, content: str | None = None) -> None:
+        if self._texts is None:
+            content = self._source.read() if content is None else content
+            self._texts = {name: content[start:end].strip() for name, (start, end) in self._spans.items()}
+
+    def __getitem__(self, name):
+        if name not in self._spans:
+            raise KeyError(name)
+        self.materialize()
+        return self._texts[name]
+
+    def __iter__(self):
+        return iter(self._spans)
+
+    def __len__(self):
+        return len(self._spans)
+
+    def __contains__(self, name):
+        return name in self._spans
+
+    def __repr__(self):
+        if self._texts is not None:
+            return repr(self._texts)
+        return "{" + ", ".join(f"{name!r}: <span {start}:{end}>" for name, (start, end) in self._spans.items()) + "}"
@@ -11,13 +11,42 @@
 #    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 #    See the License for the specific language governing permissions and
 #    limitations under the License.
+import errno
+import functools
 import os
 import re
 
+from .ast import prompt_key
+from .blob_store import blob_store
+from .config import Config
+from .context_index import ContextIndex
+from .file_imports import check_file_import, import_paths, parse_dir_import, read_dir_import, read_file_import
+from .import_graph import ImportGraph
+from .lazy_context import LazyContextDict
 from .log import Log
+from .spans import SourceFile, SpanDict
 
 
 class Task:
+    # Slots keep per-Task overhead small for runs over tens of thousands of files.
+    __slots__ = (
+        "filepath",
+        "global_context",
+        "context_dict",
+        "prompts",
+        "prompt_outputs",
+        "prompt_outputs_tags",
+        "prompt_output_targets",
+        "context_sources",
+        "source",
+        "inline_context",
+        "prompt_order",
+        "prompt_layers",
+        "prompt_dependencies",
+        "prompt_external_dependencies",
+        "context_writers",
+    )
+
     def __init__(
         self,
         filepath,
@@ -27,6 +56,10 @@ class Task:
         prompt_outputs,
         prompt_output_tags,
         prompt_output_targets=None,
+        context_sources=None,
+        source=None,
+        inline_context=None,
+        context_writers=None,
     ):
         self.filepath = filepath
         self.global_context = global_context
@@ -37,6 +70,29 @@ class Task:
         # Optional: map prompt name -> existing output variable/tag name to write into.
         # Example prompt tag: <prompt:C->A> ... <prompt:C->A/> means prompt C writes into <A>...</A/>.
         self.prompt_output_targets = prompt_output_targets or {}
+        # Where each context variable came from: "file", "import" or "context" (used to prioritize trimming).
+        self.context_sources = context_sources or {}
+        # Parsed tag texts (prompts, output tags, inline context) are SpanDicts over this file.
+        self.source = source
+        self.inline_context = inline_context
+        # Context variable -> prompt keys of the prompts writing the files its <file:>/<dir:> import reads.
+        self.context_writers = context_writers or {}
+        # Set by ast.build_prompt_order.
+        self.prompt_order = None
+        self.prompt_layers = None
+        self.prompt_dependencies = None
+        self.prompt_external_dependencies = None
+
+    def materialize(self):
+        """Read every span-backed text of the Task from its file in one pass, before the file is rewritten."""
+
+        if self.source is None:
+            return
+        spans = [d for d in (self.prompts, self.prompt_outputs_tags, self.inline_context) if isinstance(d, SpanDict)]
+        if any(not d.is_materialized for d in spans):
+            content = self.source.read()
+            for d in spans:
+                d.materialize(content)
 
     def __str__(self):
         return (
@@ -56,6 +112,7 @@ regexPatterns = {
     "Import_Context_Variables": r"(?s)<import>(.*?)<import/>",
     "Import_Specific_Context_Variable": r"(?s)<import:(\w+)>(.*?)<import:\1/>",
     "Import_File_Context_Variables": r"(?s)<file:(\w+)>(.*?)<file:\1/>",
+    "Import_Directory_Context_Variables": r"(?s)<dir:(\w+)>(.*?)<dir:\1/>",
     "Context_Variables": r"(?s)<context:(\w+)>(.*?)<context:\1/>",
     # Supports optional output-target syntax: <prompt:C->A> ... <prompt:C->A/>
     "Prompts": r"(?s)<prompt:([a-zA-Z0-9_]+(?:->\w+)?)>(.*?)<prompt:\1/>",
@@ -64,33 +121,92 @@ regexPatterns = {
 }
 
 
-def __tag_parsing_process(path):
+def __declare_lazy_file(context_dict, var_name, spec):
+    # Validate the import now (modifier and arguments, file exists) but defer reading until a prompt uses it.
+    file_path, _, _ = check_file_import(spec)
+    if not os.path.isfile(file_path):
+        raise FileNotFoundError(errno.ENOENT, os.strerror(errno.ENOENT), file_path)
+    context_dict.set_lazy(
+        var_name,
+        functools.partial(read_file_import, spec),
+        f"<file:{var_name}> {spec.strip()}",
+        paths=(os.path.abspath(file_path),),
+    )
+
+
+def __context_writers(path, context_dict, prompt_texts, index):
+    """{variable: prompt keys} for the variables used by a prompt whose imported files have prompts themselves.
+
+    Those files are rewritten when their prompts run, so the scheduler runs the prompts using such a
+    variable after them (ast._external_dependencies) and the value is read once the writes are done.
+    """
+
+    own_path = os.path.abspath(path)
+    writers = {}
+    for var_name in context_dict:
+        if not any("{" + var_name + "}" in text for text in prompt_texts):
+            continue
+        keys = []
+        for file_path in context_dict.paths(var_name):
+            if file_path == own_path:
+                continue
+            try:
+                keys += [prompt_key(file_path, prompt_name) for prompt_name in index.entry(file_path)["prompts"]]
+            except (OSError, UnicodeDecodeError):
+                continue
+        if keys:
+            writers[var_name] = keys
+    return writers
+
+
+def __warn_unused_imports(path, prompt_texts, context_sources):
+    # Only prompt bodies count: a {NAME} in the surrounding code or an output tag is never substituted.
+    for var_name, source in context_sources.items():
+        placeholder = "{" + var_name + "}"
+        if source in ("file", "import") and not any(placeholder in text for text in prompt_texts):
+            Log.logger.warning(
+                f"{os.path.relpath(path)}: imported context variable '{var_name}' is not referenced by any prompt."
+            )
+
+
+def __tag_parsing_process(path, import_graph=None):
     with open(path) as file:
         content = file.read()
 
     # Fail fast on unknown tag prefixes of the form <prefix:...>.
     # Output tags are of the form <TagName>...</TagName/> (no colon) and are allowed.
-    allowed_colon_prefixes = {"context", "prompt", "import", "file"}
+    allowed_colon_prefixes = {"context", "prompt", "import", "file", "dir"}
     for prefix in re.findall(r"<(\w+):", content):
         if prefix not in allowed_colon_prefixes:
             raise ValueError(
                 f"Unrecognized tag prefix '{prefix}:' in file {os.path.relpath(path)}. "
-                "Supported prefixes are: context, prompt, import, file."
+                "Supported prefixes are: context, prompt, import, file, dir."
             )
 
     # Initialize error collection
     errors = []
-
-    # Create context_dict, prompts, prompt_outputs, prompt_outputs_tags, and prompt_output_targets
-    context_dict = {}
-    prompts = {}
+    if import_graph is None:
+        import_graph = ImportGraph(regexPatterns)
+
+    # Create context_dict, prompts, prompt_outputs, prompt_outputs_tags, and prompt_output_targets.
+    # Prompts, output tags and inline context only keep offsets into the file; prompt_texts is the
+    # parse-time copy used for validation and dropped when parsing finishes.
+    source = SourceFile(path)
+    context_dict = LazyContextDict()
+    inline_context = SpanDict(source)
+    prompts = SpanDict(source)
+    prompt_texts = {}
     prompt_outputs = []
-    prompt_outputs_tags = {}
+    prompt_outputs_tags = SpanDict(source)
     prompt_output_targets = {}
+    context_sources = {}
 
     # Iterating over the regex patterns
     for tag, pattern in regexPatterns.items():
-        matches = re.findall(pattern, content)  # Use content for all matches
+        compiled = re.compile(pattern)
+        # Same shape as re.findall (tuples for multi-group patterns), with the match objects kept for spans.
+        found = list(compiled.finditer(content))
+        matches = [m.groups() if compiled.groups > 1 else m.group(compiled.groups) for m in found]
 
         if tag == "Global" and len(matches) > 1:
             error_msg = f"{tag}: Multiple Global tags found in file {path}"
@@ -105,8 +221,27 @@ def __tag_parsing_process(path):
                     if varName in context_dict:
                         raise ValueError(f"{tag}: File'{varName}' already declared in scope.")
 
-                    with open(filePath.strip()) as file:
-                        context_dict[varName] = file.read()
+                    __declare_lazy_file(context_dict, varName, filePath)
+                    context_sources[varName] = "file"
+                except Exception as e:
+                    errors.append(f"{os.path.relpath(path)}: {str(e)}")
+                    Log.logger.error(f"Error processing {tag} in {path}: {str(e)}")
+
+        if tag == "Import_Directory_Context_Variables":
+            for match in matches:
+                try:
+                    varName, spec = match
+                    if varName in context_dict:
+                        raise ValueError(f"{tag}: Directory '{varName}' already declared in scope.")
+
+                    parse_dir_import(spec)
+                    context_dict.set_lazy(
+                        varName,
+                        functools.partial(read_dir_import, spec),
+                        f"<dir:{varName}> {spec.strip()}",
+                        paths=import_paths(spec, directory=True),
+                    )
+                    context_sources[varName] = "file"
                 except Exception as e:
                     errors.append(f"{os.path.relpath(path)}: {str(e)}")
                     Log.logger.error(f"Error processing {tag} in {path}: {str(e)}")
@@ -115,65 +250,63 @@ def __tag_parsing_process(path):
             for match in matches:
                 import_path = match.strip() if matches else None
 
-                # Parse the file at import_path for context variables and add them to context_dict
+                # Add every context variable the file at import_path exports, including its own imports.
                 Log.logger.debug("IMPORT CONTEXT: -----------" + import_path)
-                with open(import_path) as file:
-                    import_content = file.read()
-                    import_context_variables = re.findall(regexPatterns["Context_Variables"], import_content)
-                    for import_varName, import_varContent in import_context_variables:
-                        try:
-                            if import_varName in context_dict:
-                                raise ValueError(
-                                    f"{tag}: Context variable '{import_varName}' from "
-                                    f"'{import_path}' already exists in scope."
-                                )
-                            context_dict[import_varName] = import_varContent.strip()
-                        except Exception as e:
-                            errors.append(f"{os.path.relpath(path)}: {str(e)}")
-                            Log.logger.error(f"Error processing {tag} in {path}: {str(e)}")
+                for import_varName, import_value in import_graph.exports(import_path).items():
+                    try:
+                        if import_varName in context_dict:
+                            raise ValueError(
+                                f"{tag}: Context variable '{import_varName}' from "
+                                f"'{import_path}' already exists in scope."
+                            )
+                        context_dict[import_varName] = import_value
+                        context_sources[import_varName] = "import"
+                    except Exception as e:
+                        errors.append(f"{os.path.relpath(path)}: {str(e)}")
+                        Log.logger.error(f"Error processing {tag} in {path}: {str(e)}")
 
         if tag == "Import_Specific_Context_Variable":
             for match in matches:
                 varName = match[0]
                 import_path = match[1].strip()
 
-                # Parse the file at import_path for the specific context variable and add it to context_dict
+                # Resolve the variable through the import graph, following the imported file's own imports.
                 Log.logger.debug("IMPORT SPECIFIC CONTEXT: -----------" + import_path + "----" + varName)
-                with open(import_path) as file:
-                    import_content = file.read()
-                    import_context_variable = re.findall(
-                        f"(?s)<context:{varName}>(.*?)<context:{varName}/>",
-                        import_content,
+                if varName in context_dict:
+                    e = (
+                        f"{tag}: Context variable '{varName}' from '{import_path}' "
+                        f"already exists in scope of {path}."
                     )
-                    if varName in context_dict:
-                        e = (
-                            f"{tag}: Context variable '{varName}' from '{import_path}' "
-                            f"already exists in scope of {path}."
-                        )
-                        errors.append(f"{os.path.relpath(path)}: {str(e)}")
-                        Log.logger.error(f"Error processing {tag} in {path}: {str(e)}")
-                    if import_context_variable:
-                        context_dict[varName] = import_context_variable[0].strip()
-                    else:
-                        e = f"{tag}: Context variable '{varName}' does not exists in '{import_path}'."
-                        errors.append(f"{os.path.relpath(path)}: {str(e)}")
-                        Log.logger.error(f"Error processing {tag} in {path}: {str(e)}")
+                    errors.append(f"{os.path.relpath(path)}: {str(e)}")
+                    Log.logger.error(f"Error processing {tag} in {path}: {str(e)}")
+                exports = import_graph.exports(import_path)
+                if varName in exports:
+                    context_dict[varName] = exports[varName]
+                    context_sources[varName] = "import"
+                else:
+                    e = f"{tag}: Context variable '{varName}' does not exists in '{import_path}'."
+                    errors.append(f"{os.path.relpath(path)}: {str(e)}")
+                    Log.logger.error(f"Error processing {tag} in {path}: {str(e)}")
 
         elif tag == "Global":
             global_context = matches[0][0].strip() if matches else None
         elif tag == "Context_Variables":
-            for match in matches:
+            for match, found_match in zip(matches, found, strict=True):
                 try:
-                    varName, varContent = match
+                    varName, _ = match
                     if varName in context_dict:
                         raise ValueError(f"{tag}: Context variable '{varName}' already declared in file.")
-                    context_dict[varName] = varContent.strip()
+                    inline_context.add(varName, *found_match.span(2))
+                    context_dict.set_lazy(
+                        varName, functools.partial(inline_context.__getitem__, varName), f"<context:{varName}> {path}"
+                    )
+                    context_sources[varName] = "context"
                 except Exception as e:
                     errors.append(f"{os.path.relpath(path)}: {str(e)}")
                     Log.logger.error(f"Error processing {tag} in {path}: {str(e)}")
 
         elif tag == "Prompts":
-            for match in matches:
+            for match, found_match in zip(matches, found, strict=True):
                 try:
                     promptNameRaw, promptContent = match
 
@@ -189,27 +322,27 @@ def __tag_parsing_process(path):
                     if promptName in prompts:
                         raise ValueError(f"{tag}: Prompt '{promptName}' already declared in file.")
 
-                    prompts[promptName] = promptContent.strip()
+                    prompts.add(promptName, *found_match.span(2))
+                    prompt_texts[promptName] = promptContent.strip()
                 except Exception as e:
                     errors.append(f"{os.path.relpath(path)}: {str(e)}")
                     Log.logger.error(f"Error processing {tag} in {path}: {str(e)}")
         elif tag == "Prompt_Output_Tags":
-            for match in matches:
+            for match, found_match in zip(matches, found, strict=True):
                 try:
                     varName = match[0]
-                    tag_content = match[1]
 
                     if varName in context_dict:
                         raise ValueError(f"{tag}: Prompt output variable '{varName}' already declared in file.")
 
-                    prompt_outputs_tags[varName] = tag_content.strip()
+                    prompt_outputs_tags.add(varName, *found_match.span(2))
                 except Exception as e:
                     errors.append(f"{os.path.relpath(path)}: {str(e)}")
                     Log.logger.error(f"Error processing {tag} in {path}: {str(e)}")
 
     # After processing all other tags, remove all prompts from the content
     content_without_prompts = content
-    for prompt_name, prompt_content in prompts.items():
+    for prompt_name, prompt_content in prompt_texts.items():
         prompt = "<prompt:" + prompt_name + ">" + prompt_content + "<" + "<prompt:" + prompt_name + "/>"
         content_without_prompts = content_without_prompts.replace(prompt, "")
     Log.logger.debug("Content without prompts:\n" + content_without_prompts)
@@ -224,7 +357,7 @@ def __tag_parsing_process(path):
         pattern = f"{{{re.escape(prompt_name)}}}"
         if re.search(pattern, content_without_prompts):
             Log.logger.debug(f"Found {prompt_name} in content_without_prompts")
-            if pattern not in prompts[prompt_name]:
+            if pattern not in prompt_texts[prompt_name]:
                 Log.logger.debug(f"Adding {prompt_name} to prompt_outputs")
                 prompt_outputs.append(prompt_name)
             else:
@@ -242,6 +375,9 @@ def __tag_parsing_process(path):
                 "but no such output tag exists in this file."
             )
 
+    __warn_unused_imports(path, prompt_texts.values(), context_sources)
+    context_writers = __context_writers(path, context_dict, prompt_texts.values(), import_graph.index)
+
     # A Task is only created if there are prompts in the file
     if len(prompts) > 0:
         task = Task(
@@ -252,6 +388,10 @@ def __tag_parsing_process(path):
             prompt_outputs,
             prompt_outputs_tags,
             prompt_output_targets,
+            context_sources,
+            source,
+            inline_context,
+            context_writers,
         )
     else:
         task = None
@@ -286,17 +426,37 @@ def parse_tags(file_paths, in_comment_signs):
     tasks = []
     errors = []
 
+    for _, task, file_errors in iter_parse_tags(file_paths):
+        if task is not None:
+            tasks.append(task)
+        errors.extend(file_errors)  # Collect errors from each file
+
+    return tasks, errors  # Return both tasks and collected errors
+
+
+def iter_parse_tags(file_paths):
+    """Parse files one at a time, yielding (path, task or None, errors of that file).
+
+    ``file_paths`` may be a lazy iterable, so parsing can start while files are still being discovered.
+    """
+
+    # Shared by all files so each imported file is read and resolved once per run.
+    index = ContextIndex(regexPatterns, Config.Index_Path)
+    import_graph = ImportGraph(regexPatterns, index)
+
     for path in file_paths:
         try:
-            task, file_errors = __tag_parsing_process(path)
-            if task is not None:
-                tasks.append(task)
-            if file_errors:
-                errors.extend(file_errors)  # Collect errors from each file
+            task, file_errors = __tag_parsing_process(path, import_graph)
         except Exception as e:  # Catch general exceptions to collect all errors
-            errors.append(f"{os.path.relpath(path)}: {e}")
+            task, file_errors = None, [f"{os.path.relpath(path)}: {e}"]
             Log.logger.error(f"Error processing file {path}: {e}", exc_info=True)  # Log with stack trace
-
-    return tasks, errors  # Return both tasks and collected errors
-
-    return tasks
+        yield path, task, file_errors
+
+    Log.logger.debug(
+        f"Context values: {len(blob_store)} unique ({blob_store.stored_chars} chars) "
+        f"for {blob_store.references} references"
+    )
+    try:
+        index.save()
+    except OSError as e:
+        Log.logger.warning(f"Could not save the context index to {index.path}: {e}")
@@ -0,0 +1,122 @@
+#    Copyright 2023 Robert Mazurowski
+
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+
+#        http://www.apache.org/licenses/LICENSE-2.0
+
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+import math
+
+from .config import Config
+
+# Context windows (in tokens) of the supported models; unknown models fall back to the default.
+MODEL_CONTEXT_WINDOWS = {
+    "openai/gpt-5.2": 400_000,
+    "openai/gpt-3.5-turbo": 16_385,
+}
+_DEFAULT_CONTEXT_WINDOW = 128_000
+
+# USD per million (input, output) tokens, used by --plan to estimate what a run costs.
+MODEL_PRICES = {
+    "openai/gpt-5.2": (1.75, 14.00),
+    "openai/gpt-3.5-turbo": (0.50, 1.50),
+}
+
+# Average characters per token. OpenAI tokenizers average ~4 for English and code; unknown models get a
+# more conservative figure so the estimate errs on the large side.
+_CHARS_PER_TOKEN = {"openai/": 4.0}
+_DEFAULT_CHARS_PER_TOKEN = 3.5
+
+TRIM_STRATEGIES = ("none", "head", "tail", "drop")
+
+# Lower numbers are trimmed first by the pre-flight budget check.
+VARIABLE_PRIORITIES = {"file": 0, "import": 1, "context": 2, "output": 3}
+
+_TRUNCATED_MARKER = "\n[... truncated to fit the token budget ...]\n"
+_OMITTED_MARKER = "[omitted to fit the token budget]"
+
+
+class PromptTooLargeError(ValueError):
+    """Raised before calling the provider when a prompt cannot fit the model's token budget."""
+
+    def __init__(self, message: str, tokens: int, budget: int):
+        super().__init__(message)
+        self.tokens = tokens
+        self.budget = budget
+
+
+def context_window(model: str) -> int:
+    return MODEL_CONTEXT_WINDOWS.get(model, _DEFAULT_CONTEXT_WINDOW)
+
+
+def chars_per_token(model: str) -> float:
+    return next(
+        (ratio for prefix, ratio in _CHARS_PER_TOKEN.items() if model.startswith(prefix)), _DEFAULT_CHARS_PER_TOKEN
+    )
+
+
+def estimate_tokens(text: str, model: str) -> int:
+    """Cheap token estimate from the character count; no tokenizer download or encoding pass."""
+
+    return math.ceil(len(text) / chars_per_token(model))
+
+
+def estimate_cost(model: str, input_tokens: int, output_tokens: int) -> float | None:
+    """Estimated USD cost of the tokens on ``model``; None when the model has no known price."""
+
+    if model not in MODEL_PRICES:
+        return None
+    input_price, output_price = MODEL_PRICES[model]
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+
+def prompt_token_budget(model: str) -> int:
+    """Tokens available to the input prompt: an explicit limit, or the window minus the output reserve."""
+
+    if Config.Max_Prompt_Tokens:
+        return Config.Max_Prompt_Tokens
+    return context_window(model) - Config.Output_Token_Reserve
+
+
+def fit_prompt(assemble, variables, priorities, budget, strategy, model):
+    """Assemble a prompt, trimming variables until its estimated size fits ``budget``.
+
+    assemble(variables) builds the prompt text from {name: content}. Variables are trimmed lowest
+    priority first (larger first within a priority). "head" keeps the beginning of a variable,
+    "tail" keeps its end and "drop" removes it entirely. Returns (prompt, trimmed variable names);
+    the prompt may still exceed the budget when trimming is disabled or not enough.
+    """
+
+    prompt = assemble(variables)
+    tokens = estimate_tokens(prompt, model)
+    if tokens <= budget or strategy == "none":
+        return prompt, []
+
+    trimmed = dict(variables)
+    changed = []
+    for name in sorted(
+        variables, key=lambda n: (priorities.get(n, VARIABLE_PRIORITIES["context"]), -len(variables[n]))
+    ):
+        content = trimmed[name]
+        if strategy == "drop":
+            trimmed[name] = _OMITTED_MARKER
+        else:
+            excess_chars = math.ceil((tokens - budget) * chars_per_token(model)) + len(_TRUNCATED_MARKER)
+            keep = max(0, len(content) - excess_chars)
+            if strategy == "head":
+                trimmed[name] = content[:keep] + _TRUNCATED_MARKER
+            else:
+                trimmed[name] = _TRUNCATED_MARKER + content[len(content) - keep :]
+        changed.append(name)
+
+        prompt = assemble(trimmed)
+        tokens = estimate_tokens(prompt, model)
+        if tokens <= budget:
+            break
+    return prompt, changed
@@ -0,0 +1,91 @@
+"""Memory benchmark for parsing large repositories.
+
+Generates N synthetic ContextLang files (global context, inline context, two prompts and an output tag
+each), parses them with parse_tags and reports the memory retained by the Tasks, before and after their
+span-backed texts are materialized.
+
+Usage:
+    python test/benchmarks/bench_parse_memory.py --files 50000
+"""
+
+from __future__ import annotations
+
+import argparse
+import gc
+import os
+import tempfile
+import time
+import tracemalloc
+
+from context.log import Log, configure_logger
+from context.tag_parser import parse_tags
+
+_TEMPLATE = """<context>
+Project-wide conventions for file {index}.
+<context/>
+<context:STYLE>
+{style}
+<context:STYLE/>
+<prompt:Model>
+Write a dataclass for record {index} following {{STYLE}}.
+{padding}
+<prompt:Model/>
+<prompt:Repo->Model>
+Add a repository class for {{Model}}.
+<prompt:Repo->Model/>
+<Model>
+pass
+<Model/>
+"""
+
+
+def _write_files(directory: str, count: int) -> list[str]:
+    style = "Use type hints and docstrings. " * 20
+    padding = "Keep the implementation small and well tested. " * 10
+    paths = []
+    for index in range(count):
+        path = os.path.join(directory, f"module_{index}.py")
+        with open(path, "w", encoding="utf-8") as file:
+            file.write(_TEMPLATE.format(index=index, style=style, padding=padding))
+        paths.append(path)
+    return paths
+
+
+def _mib(size: int) -> str:
+    return f"{size / 1024 / 1024:.1f} MiB"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--files", type=int, default=50_000)
+    args = parser.parse_args()
+
+    Log.logger = configure_logger(debug=False, logToFile=False)
+    with tempfile.TemporaryDirectory() as directory:
+        paths = _write_files(directory, args.files)
+        source_bytes = sum(os.path.getsize(p) for p in paths)
+
+        gc.collect()
+        tracemalloc.start()
+        started = time.perf_counter()
+        tasks, errors = parse_tags(paths, in_comment_signs=[])
+        elapsed = time.perf_counter() - started
+        gc.collect()
+        parsed, peak = tracemalloc.get_traced_memory()
+
+        for task in tasks:
+            task.materialize()
+        gc.collect()
+        materialized, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    print(f"files:                     {len(paths)} ({_mib(source_bytes)} of source)")
+    print(f"tasks / errors:            {len(tasks)} / {len(errors)}")
+    print(f"parse time:                {elapsed:.2f}s")
+    print(f"peak while parsing:        {_mib(peak)}")
+    print(f"retained after parsing:    {_mib(parsed)} ({parsed / max(1, len(tasks)):.0f} bytes per task)")
+    print(f"retained when materialized: {_mib(materialized)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,57 @@
+"""Benchmark for prompt dependency ordering (context.ast.build_prompt_order).
+
+Generates a random DAG of N prompts (each referencing up to --fan-in earlier prompts plus an unknown
+placeholder) and times building prompt_order and prompt_layers for it.
+
+Usage:
+    python test/benchmarks/bench_prompt_order.py --prompts 10000
+"""
+
+from __future__ import annotations
+
+import argparse
+import random
+import time
+from types import SimpleNamespace
+
+from context.ast import build_prompt_order
+from context.log import Log, configure_logger
+
+
+def _generate_prompts(count: int, fan_in: int, seed: int) -> dict[str, str]:
+    rng = random.Random(seed)
+    names = [f"Prompt{index}" for index in range(count)]
+    prompts = {}
+    for index, name in enumerate(names):
+        refs = rng.sample(names[:index], k=min(index, rng.randint(0, fan_in)))
+        placeholders = " ".join(f"{{{ref}}}" for ref in refs)
+        prompts[name] = f"Write part {index} of the module using {placeholders} and {{STYLE}}."
+    return prompts
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--prompts", type=int, default=10_000)
+    parser.add_argument("--fan-in", type=int, default=4)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    Log.logger = configure_logger(debug=False, logToFile=False)
+    prompts = _generate_prompts(args.prompts, args.fan_in, args.seed)
+    edges = sum(prompt.count("{Prompt") for prompt in prompts.values())
+
+    timings = []
+    for _ in range(args.repeat):
+        task = SimpleNamespace(filepath="generated.txt", prompts=prompts)
+        started = time.perf_counter()
+        build_prompt_order([task])
+        timings.append(time.perf_counter() - started)
+
+    print(f"prompts / dependencies: {len(prompts)} / {edges}")
+    print(f"layers:                 {len(task.prompt_layers)}")
+    print(f"best of {args.repeat}:              {min(timings) * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
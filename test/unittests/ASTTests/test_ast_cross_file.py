@@ -0,0 +1,214 @@
+"""Unit tests for {file::Prompt} references between files and the global prompt DAG (ast.PromptGraph)."""
+
+from __future__ import annotations
+
+import json
+import threading
+import time
+from pathlib import Path
+
+import pytest
+from conftest import write_file
+
+from context import code_generator
+from context.ast import PromptDependencyCycleError, PromptGraph, build_prompt_order, prompt_key
+from context.config import Config
+from context.tag_parser import parse_tags
+
+
+def _task(tmp_path: Path, name: str, content: str):
+    write_file(tmp_path, name, content)
+    tasks, errors = parse_tags([name], in_comment_signs=[])
+    assert errors == []
+    build_prompt_order(tasks)
+    return tasks[0]
+
+
+@pytest.fixture(autouse=True)
+def _in_tmp_path(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    # {file::Prompt} paths are relative to the working directory, like <import> paths.
+    monkeypatch.chdir(tmp_path)
+
+
+def test_build_prompt_order_records_cross_file_references(tmp_path: Path) -> None:
+    write_file(tmp_path, "models.py", "<prompt:Model>\nm\n<prompt:Model/>\n<Model>\n<Model/>\n")
+    task = _task(tmp_path, "repo.py", "<prompt:Repo>\nUse {models.py::Model}\n<prompt:Repo/>\n{Repo}\n")
+
+    assert task.prompt_external_dependencies == {"Repo": [prompt_key("models.py", "Model")]}
+    assert task.prompt_dependencies == {"Repo": []}
+
+
+def test_reference_to_a_missing_file_is_an_error(tmp_path: Path) -> None:
+    write_file(tmp_path, "repo.py", "<prompt:Repo>\nUse {missing.py::Model}\n<prompt:Repo/>\n{Repo}\n")
+    tasks, _ = parse_tags(["repo.py"], in_comment_signs=[])
+
+    with pytest.raises(ValueError, match="does not exist"):
+        build_prompt_order(tasks)
+
+
+def test_prompt_graph_rejects_cycles_across_files(tmp_path: Path) -> None:
+    write_file(tmp_path, "a.py", "")
+    write_file(tmp_path, "b.py", "")
+    a = _task(tmp_path, "a.py", "<prompt:A>\n{b.py::B}\n<prompt:A/>\n{A}\n")
+    b = _task(tmp_path, "b.py", "<prompt:B>\n{a.py::A}\n<prompt:B/>\n{B}\n")
+    graph = PromptGraph()
+    graph.add(a)
+
+    assert graph.unresolved() == [(prompt_key("a.py", "A"), prompt_key("b.py", "B"))]
+    with pytest.raises(PromptDependencyCycleError) as error:
+        graph.add(b)
+    assert sorted(error.value.cyclic_prompts) == ["a.py::A", "b.py::B"]
+    # The rejected file is left out, so the graph stays usable.
+    assert graph.layers() == [[prompt_key("a.py", "A")]]
+
+
+def test_prompt_graph_layers_span_files(tmp_path: Path) -> None:
+    write_file(tmp_path, "models.py", "<prompt:Model>\nm\n<prompt:Model/>\n<Model>\n<Model/>\n")
+    models = _task(tmp_path, "models.py", "<prompt:Model>\nm\n<prompt:Model/>\n<Model>\n<Model/>\n")
+    repo = _task(tmp_path, "repo.py", "<prompt:Repo>\n{models.py::Model}\n<prompt:Repo/>\n{Repo}\n")
+    api = _task(tmp_path, "api.py", "<prompt:Api>\n{repo.py::Repo}\n<prompt:Api/>\n<prompt:Doc>\nd\n<prompt:Doc/>\n")
+    graph = PromptGraph()
+    for task in (api, repo, models):
+        graph.add(task)
+
+    assert graph.layers() == [
+        [prompt_key("api.py", "Doc"), prompt_key("models.py", "Model")],
+        [prompt_key("repo.py", "Repo")],
+        [prompt_key("api.py", "Api")],
+    ]
+
+
+def test_generate_code_feeds_output_of_another_file_into_the_prompt(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    write_file(tmp_path, "models.py", "")
+    repo = _task(tmp_path, "repo.py", "<prompt:Repo>\nRepository for {models.py::Model}\n<prompt:Repo/>\n{Repo}\n")
+    models = _task(tmp_path, "models.py", "<prompt:Model>\nWrite a model\n<prompt:Model/>\n{Model}\n")
+    prompts = {}
+
+    def fake_generate(prompt: str, prompt_name: str) -> str:
+        prompts[prompt_name] = prompt
+        return json.dumps({"code": f"class {prompt_name}: pass"})
+
+    monkeypatch.setattr(code_generator, "generate_code_with_chat", fake_generate)
+
+    # repo.py comes first but must wait for models.py::Model.
+    summary = code_generator.generate_code([repo, models])
+
+    assert summary.completed == 2
+    assert "models.py::Model:\nclass Model: pass" in prompts["Repo"]
+    assert (tmp_path / "repo.py").read_text(encoding="utf-8").endswith("class Repo: pass\n")
+
+
+def test_reference_to_a_file_outside_the_run_reads_its_output_tag(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    write_file(tmp_path, "models.py", "<Model>\nclass Existing: pass\n<Model/>\n")
+    repo = _task(tmp_path, "repo.py", "<prompt:Repo>\nRepository for {models.py::Model}\n<prompt:Repo/>\n{Repo}\n")
+    prompts = {}
+
+    def fake_generate(prompt: str, prompt_name: str) -> str:
+        prompts[prompt_name] = prompt
+        return json.dumps({"code": "class Repo: pass"})
+
+    monkeypatch.setattr(code_generator, "generate_code_with_chat", fake_generate)
+
+    summary = code_generator.generate_code([repo])
+
+    assert summary.completed == 1
+    assert "class Existing: pass" in prompts["Repo"]
+
+
+def test_failed_dependency_fails_the_referencing_file(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    write_file(tmp_path, "models.py", "")
+    models = _task(tmp_path, "models.py", "<prompt:Model>\nWrite a model\n<prompt:Model/>\n{Model}\n")
+    repo = _task(tmp_path, "repo.py", "<prompt:Repo>\nRepository for {models.py::Model}\n<prompt:Repo/>\n{Repo}\n")
+    calls = []
+
+    def fake_generate(prompt: str, prompt_name: str) -> str:
+        calls.append(prompt_name)
+        return "not json"
+
+    monkeypatch.setattr(code_generator, "generate_code_with_chat", fake_generate)
+
+    code_generator.generate_code([models, repo])
+
+    assert calls == ["Model"]
+    assert "{Repo}" in (tmp_path / "repo.py").read_text(encoding="utf-8")
+
+
+def test_file_import_of_a_generated_file_waits_for_its_prompts(tmp_path: Path) -> None:
+    write_file(tmp_path, "models.py", "<prompt:Model>\nm\n<prompt:Model/>\n<Model>\n<Model/>\n")
+    write_file(tmp_path, "shared.py", "<file:MODELS>models.py<file:MODELS/>\n")
+    write_file(tmp_path, "notes.txt", "plain text\n")
+    task = _task(
+        tmp_path,
+        "repo.py",
+        "<import>shared.py<import/>\n<file:NOTES>notes.txt<file:NOTES/>\n"
+        "<prompt:Repo>\nUse {MODELS}\n<prompt:Repo/>\n<prompt:Doc>\n{NOTES}\n<prompt:Doc/>\n{Repo}\n{Doc}\n",
+    )
+
+    # Only the imported file with prompts of its own is waited for, however it is imported.
+    assert task.prompt_external_dependencies == {"Repo": [prompt_key("models.py", "Model")]}
+
+
+def test_generate_code_reads_an_imported_file_after_its_prompts_are_written(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    models_content = "<prompt:Model>\nWrite a model\n<prompt:Model/>\n{Model}\n"
+    write_file(tmp_path, "models.py", models_content)
+    repo = _task(
+        tmp_path, "repo.py", "<file:MODELS>models.py<file:MODELS/>\n<prompt:Repo>\n{MODELS}\n<prompt:Repo/>\n{Repo}\n"
+    )
+    models = _task(tmp_path, "models.py", models_content)
+    prompts = {}
+
+    def fake_generate(prompt: str, prompt_name: str) -> str:
+        if prompt_name == "Model":
+            # Slow enough that Repo would read the file first if it did not wait.
+            time.sleep(0.2)
+        prompts[prompt_name] = prompt
+        return json.dumps({"code": f"class {prompt_name}: pass"})
+
+    monkeypatch.setattr(code_generator, "generate_code_with_chat", fake_generate)
+
+    summary = code_generator.generate_code([repo, models])
+
+    assert summary.completed == 2
+    assert "class Model: pass" in prompts["Repo"]
+
+
+def test_files_importing_each_other_whole_are_a_cycle(tmp_path: Path) -> None:
+    write_file(tmp_path, "b.py", "<prompt:B>\n{A}\n<prompt:B/>\n{B}\n")
+    a = _task(tmp_path, "a.py", "<file:B>b.py<file:B/>\n<prompt:A>\n{B}\n<prompt:A/>\n{A}\n")
+    b = _task(tmp_path, "b.py", "<file:A>a.py<file:A/>\n<prompt:B>\n{A}\n<prompt:B/>\n{B}\n")
+    graph = PromptGraph()
+    graph.add(a)
+
+    with pytest.raises(PromptDependencyCycleError):
+        graph.add(b)
+
+
+def test_files_waiting_for_a_later_file_do_not_fill_the_pipeline(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(Config, "Pipeline_Queue_Size", 1)
+    write_file(tmp_path, "b.py", "")
+    a = _task(tmp_path, "a.py", "<prompt:A>\nUse {b.py::X}\n<prompt:A/>\n{A}\n")
+    b = _task(tmp_path, "b.py", "<prompt:X>\nWrite X\n<prompt:X/>\n{X}\n")
+    calls = []
+
+    def fake_generate(prompt: str, prompt_name: str) -> str:
+        calls.append(prompt_name)
+        return json.dumps({"code": f"class {prompt_name}: pass"})
+
+    monkeypatch.setattr(code_generator, "generate_code_with_chat", fake_generate)
+    summaries = []
+    # a.py holds the only slot until b.py, which it waits for, is added.
+    worker = threading.Thread(target=lambda: summaries.append(code_generator.generate_code(iter([a, b]))), daemon=True)
+    worker.start()
+    worker.join(timeout=20)
+
+    assert not worker.is_alive()
+    assert summaries[0].completed == 2
+    assert calls == ["X", "A"]
@@ -14,13 +14,17 @@ Coverage
 - Fan-out + multiple roots (Root depended on by D1/D2; plus Solo independent).
 - Ignores unknown placeholders and self-references.
 - Cycles are handled gracefully (falls back to original order for remaining prompts).
+- Layers match the original quadratic ordering on random graphs.
 
 These tests validate build_prompt_order(...) populates task.prompt_order and task.prompt_layers.
 """
 
 from __future__ import annotations
 
+import random
+import re
 from pathlib import Path
+from types import SimpleNamespace
 
 import pytest
 from conftest import read_fixture, write_file
@@ -176,3 +180,54 @@ def test_ast_workflow_same_target_tag_orders_prompts_by_dependencies(tmp_path: P
     build_prompt_order([task])
 
     assert task.prompt_order == ["A", "B", "C", "D", "E"]
+
+
+def _legacy_order(prompts: dict[str, str]) -> tuple[list[str], list[list[str]], list[str]]:
+    """The original quadratic layering, kept as a reference for the linear-time implementation."""
+
+    dependencies = {name: set() for name in prompts}
+    for prompt_name, content in prompts.items():
+        for placeholder in re.findall(r"{(\w+)}", content):
+            if placeholder in prompts and placeholder != prompt_name:
+                dependencies[prompt_name].add(placeholder)
+
+    ready = [name for name, deps in dependencies.items() if not deps]
+    processed, layers = [], []
+    while ready:
+        current_layer = []
+        for name in list(ready):
+            ready.remove(name)
+            current_layer.append(name)
+            processed.append(name)
+            for other_name, deps in dependencies.items():
+                if name in deps:
+                    deps.remove(name)
+                    if not deps and other_name not in processed and other_name not in ready:
+                        ready.append(other_name)
+        layers.append(current_layer)
+    return processed, layers, [name for name in prompts if name not in processed]
+
+
+@pytest.mark.parametrize("seed", range(25))
+def test_ast_layers_match_legacy_ordering_on_random_graphs(seed: int) -> None:
+    rng = random.Random(seed)
+    names = [f"P{i}" for i in range(40)]
+    rng.shuffle(names)
+    allow_cycles = seed % 5 == 0
+    prompts = {}
+    for index, name in enumerate(names):
+        candidates = names if allow_cycles else names[:index]
+        refs = rng.sample(candidates, k=min(len(candidates), rng.randint(0, 4)))
+        prompts[name] = " ".join(f"{{{ref}}}" for ref in refs + ["UNKNOWN"]) + f" {{{name}}}"
+    task = SimpleNamespace(filepath="random.txt", prompts=prompts)
+
+    expected_order, expected_layers, expected_cycle = _legacy_order(prompts)
+
+    if expected_cycle:
+        with pytest.raises(PromptDependencyCycleError) as error:
+            build_prompt_order([task])
+        assert error.value.cyclic_prompts == expected_cycle
+    else:
+        build_prompt_order([task])
+        assert task.prompt_order == expected_order
+        assert task.prompt_layers == expected_layers
@@ -0,0 +1,154 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from context import code_generator
+from context.ast import build_prompt_order
+from context.config import Config
+from context.tag_parser import parse_tags
+
+
+def _make_task(*, filepath: str, prompts: dict[str, str]):
+    return SimpleNamespace(
+        filepath=filepath,
+        prompts=prompts,
+        context_dict={},
+        global_context="GC",
+        prompt_outputs=set(),
+        prompt_outputs_tags={},
+        prompt_output_targets={},
+        prompt_order=None,
+        prompt_layers=None,
+    )
+
+
+@pytest.fixture
+def batching(monkeypatch):
+    monkeypatch.setattr(Config, "Batch_Prompts", True)
+    monkeypatch.setattr(Config, "MockLLM", False)
+
+
+def test_batching_packs_same_layer_prompts_and_falls_back_for_invalid_entries(tmp_path, monkeypatch, batching):
+    f = tmp_path / "batch.txt"
+    f.write_text("{A}\n{B}\n{C}\n", encoding="utf-8")
+
+    task = _make_task(filepath=str(f), prompts={"A": "do a", "B": "do b", "C": "use {A}"})
+    task.prompt_outputs = {"A", "B", "C"}
+    task.prompt_order = ["A", "B", "C"]
+    task.prompt_layers = [["A", "B"], ["C"]]
+
+    batch_calls = []
+    single_calls = []
+
+    def fake_batch(prompts, global_context=None):
+        batch_calls.append((dict(prompts), global_context))
+        # Only A validates; B must fall back to its own request.
+        return {"A": json.dumps({"code": "BATCH_A"})}
+
+    def fake_single(prompt: str, prompt_name: str) -> str:
+        single_calls.append(prompt_name)
+        return json.dumps({"code": f"SINGLE_{prompt_name}"})
+
+    monkeypatch.setattr(code_generator, "generate_batch_with_chat", fake_batch)
+    monkeypatch.setattr(code_generator, "generate_code_with_chat", fake_single)
+
+    summary = code_generator.generate_code([task])
+
+    # Global context is sent once with the batch rather than appended to every packed prompt.
+    assert batch_calls == [({"A": "do a", "B": "do b"}, "GC")]
+    assert single_calls == ["B", "C"]
+    assert f.read_text(encoding="utf-8") == "BATCH_A\nSINGLE_B\nSINGLE_C\n"
+    assert (summary.batches, summary.batched_prompts, summary.batch_fallbacks) == (1, 1, 1)
+    assert summary.largest_prompt_tokens > 0
+
+
+def test_batching_falls_back_to_single_prompts_when_the_batch_is_over_the_budget(tmp_path, monkeypatch, batching):
+    f = tmp_path / "batch.txt"
+    f.write_text("{A}\n{B}\n", encoding="utf-8")
+    task = _make_task(filepath=str(f), prompts={"A": "a" * 300, "B": "b" * 300})
+    task.global_context = ""
+    task.prompt_outputs = {"A", "B"}
+    task.prompt_order = ["A", "B"]
+    task.prompt_layers = [["A", "B"]]
+    # Each prompt fits on its own, both together do not.
+    monkeypatch.setattr(Config, "Max_Prompt_Tokens", 150)
+
+    def fake_batch(prompts, global_context=None):  # pragma: no cover
+        raise AssertionError("a batch over the token budget should not be sent")
+
+    single_calls = []
+
+    def fake_single(prompt: str, prompt_name: str) -> str:
+        single_calls.append(prompt_name)
+        return json.dumps({"code": f"SINGLE_{prompt_name}"})
+
+    monkeypatch.setattr(code_generator, "generate_batch_with_chat", fake_batch)
+    monkeypatch.setattr(code_generator, "generate_code_with_chat", fake_single)
+
+    summary = code_generator.generate_code([task])
+
+    assert single_calls == ["A", "B"]
+    assert f.read_text(encoding="utf-8") == "SINGLE_A\nSINGLE_B\n"
+    assert (summary.batches, summary.failed, summary.rejected_prompts) == (0, 0, 0)
+    assert 0 < summary.largest_prompt_tokens <= 150
+
+
+def test_batching_keeps_output_target_and_large_prompts_individual(tmp_path, monkeypatch, batching):
+    monkeypatch.setattr(Config, "Batch_Max_Prompt_Chars", 10)
+
+    f = tmp_path / "batch.txt"
+    f.write_text("{A}\n{Big}\n<T>\nold\n<T/>\n", encoding="utf-8")
+
+    task = _make_task(filepath=str(f), prompts={"A": "a", "Big": "x" * 50, "R": "refine"})
+    task.prompt_outputs = {"A", "Big"}
+    task.prompt_outputs_tags = {"T": "old"}
+    task.prompt_output_targets = {"R": "T"}
+    task.prompt_order = ["A", "Big", "R"]
+    task.prompt_layers = [["A", "Big", "R"]]
+
+    def fake_batch(prompts, global_context=None):  # pragma: no cover
+        raise AssertionError("a single small prompt should not be sent as a batch")
+
+    single_calls = []
+
+    def fake_single(prompt: str, prompt_name: str) -> str:
+        single_calls.append(prompt_name)
+        return json.dumps({"code": f"CODE_{prompt_name}"})
+
+    monkeypatch.setattr(code_generator, "generate_batch_with_chat", fake_batch)
+    monkeypatch.setattr(code_generator, "generate_code_with_chat", fake_single)
+
+    code_generator.generate_code([task])
+
+    assert single_calls == ["A", "Big", "R"]
+    assert f.read_text(encoding="utf-8") == "CODE_A\nCODE_Big\n<T>\nCODE_R\n<T/>\n"
+
+
+def test_batching_runs_a_prompt_whose_import_fails_on_its_own(tmp_path, monkeypatch, batching):
+    data = tmp_path / "d.txt"
+    data.write_text("data\n", encoding="utf-8")
+    f = tmp_path / "main.txt"
+    f.write_text(
+        f"<file:D>{data}<file:D/>\n<prompt:P>\nuse {{D}}\n<prompt:P/>\n<prompt:Q>\ndo q\n<prompt:Q/>\n{{P}}\n{{Q}}\n",
+        encoding="utf-8",
+    )
+    tasks, errors = parse_tags([str(f)], in_comment_signs=[])
+    assert errors == []
+    build_prompt_order(tasks)
+    data.unlink()
+
+    single_calls = []
+
+    def fake_single(prompt: str, prompt_name: str) -> str:
+        single_calls.append(prompt_name)
+        return json.dumps({"code": f"SINGLE_{prompt_name}"})
+
+    monkeypatch.setattr(code_generator, "generate_batch_with_chat", lambda *_: {})
+    monkeypatch.setattr(code_generator, "generate_code_with_chat", fake_single)
+
+    summary = code_generator.generate_code(tasks)
+
+    assert single_calls == ["Q"]
+    assert "SINGLE_Q" in f.read_text(encoding="utf-8")
+    assert summary.failed == 1
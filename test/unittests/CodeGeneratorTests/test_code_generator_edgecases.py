@@ -1,6 +1,7 @@
 import builtins
 import io
 import json
+import os
 from pathlib import Path
 from types import SimpleNamespace
 from typing import Any
@@ -53,13 +54,21 @@ class _FakeFS:
 
         raise ValueError(f"Unsupported mode: {mode}")
 
+    def replace(self, source: str, destination: str) -> None:
+        self.files[destination] = self.files.pop(source)
+
+    def install(self, monkeypatch) -> None:
+        # Files are rewritten through a temporary file renamed over them (file_manager.write_file_atomically).
+        monkeypatch.setattr(builtins, "open", self.open)
+        monkeypatch.setattr(os, "replace", self.replace)
+
 
 def test_single_file_flow_raises_on_invalid_llm_json(monkeypatch):
     monkeypatch.setattr(Config, "MockLLM", False)
 
     fake_path = "memory://invalid_json.txt"
     fs = _FakeFS({fake_path: "{P}\n"})
-    monkeypatch.setattr(builtins, "open", fs.open)
+    fs.install(monkeypatch)
 
     task = _make_task(filepath=fake_path, prompts={"P": "x"})
     task.prompt_outputs = {"P"}
@@ -75,7 +84,7 @@ def test_single_file_flow_missing_code_key_is_noop(monkeypatch):
 
     fake_path = "memory://missing_code_key.txt"
     fs = _FakeFS({fake_path: "before\n{P}\nafter\n"})
-    monkeypatch.setattr(builtins, "open", fs.open)
+    fs.install(monkeypatch)
 
     task = _make_task(filepath=fake_path, prompts={"P": "x"})
     task.prompt_outputs = {"P"}
@@ -91,7 +100,7 @@ def test_single_file_flow_missing_code_key_is_noop(monkeypatch):
 def test_apply_code_raises_when_start_tag_missing(monkeypatch):
     fake_path = "memory://missing_start_tag.txt"
     fs = _FakeFS({fake_path: "<MyPrompt/>\n"})
-    monkeypatch.setattr(builtins, "open", fs.open)
+    fs.install(monkeypatch)
 
     task = _make_task(filepath=fake_path, prompts={"MyPrompt": "x"})
     task.prompt_outputs_tags = {"MyPrompt": ""}
@@ -103,7 +112,7 @@ def test_apply_code_raises_when_start_tag_missing(monkeypatch):
 def test_apply_code_raises_when_end_tag_missing(monkeypatch):
     fake_path = "memory://missing_end_tag.txt"
     fs = _FakeFS({fake_path: "<MyPrompt>\nOLD\n"})
-    monkeypatch.setattr(builtins, "open", fs.open)
+    fs.install(monkeypatch)
 
     task = _make_task(filepath=fake_path, prompts={"MyPrompt": "x"})
     task.prompt_outputs_tags = {"MyPrompt": ""}
@@ -115,7 +124,7 @@ def test_apply_code_raises_when_end_tag_missing(monkeypatch):
 def test_apply_code_end_tag_before_start_tag_raises(monkeypatch):
     fake_path = "memory://end_before_start.txt"
     fs = _FakeFS({fake_path: "<X/>\n<X>\nOLD\n"})
-    monkeypatch.setattr(builtins, "open", fs.open)
+    fs.install(monkeypatch)
 
     task = _make_task(filepath=fake_path, prompts={"X": "x"})
     task.prompt_outputs_tags = {"X": ""}
@@ -127,7 +136,7 @@ def test_apply_code_end_tag_before_start_tag_raises(monkeypatch):
 def test_apply_code_replaces_all_placeholder_lines(monkeypatch):
     fake_path = "memory://two_placeholders.txt"
     fs = _FakeFS({fake_path: "{P}\nkeep\n{P}\n"})
-    monkeypatch.setattr(builtins, "open", fs.open)
+    fs.install(monkeypatch)
 
     task = _make_task(filepath=fake_path, prompts={"P": "x"})
     task.prompt_outputs = {"P"}
@@ -144,7 +153,7 @@ def test_apply_code_uses_first_tag_pair_when_multiple_blocks_exist(monkeypatch):
             fake_path: "<T>\nOLD1\n<T/>\nmid\n<T>\nOLD2\n<T/>\n",
         }
     )
-    monkeypatch.setattr(builtins, "open", fs.open)
+    fs.install(monkeypatch)
 
     task = _make_task(filepath=fake_path, prompts={"T": "x"})
     task.prompt_outputs_tags = {"T": ""}
@@ -159,7 +168,7 @@ def test_read_tag_contents_raises_helpful_error_when_target_tag_missing(monkeypa
 
     fake_path = "memory://missing_target_tag.txt"
     fs = _FakeFS({fake_path: "{P}\n"})
-    monkeypatch.setattr(builtins, "open", fs.open)
+    fs.install(monkeypatch)
 
     task = _make_task(filepath=fake_path, prompts={"P": "x"})
     task.prompt_output_targets = {"P": "Missing"}
@@ -175,7 +184,7 @@ def test_prompt_order_controls_last_write_when_two_prompts_target_same_tag(monke
 
     fake_path = "memory://collisions.txt"
     fs = _FakeFS({fake_path: (FILES_DIR / "output_target.txt").read_text(encoding="utf-8")})
-    monkeypatch.setattr(builtins, "open", fs.open)
+    fs.install(monkeypatch)
 
     task = _make_task(filepath=fake_path, prompts={"P1": "x", "P2": "x"})
     task.prompt_output_targets = {"P1": "A", "P2": "A"}
@@ -204,7 +213,7 @@ def test_process_prompt_leaves_unknown_placeholders_intact():
 def test_apply_code_no_placeholder_branch_prints_message_and_leaves_file_unchanged(monkeypatch):
     fake_path = "memory://no_placeholder.txt"
     fs = _FakeFS({fake_path: "before\n"})
-    monkeypatch.setattr(builtins, "open", fs.open)
+    fs.install(monkeypatch)
 
     task = _make_task(filepath=fake_path, prompts={"P": "x"})
 
@@ -221,7 +230,7 @@ def test_apply_code_no_placeholder_branch_prints_message_and_leaves_file_unchang
 def test_apply_code_no_placeholder_branch_for_unknown_prompt_name_is_safe(monkeypatch):
     fake_path = "memory://no_placeholder_unknown_prompt.txt"
     fs = _FakeFS({fake_path: "before\n"})
-    monkeypatch.setattr(builtins, "open", fs.open)
+    fs.install(monkeypatch)
 
     task = _make_task(filepath=fake_path, prompts={"Other": "x"})
 
@@ -240,7 +249,7 @@ def test_single_file_flow_skips_task_with_no_outputs_and_never_calls_llm(monkeyp
 
     fake_path = "memory://skip_no_outputs.txt"
     fs = _FakeFS({fake_path: "<anything/>\n"})
-    monkeypatch.setattr(builtins, "open", fs.open)
+    fs.install(monkeypatch)
 
     task = _make_task(filepath=fake_path, prompts={"P": "x"})
     # Note: no prompt_outputs, no prompt_outputs_tags, no prompt_output_targets.
@@ -1,6 +1,7 @@
 import builtins
 import io
 import json
+import os
 from pathlib import Path
 from types import SimpleNamespace
 from typing import Any
@@ -29,7 +30,8 @@ def _make_task(*, filepath: str, prompts: dict[str, str]):
 class _FakeFS:
     """A tiny in-memory filesystem so tests can cover file mutation without tmp_path.
 
-    code_generator.__apply_code opens the file twice: once for reading, once for writing.
+    code_generator.__apply_code opens the file twice: once for reading, once for writing (a temporary
+    file that replaces it).
     """
 
     def __init__(self, files: dict[str, str]):
@@ -54,6 +56,14 @@ class _FakeFS:
 
         raise ValueError(f"Unsupported mode: {mode}")
 
+    def replace(self, source: str, destination: str) -> None:
+        self.files[destination] = self.files.pop(source)
+
+    def install(self, monkeypatch) -> None:
+        # Files are rewritten through a temporary file renamed over them (file_manager.write_file_atomically).
+        monkeypatch.setattr(builtins, "open", self.open)
+        monkeypatch.setattr(os, "replace", self.replace)
+
 
 def test_generate_code_replaces_single_line_placeholder(tmp_path: Path, monkeypatch):
     # Inline placeholder path uses real file IO for the simplest happy path.
@@ -75,7 +85,7 @@ def test_generate_code_replaces_between_output_tags_without_tmp_path(monkeypatch
 
     fake_path = "memory://output_tags.txt"
     fs = _FakeFS({fake_path: (FILES_DIR / "output_tags.txt").read_text(encoding="utf-8")})
-    monkeypatch.setattr(builtins, "open", fs.open)
+    fs.install(monkeypatch)
 
     task = _make_task(filepath=fake_path, prompts={"MyPrompt": "do stuff"})
     task.prompt_outputs_tags = {"MyPrompt": ""}
@@ -90,7 +100,7 @@ def test_generate_code_output_target_mapping_writes_into_other_tag_without_tmp_p
 
     fake_path = "memory://output_target.txt"
     fs = _FakeFS({fake_path: (FILES_DIR / "output_target.txt").read_text(encoding="utf-8")})
-    monkeypatch.setattr(builtins, "open", fs.open)
+    fs.install(monkeypatch)
 
     task = _make_task(filepath=fake_path, prompts={"C": "do stuff"})
     # Prompt C should write into output tag <A>...</A/>
@@ -106,7 +116,7 @@ def test_generate_code_constructs_prompt_with_context_and_global_without_tmp_pat
 
     fake_path = "memory://construct_prompt.txt"
     fs = _FakeFS({fake_path: (FILES_DIR / "construct_prompt.txt").read_text(encoding="utf-8")})
-    monkeypatch.setattr(builtins, "open", fs.open)
+    fs.install(monkeypatch)
 
     task = _make_task(filepath=fake_path, prompts={"P": "Do thing. {X} {Prev}"})
     task.prompt_outputs = {"P"}
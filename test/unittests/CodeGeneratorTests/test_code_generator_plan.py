@@ -0,0 +1,111 @@
+"""Tests for the --plan execution preview (planner.plan_run and Context --plan)."""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from context import code_generator, planner
+from context.config import Config
+from context.Context import configurationProcess, contextProcess
+from context.log import Log, configure_logger
+from context.token_budget import estimate_tokens
+
+_CHAIN = """<prompt:A>
+Write the model
+<prompt:A/>
+<prompt:B>
+Write a repository for {A}
+<prompt:B/>
+<prompt:C>
+Write shared helpers
+<prompt:C/>
+{A}
+{B}
+<C>
+def helper():
+    return 1
+<C/>
+"""
+
+
+@pytest.fixture
+def no_llm(monkeypatch: pytest.MonkeyPatch) -> None:
+    def fail(*args, **kwargs):
+        raise AssertionError("--plan must not call the LLM")
+
+    monkeypatch.setattr(code_generator, "generate_code_with_chat", fail)
+    monkeypatch.setattr(code_generator, "generate_batch_with_chat", fail)
+
+
+def test_plan_run_reports_prompts_layers_and_estimates(tmp_path: Path, monkeypatch, no_llm, parse_tasks) -> None:
+    monkeypatch.setattr(Config, "Concurrency", 1)
+    monkeypatch.setattr(Config, "Max_Concurrency", 4)
+    first = tmp_path / "first.txt"
+    second = tmp_path / "second.txt"
+    first.write_text(_CHAIN, encoding="utf-8")
+    second.write_text("<prompt:C>\nWrite shared helpers\n<prompt:C/>\n{C}\n", encoding="utf-8")
+
+    plan = planner.plan_run(parse_tasks(first, second))
+
+    statuses = {(Path(entry["file"]).name, entry["prompt"]): entry["status"] for entry in plan["prompts"]}
+    assert statuses == {
+        ("first.txt", "A"): "run",
+        ("first.txt", "B"): "run",
+        ("first.txt", "C"): "run",
+        ("second.txt", "C"): "deduplicated",
+    }
+    assert [[name.rsplit("::", 1)[1] for name in layer] for layer in plan["layers"]] == [["A", "C", "C"], ["B"]]
+    assert [name.rsplit("::", 1)[1] for name in plan["critical_path"]] == ["A", "B"]
+    assert plan["input_tokens"] > 0
+    # A and B have no output tag yet; C is expected to be about as long as its current tag contents.
+    helper_tokens = estimate_tokens("def helper():\n    return 1", Config.Model)
+    assert plan["output_tokens"] == 2 * Config.Plan_Output_Tokens + helper_tokens
+    assert plan["cost_usd"][Config.Model] is None or plan["cost_usd"][Config.Model] > 0
+    assert plan["predicted_seconds"]["1"] > plan["predicted_seconds"]["4"]
+    assert first.read_text(encoding="utf-8") == _CHAIN
+
+
+def test_plan_run_skips_prompts_over_the_token_budget(tmp_path: Path, monkeypatch, no_llm, parse_tasks) -> None:
+    monkeypatch.setattr(Config, "Max_Prompt_Tokens", 5)
+    f = tmp_path / "big.txt"
+    f.write_text("<prompt:A>\n" + "word " * 100 + "\n<prompt:A/>\n{A}\n", encoding="utf-8")
+
+    plan = planner.plan_run(parse_tasks(f))
+
+    assert plan["prompts"][0]["status"] == "skipped"
+    assert "token budget" in plan["prompts"][0]["reason"]
+    assert plan["input_tokens"] == 0
+
+
+def test_context_process_plan_emits_json_without_api_key(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str], no_llm
+) -> None:
+    monkeypatch.delenv("CONTEXT_CONFIG_Open_Router_Api_Key", raising=False)
+    monkeypatch.setattr(Config, "Api_Key", None)
+    f = tmp_path / "a.txt"
+    f.write_text(_CHAIN, encoding="utf-8")
+    args = SimpleNamespace(
+        debug=False,
+        log=False,
+        parser=False,
+        mock_llm=False,
+        filepath=str(f),
+        openrouter_key=None,
+        model=Config.Model,
+        plan="json",
+    )
+
+    configurationProcess(args)
+    Log.logger = configure_logger(debug=False, logToFile=False)
+    try:
+        contextProcess()
+    finally:
+        Config.Plan = None
+
+    plan = json.loads(capsys.readouterr().out)
+    assert [entry["prompt"] for entry in plan["prompts"]] == ["A", "C", "B"]
+    assert f.read_text(encoding="utf-8") == _CHAIN
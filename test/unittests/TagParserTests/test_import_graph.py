@@ -0,0 +1,75 @@
+"""Unit tests for transitive context imports resolved through context.import_graph."""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+from conftest import write_file
+
+from context.import_graph import ImportCycleError, ImportGraph
+from context.tag_parser import parse_tags, regexPatterns
+
+
+def _consumer(tmp_path: Path, name: str, imports: str) -> Path:
+    return write_file(tmp_path, name, f"{imports}\n<prompt:P>\nUse {{BASE}} {{MIDDLE}}\n<prompt:P/>\n{{P}}\n")
+
+
+def test_import_follows_imports_of_imported_files(tmp_path: Path) -> None:
+    base = write_file(tmp_path, "base.txt", "<context:BASE>\nbase value\n<context:BASE/>\n")
+    payload = write_file(tmp_path, "payload.txt", "payload\n")
+    middle = write_file(
+        tmp_path,
+        "middle.txt",
+        f"<import>{base}<import/>\n<file:PAYLOAD>{payload}<file:PAYLOAD/>\n<context:MIDDLE>\nm\n<context:MIDDLE/>\n",
+    )
+    top = write_file(tmp_path, "top.txt", f"<import>{middle}<import/>\n")
+    main = _consumer(tmp_path, "main.txt", f"<import>{top}<import/>")
+
+    tasks, errors = parse_tags([str(main)], in_comment_signs=[])
+
+    assert errors == []
+    context = tasks[0].context_dict
+    assert context["BASE"] == "base value"
+    assert context["MIDDLE"] == "m"
+    assert not context.is_loaded("PAYLOAD")
+    assert context["PAYLOAD"] == "payload\n"
+
+
+def test_import_specific_variable_defined_by_a_nested_import(tmp_path: Path) -> None:
+    base = write_file(tmp_path, "base.txt", "<context:BASE>\nb\n<context:BASE/>\n")
+    middle = write_file(tmp_path, "middle.txt", f"<import:BASE>{base}<import:BASE/>\n")
+    main = _consumer(tmp_path, "main.txt", f"<import:BASE>{middle}<import:BASE/>")
+
+    tasks, errors = parse_tags([str(main)], in_comment_signs=[])
+
+    assert errors == []
+    assert tasks[0].context_dict["BASE"] == "b"
+
+
+def test_exports_are_memoized_per_file(tmp_path: Path) -> None:
+    base = write_file(tmp_path, "base.txt", "<context:BASE>\nb\n<context:BASE/>\n")
+    graph = ImportGraph(regexPatterns)
+
+    first = graph.exports(str(base))
+    base.write_text("<context:OTHER>\no\n<context:OTHER/>\n", encoding="utf-8")
+
+    assert graph.exports(str(base)) is first
+    assert list(first) == ["BASE"]
+
+
+def test_import_cycle_is_reported_with_the_cycle_path(tmp_path: Path) -> None:
+    a = tmp_path / "a.txt"
+    b = tmp_path / "b.txt"
+    write_file(tmp_path, "a.txt", f"<import>{b}<import/>\n")
+    write_file(tmp_path, "b.txt", f"<import>{a}<import/>\n")
+
+    with pytest.raises(ImportCycleError) as excinfo:
+        ImportGraph(regexPatterns).exports(str(a))
+
+    assert [Path(p).name for p in excinfo.value.cycle] == ["a.txt", "b.txt", "a.txt"]
+
+    main = _consumer(tmp_path, "main.txt", f"<import>{a}<import/>")
+    tasks, errors = parse_tags([str(main)], in_comment_signs=[])
+    assert tasks == []
+    assert any("Context import cycle detected" in e for e in errors)
@@ -0,0 +1,83 @@
+"""Unit tests for the compact, span-backed Task model (context.spans and Task.materialize)."""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+from conftest import write_file
+
+from context import code_generator
+from context.ast import build_prompt_order
+from context.lazy_context import ContextLoadError
+from context.spans import SourceFile, SpanDict
+from context.tag_parser import parse_tags
+
+_CONTENT = """<context:STYLE>
+  short functions
+<context:STYLE/>
+<prompt:A>
+Write A using {STYLE}
+<prompt:A/>
+<A>
+old
+<A/>
+"""
+
+
+def test_task_keeps_offsets_until_texts_are_read(tmp_path: Path) -> None:
+    path = write_file(tmp_path, "a.txt", _CONTENT)
+
+    tasks, errors = parse_tags([str(path)], in_comment_signs=[])
+
+    assert errors == []
+    task = tasks[0]
+    assert not hasattr(task, "__dict__")
+    assert not task.prompts.is_materialized
+    assert "<span" in repr(task.prompts)
+    assert task.prompts == {"A": "Write A using {STYLE}"}
+    assert task.prompt_outputs_tags["A"] == "old"
+    assert task.context_dict["STYLE"] == "short functions"
+
+
+def test_materialize_reads_all_texts_before_the_file_is_rewritten(tmp_path: Path) -> None:
+    path = write_file(tmp_path, "a.txt", _CONTENT)
+    task = parse_tags([str(path)], in_comment_signs=[])[0][0]
+
+    task.materialize()
+    path.write_text("rewritten\n", encoding="utf-8")
+
+    assert task.prompts["A"] == "Write A using {STYLE}"
+    assert task.prompt_outputs_tags["A"] == "old"
+    assert task.context_dict["STYLE"] == "short functions"
+
+
+def test_reading_spans_of_a_changed_file_fails_loudly(tmp_path: Path) -> None:
+    path = write_file(tmp_path, "a.txt", "0123456789")
+    spans = SpanDict(SourceFile(str(path)))
+    spans.add("X", 2, 5)
+
+    path.write_text("changed contents", encoding="utf-8")
+
+    with pytest.raises(ContextLoadError, match="changed after it was parsed"):
+        spans["X"]
+    with pytest.raises(KeyError):
+        spans["MISSING"]
+
+
+def test_a_file_edited_after_parsing_only_skips_the_prompts_reading_it(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    content = _CONTENT + "<prompt:B>\nWrite B\n<prompt:B/>\n<B>\n<B/>\n"
+    path = write_file(tmp_path, "a.txt", content)
+    tasks, errors = parse_tags([str(path)], in_comment_signs=[])
+    build_prompt_order(tasks)
+    # Edited before generation starts: the offsets of <context:STYLE> no longer match.
+    path.write_text("# edited\n" + content, encoding="utf-8")
+    monkeypatch.setattr(code_generator, "generate_code_with_chat", lambda prompt, name: '{"code": "done"}')
+
+    summary = code_generator.generate_code(tasks)
+
+    assert (summary.completed, summary.failed) == (1, 1)
+    assert "<B>\ndone\n<B/>" in path.read_text(encoding="utf-8")
+    assert "<A>\nold\n<A/>" in path.read_text(encoding="utf-8")
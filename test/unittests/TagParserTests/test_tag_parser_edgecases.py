@@ -198,6 +198,21 @@ def test_parse_tags_file_import_missing_payload_reports_error(tmp_path: Path) ->
     assert any("No such file" in e or "Errno" in e for e in errors)
 
 
+def test_parse_tags_file_import_bad_modifier_reports_error_at_parse_time(tmp_path: Path) -> None:
+    write_file(tmp_path, "d.txt", "a\nb\n")
+    main = write_file(
+        tmp_path,
+        "main.txt",
+        f"<file:D>{tmp_path / 'd.txt'} | FOO 3<file:D/>\n<file:E>{tmp_path / 'd.txt'} | HEAD<file:E/>\n"
+        "<prompt:P>\n{D} {E}\n<prompt:P/>\n{P}\n",
+    )
+
+    _, errors = parse_tags([str(main)], in_comment_signs=[])
+
+    assert any("Unknown file import modifier 'FOO'" in e for e in errors)
+    assert any("HEAD expects one argument" in e for e in errors)
+
+
 def test_parse_tags_prompt_output_tag_name_collision_with_context_variable_reports_error(tmp_path: Path) -> None:
     file_path = write_file(
         tmp_path,
@@ -8,8 +8,10 @@ from __future__ import annotations
 
 from pathlib import Path
 
+import pytest
 from conftest import read_fixture, write_file
 
+from context.log import Log
 from context.tag_parser import parse_tags
 
 
@@ -127,3 +129,59 @@ def test_parse_tags_import_file_context_variables_reads_file_contents(tmp_path:
     task = tasks[0]
     # Current behavior: <file:VAR> reads the whole file verbatim (including trailing newline).
     assert task.context_dict["PAYLOAD"] == "payload contents\nline2\n"
+
+
+def test_parse_tags_import_file_schema_modifier_summarizes_data(tmp_path: Path) -> None:
+    data = write_file(tmp_path, "table.csv", "id,name\n1,a\n2,b\n3,c\n")
+
+    main_template = read_fixture("file_import_main.txt")
+    main_content = main_template.replace("__PAYLOAD_PATH__", f"{data} | SCHEMA 1")
+    main = write_file(tmp_path, "file_import_main.txt", main_content)
+
+    tasks, errors = parse_tags([str(main)], in_comment_signs=[])
+
+    assert errors == []
+    summary = tasks[0].context_dict["PAYLOAD"]
+    assert "ROWS: 3" in summary
+    assert "- id: integer" in summary
+    assert summary.endswith("SAMPLE (first 1 rows):\nid,name\n1,a\n")
+
+
+def test_parse_tags_file_import_is_loaded_lazily_and_unused_import_warned(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    payload = write_file(tmp_path, "payload.txt", "first\n")
+    main = write_file(
+        tmp_path,
+        "main.txt",
+        f"<file:PAYLOAD>{payload}<file:PAYLOAD/>\n<prompt:P>\nNo reference\n<prompt:P/>\n{{P}}\n# {{PAYLOAD}}\n",
+    )
+    warnings = []
+    monkeypatch.setattr(Log.logger, "warning", lambda message, *args, **kwargs: warnings.append(message))
+
+    tasks, errors = parse_tags([str(main)], in_comment_signs=[])
+
+    assert errors == []
+    assert any("'PAYLOAD' is not referenced" in w for w in warnings)
+    assert not tasks[0].context_dict.is_loaded("PAYLOAD")
+    # The file is read when the value is first used, not when the tag is parsed.
+    payload.write_text("second\n", encoding="utf-8")
+    assert tasks[0].context_dict["PAYLOAD"] == "second\n"
+
+
+def test_parse_tags_dir_import_declares_lazy_concatenation(tmp_path: Path) -> None:
+    write_file(tmp_path, "api/users.py", "USERS = 1\n")
+    write_file(tmp_path, "api/orders.py", "ORDERS = 2\n")
+    main = write_file(
+        tmp_path,
+        "main.txt",
+        f"<dir:API>{tmp_path / 'api' / '*.py'}<dir:API/>\n<prompt:P>\nUse {{API}}\n<prompt:P/>\n{{P}}\n",
+    )
+
+    tasks, errors = parse_tags([str(main)], in_comment_signs=[])
+
+    assert errors == []
+    task = tasks[0]
+    assert task.context_sources["API"] == "file"
+    assert not task.context_dict.is_loaded("API")
+    assert task.context_dict["API"].index("orders.py") < task.context_dict["API"].index("users.py")
@@ -0,0 +1,28 @@
+"""Shared fixtures/helpers for unit tests."""
+
+from __future__ import annotations
+
+import pytest
+
+from context.ast import build_prompt_order
+from context.log import Log, configure_logger
+from context.tag_parser import parse_tags
+
+
+@pytest.fixture(autouse=True)
+def _configure_test_logger() -> None:
+    if Log.logger is None:
+        Log.logger = configure_logger(debug=False, logToFile=False)
+
+
+@pytest.fixture
+def parse_tasks():
+    """Parse the given files into ordered Tasks, failing the test on any parse error."""
+
+    def parse(*paths):
+        tasks, errors = parse_tags([str(path) for path in paths], in_comment_signs=[])
+        assert errors == []
+        build_prompt_order(tasks)
+        return tasks
+
+    return parse
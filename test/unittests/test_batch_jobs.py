@@ -0,0 +1,167 @@
+"""Unit tests for context.batch_jobs and the --batch-submit / --batch-collect flow.
+
+Covers:
+- Batch input lines follow the OpenAI batch format (custom_id, method, url, chat completion body).
+- A local stand-in for the provider answers every request, and its output can be collected.
+- Collected results are applied through the normal write path; failed results are reported, not applied.
+- Prompts needing the output of other prompts of the batch are deferred to a later batch.
+"""
+
+from __future__ import annotations
+
+import json
+import os
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from context.batch_jobs import make_custom_id, read_batch_results, split_custom_id
+from context.code_generator import collect_batch, submit_batch
+from context.config import Config
+from context.Context import configurationProcess, contextProcess
+
+
+def _write_project_file(tmp_path: Path) -> Path:
+    f = tmp_path / "gen.txt"
+    f.write_text(
+        "<prompt:A>\nDo A\n<prompt:A/>\n{A}\n<prompt:B>\nDo B\n<prompt:B/>\n<B>\nold\n<B/>\n", encoding="utf-8"
+    )
+    return f
+
+
+def _answer_batch_locally(input_path: Path, output_path: Path) -> int:
+    """Stand-in for a provider batch job: answer every request line with the mock LLM response."""
+
+    count = 0
+    with open(input_path, encoding="utf-8") as source, open(output_path, "w", encoding="utf-8") as target:
+        for line in source:
+            request = json.loads(line)
+            count += 1
+            content = f"MOCK_LLM_RESPONSE({split_custom_id(request['custom_id'])[1]})"
+            record = {
+                "id": f"batch_req_{count}",
+                "custom_id": request["custom_id"],
+                "response": {
+                    "status_code": 200,
+                    "body": {"choices": [{"index": 0, "message": {"role": "assistant", "content": content}}]},
+                },
+                "error": None,
+            }
+            target.write(json.dumps(record) + "\n")
+    return count
+
+
+def test_custom_id_round_trip() -> None:
+    custom_id = make_custom_id(os.path.join("dir", "a::b.py"), "Prompt")
+    assert split_custom_id(custom_id) == (os.path.join("dir", "a::b.py"), "Prompt")
+
+
+def test_submit_writes_openai_batch_lines(tmp_path: Path, parse_tasks) -> None:
+    f = _write_project_file(tmp_path)
+    batch_path = tmp_path / "batch.jsonl"
+
+    assert submit_batch(parse_tasks(f), str(batch_path)) == 2
+
+    lines = [json.loads(line) for line in batch_path.read_text(encoding="utf-8").splitlines()]
+    assert [line["custom_id"] for line in lines] == [make_custom_id(str(f), "A"), make_custom_id(str(f), "B")]
+    assert lines[0]["method"] == "POST"
+    assert lines[0]["url"] == "/v1/chat/completions"
+    assert lines[0]["body"]["model"] == Config.Model
+    assert [m["role"] for m in lines[0]["body"]["messages"]] == ["system", "user"]
+    assert lines[0]["body"]["messages"][1]["content"] == "Do A"
+
+
+def test_local_stand_in_round_trip_applies_results(tmp_path: Path, parse_tasks) -> None:
+    f = _write_project_file(tmp_path)
+    batch_path = tmp_path / "batch.jsonl"
+    results_path = tmp_path / "results.jsonl"
+
+    submit_batch(parse_tasks(f), str(batch_path))
+    assert _answer_batch_locally(batch_path, results_path) == 2
+
+    summary = collect_batch(parse_tasks(f), str(results_path))
+
+    assert summary.completed == 2
+    assert f.read_text(encoding="utf-8").endswith(
+        "MOCK_LLM_RESPONSE(A)\n<prompt:B>\nDo B\n<prompt:B/>\n<B>\nMOCK_LLM_RESPONSE(B)\n<B/>\n"
+    )
+
+
+def test_prompts_needing_outputs_of_the_batch_are_deferred_to_later_batches(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, parse_tasks
+) -> None:
+    monkeypatch.setattr(Config, "Resume", True)
+    monkeypatch.setattr(Config, "Journal_Path", str(tmp_path / "journal.jsonl"))
+    f = tmp_path / "gen.txt"
+    f.write_text(
+        "<prompt:A>\nDo A\n<prompt:A/>\n<A>\n<A/>\n<prompt:B>\nUse {A}\n<prompt:B/>\n<B>\n<B/>\n"
+        "<prompt:C->X>\nWrite X\n<prompt:C->X/>\n<prompt:D->X>\nRefine X\n<prompt:D->X/>\n<X>\nseed\n<X/>\n",
+        encoding="utf-8",
+    )
+    batches = []
+    for number in range(3):
+        batch_path = tmp_path / f"batch-{number}.jsonl"
+        results_path = tmp_path / f"results-{number}.jsonl"
+        submit_batch(parse_tasks(f), str(batch_path))
+        lines = [json.loads(line) for line in batch_path.read_text(encoding="utf-8").splitlines()]
+        batches.append(
+            {split_custom_id(line["custom_id"])[1]: line["body"]["messages"][1]["content"] for line in lines}
+        )
+        _answer_batch_locally(batch_path, results_path)
+        summary = collect_batch(parse_tasks(f), str(results_path))
+        assert summary.failed == 0
+        assert summary.completed == len(lines)
+
+    assert [sorted(batch) for batch in batches] == [["A", "C"], ["B", "D"], []]
+    # Deferred prompts are rendered against the collected outputs of the earlier batch.
+    assert "MOCK_LLM_RESPONSE(A)" in batches[1]["B"]
+    assert "CODE_TO_MODIFY:\nMOCK_LLM_RESPONSE(C)" in batches[1]["D"]
+    content = f.read_text(encoding="utf-8")
+    assert "<B>\nMOCK_LLM_RESPONSE(B)\n<B/>" in content
+    assert "<X>\nMOCK_LLM_RESPONSE(D)\n<X/>" in content
+
+
+def test_collect_reports_failed_results_without_applying(tmp_path: Path, parse_tasks) -> None:
+    f = _write_project_file(tmp_path)
+    results_path = tmp_path / "results.jsonl"
+    results_path.write_text(
+        json.dumps({"custom_id": make_custom_id(str(f), "A"), "response": {"status_code": 429}, "error": None}) + "\n",
+        encoding="utf-8",
+    )
+
+    results, errors = read_batch_results(str(results_path))
+    assert results == {}
+    assert errors == {make_custom_id(str(f), "A"): "status 429"}
+
+    before = f.read_text(encoding="utf-8")
+    summary = collect_batch(parse_tasks(f), str(results_path))
+
+    assert summary.failed == 2
+    assert f.read_text(encoding="utf-8") == before
+
+
+def test_context_process_batch_submit_needs_no_api_key(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.delenv("CONTEXT_CONFIG_Open_Router_Api_Key", raising=False)
+    monkeypatch.setattr(Config, "MockLLM", False)
+    f = _write_project_file(tmp_path)
+    batch_path = tmp_path / "batch.jsonl"
+
+    args = SimpleNamespace(
+        debug=False,
+        log=False,
+        parser=False,
+        filepath=str(f),
+        openrouter_key=None,
+        model=Config.Model,
+        batch_submit=str(batch_path),
+    )
+    try:
+        configurationProcess(args)
+        contextProcess()
+    finally:
+        Config.Batch_Submit_Path = None
+        Config.FilePathProvided = False
+        Config.FilePath = ""
+
+    assert len(batch_path.read_text(encoding="utf-8").splitlines()) == 2
@@ -0,0 +1,68 @@
+"""Unit tests for context.blob_store and interning of context values in LazyContextDict."""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from context.blob_store import BlobStore, content_digest, content_key
+from context.lazy_context import LazyContextDict
+from context.tag_parser import parse_tags
+
+
+def test_store_keeps_one_copy_per_distinct_content() -> None:
+    store = BlobStore()
+    value = "x" * 40_000
+
+    refs = [store.put("".join(["x" * 20_000, "x" * 20_000])) for _ in range(500)]
+
+    assert len(store) == 1
+    assert store.stored_chars == 40_000
+    assert store.references == 500
+    assert {ref.digest for ref in refs} == {content_digest(value)}
+    assert store.get(refs[0]) == value
+    assert repr(refs[0]) == f"<blob {content_digest(value)[:12]} 40000 chars>"
+
+
+def test_content_key_separates_parts() -> None:
+    assert content_key("ab", "c") != content_key("a", "bc")
+    assert content_key("m", "p") == content_key("m", "p")
+
+
+def test_context_dicts_share_interned_values_and_repr_shows_references() -> None:
+    store = BlobStore()
+    first, second = LazyContextDict(store), LazyContextDict(store)
+
+    first["A"] = "shared value"
+    second["B"] = "shared value"
+
+    assert len(store) == 1
+    assert first["A"] == second["B"] == "shared value"
+    assert "shared value" not in repr(first)
+
+
+def test_lazy_value_with_known_digest_reuses_stored_content() -> None:
+    store = BlobStore()
+    store.put("known")
+    context = LazyContextDict(store)
+    context.set_lazy("A", lambda: pytest.fail("stored content must not be reloaded"), "a.txt", content_digest("known"))
+
+    assert context.digest("A") == content_digest("known")
+    assert context["A"] == "known"
+
+
+def test_parsed_tasks_intern_identical_imported_values(tmp_path: Path) -> None:
+    shared = tmp_path / "shared.txt"
+    shared.write_text("<context:BIG>\n" + "y" * 1000 + "\n<context:BIG/>\n", encoding="utf-8")
+    paths = []
+    for name in ("a.txt", "b.txt"):
+        path = tmp_path / name
+        path.write_text(f"<import>{shared}<import/>\n<prompt:P>\n{{BIG}}\n<prompt:P/>\n{{P}}\n", encoding="utf-8")
+        paths.append(str(path))
+
+    tasks, errors = parse_tags(paths, in_comment_signs=[])
+
+    assert errors == []
+    assert tasks[0].context_dict["BIG"] is tasks[1].context_dict["BIG"]
+    assert "y" * 1000 not in str(tasks[0])
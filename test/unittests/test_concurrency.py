@@ -0,0 +1,324 @@
+"""Unit tests for context.concurrency and the LLM retry path in code_generator.
+
+Covers:
+- AIMD behaviour of AdaptiveConcurrencyLimiter (additive increase, multiplicative decrease, bounds).
+- Overload classification of provider errors (429 / timeouts vs. other failures).
+- Retrying a prompt on overload and recording it in the RunSummary.
+- Cancelling unwritten prompts when the run deadline expires.
+- Single-flight deduplication of identical requests.
+"""
+
+from __future__ import annotations
+
+import json
+import time
+
+import pytest
+
+from context import code_generator
+from context.concurrency import AdaptiveConcurrencyLimiter, SingleFlight, is_overload_error
+from context.config import Config
+from context.run_state import RunState, percentile
+
+
+class _RateLimitError(Exception):
+    status_code = 429
+
+
+def test_limiter_increases_additively_on_fast_successes() -> None:
+    limiter = AdaptiveConcurrencyLimiter(initial=2, minimum=1, maximum=4)
+
+    for _ in range(20):
+        limiter.on_success(0.1)
+
+    assert limiter.limit == 4
+    assert limiter.peak == 4
+
+
+def test_limiter_halves_on_overload_and_respects_minimum() -> None:
+    limiter = AdaptiveConcurrencyLimiter(initial=8, minimum=2, maximum=16)
+
+    limiter.on_overload()
+    assert limiter.limit == 4
+
+    # Consecutive overload signals without any latency window are each honoured down to the floor.
+    limiter.on_overload()
+    limiter.on_overload()
+    assert limiter.limit == 2
+
+
+def test_limiter_backs_off_when_latency_rises_above_baseline() -> None:
+    limiter = AdaptiveConcurrencyLimiter(initial=8, minimum=1, maximum=16, latency_tolerance=2.0)
+
+    limiter.on_success(0.0)
+    for _ in range(5):
+        limiter.on_success(10.0)
+
+    assert limiter.limit < 8
+
+
+def test_limiter_does_not_mistake_long_answers_for_congestion() -> None:
+    limiter = AdaptiveConcurrencyLimiter(initial=4, minimum=1, maximum=16)
+    limits = []
+
+    # Short and long answers at the same speed per token: 1s for 50 tokens, 20s for 4000.
+    for _ in range(20):
+        limiter.on_success(1.0, output_tokens=50)
+        limiter.on_success(20.0, output_tokens=4000)
+        limits.append(limiter.limit)
+
+    assert min(limits) >= 4
+    assert limiter.limit > 4
+
+
+def test_limiter_baseline_follows_a_lasting_change_in_speed() -> None:
+    limiter = AdaptiveConcurrencyLimiter(initial=4, minimum=1, maximum=16, baseline_window=10)
+    for _ in range(10):
+        limiter.on_success(0.1, output_tokens=1000)
+    for _ in range(10):
+        limiter.on_success(1.0, output_tokens=1000)
+    slowed_down = limiter.limit
+
+    # Once the slow responses fill the window they are the new baseline, and the limit grows again.
+    for _ in range(30):
+        limiter.on_success(1.0, output_tokens=1000)
+
+    assert slowed_down < 4
+    assert limiter.limit > slowed_down
+
+
+def test_limiter_rejects_invalid_bounds() -> None:
+    with pytest.raises(ValueError, match="Invalid concurrency bounds"):
+        AdaptiveConcurrencyLimiter(initial=1, minimum=4, maximum=2)
+
+
+def test_is_overload_error_classification() -> None:
+    assert is_overload_error(_RateLimitError())
+    assert is_overload_error(TimeoutError())
+    assert not is_overload_error(ValueError("bad request"))
+
+
+def test_percentile_nearest_rank() -> None:
+    assert percentile([], 50) is None
+    assert percentile([3.0, 1.0, 2.0], 50) == 2.0
+    assert percentile([1.0, 2.0, 3.0, 4.0], 99) == 4.0
+
+
+def test_call_llm_retries_on_rate_limit_and_records_summary(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(Config, "Retry_Backoff_Seconds", 0)
+    calls = {"n": 0}
+
+    def fake_generate(prompt: str, prompt_name: str) -> str:
+        calls["n"] += 1
+        if calls["n"] == 1:
+            raise _RateLimitError("slow down")
+        return json.dumps({"code": "OK"})
+
+    monkeypatch.setattr(code_generator, "generate_code_with_chat", fake_generate)
+
+    run = RunState()
+    out = code_generator.__call_llm("prompt", "P", run)
+
+    assert json.loads(out) == {"code": "OK"}
+    assert calls["n"] == 2
+    assert run.summary.retries == 1
+    assert run.summary.completed == 1
+    assert run.limiter.in_flight == 0
+
+
+def test_retry_backoff_stops_at_the_run_deadline(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(Config, "Retry_Backoff_Seconds", 60)
+    monkeypatch.setattr(Config, "Deadline", 0.2)
+    calls = []
+
+    def fake_generate(prompt: str, prompt_name: str) -> str:
+        calls.append(prompt_name)
+        raise _RateLimitError("slow down")
+
+    monkeypatch.setattr(code_generator, "generate_code_with_chat", fake_generate)
+
+    run = RunState()
+    started = time.monotonic()
+    out = code_generator.__call_llm("prompt", "P", run)
+
+    assert out is None
+    assert calls == ["P"]
+    assert time.monotonic() - started < 5
+    assert run.is_cancelled()
+
+
+def test_run_summary_reports_streaming_metrics() -> None:
+    run = RunState()
+    run.summary.record_call_metrics({"stream": {"ttft": 0.5, "tokens": 10, "duration": 1.5}})
+
+    lines = run.summary.lines()
+
+    assert any("time to first token p50 0.50s" in line and "10.0 tok/s" in line for line in lines)
+
+
+def test_call_llm_does_not_retry_non_overload_errors(monkeypatch: pytest.MonkeyPatch) -> None:
+    def fake_generate(prompt: str, prompt_name: str) -> str:
+        raise ValueError("bad request")
+
+    monkeypatch.setattr(code_generator, "generate_code_with_chat", fake_generate)
+
+    run = RunState()
+    with pytest.raises(ValueError, match="bad request"):
+        code_generator.__call_llm("prompt", "P", run)
+
+    assert run.summary.failed == 1
+    assert run.summary.retries == 0
+
+
+def test_generate_code_deadline_cancels_unwritten_prompts(tmp_path, monkeypatch: pytest.MonkeyPatch) -> None:
+    from types import SimpleNamespace
+
+    monkeypatch.setattr(Config, "Deadline", 0.3)
+
+    f = tmp_path / "slow.txt"
+    f.write_text("{A}\n{B}\n", encoding="utf-8")
+    task = SimpleNamespace(
+        filepath=str(f),
+        prompts={"A": "a", "B": "b"},
+        context_dict={},
+        global_context="",
+        prompt_outputs={"A", "B"},
+        prompt_outputs_tags={},
+        prompt_output_targets={},
+        prompt_order=["A", "B"],
+    )
+
+    def fake_generate(prompt: str, prompt_name: str) -> str:
+        if prompt_name == "B":
+            time.sleep(1.0)
+        return json.dumps({"code": f"CODE_{prompt_name}"})
+
+    monkeypatch.setattr(code_generator, "generate_code_with_chat", fake_generate)
+
+    summary = code_generator.generate_code([task])
+
+    assert summary.cancelled == {str(f): ["B"]}
+    assert f.read_text(encoding="utf-8") == "CODE_A\n{B}\n"
+    assert any("Cancelled: 1 prompts" in line for line in summary.lines())
+
+    # The late response for B must be discarded rather than written after cancellation.
+    time.sleep(1.0)
+    assert f.read_text(encoding="utf-8") == "CODE_A\n{B}\n"
+
+
+def test_generate_code_returns_at_the_deadline_without_waiting_for_a_hung_request(
+    tmp_path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    import threading
+    from types import SimpleNamespace
+
+    monkeypatch.setattr(Config, "Deadline", 0.3)
+    f = tmp_path / "hung.txt"
+    f.write_text("{A}\n", encoding="utf-8")
+    task = SimpleNamespace(
+        filepath=str(f),
+        prompts={"A": "a"},
+        context_dict={},
+        global_context="",
+        prompt_outputs={"A"},
+        prompt_outputs_tags={},
+        prompt_output_targets={},
+        prompt_order=["A"],
+    )
+    release = threading.Event()
+    request_threads = []
+
+    def hung_generate(prompt: str, prompt_name: str) -> str:
+        request_threads.append(threading.current_thread())
+        release.wait(timeout=30)
+        return json.dumps({"code": "LATE"})
+
+    monkeypatch.setattr(code_generator, "generate_code_with_chat", hung_generate)
+
+    started = time.monotonic()
+    try:
+        summary = code_generator.generate_code([task])
+        elapsed = time.monotonic() - started
+        # Nothing left that would keep the interpreter from exiting: the request runs on a daemon thread.
+        assert [thread.daemon for thread in request_threads] == [True]
+        assert not [
+            thread for thread in threading.enumerate() if thread.name.startswith("context_") and not thread.daemon
+        ]
+    finally:
+        release.set()
+
+    assert elapsed < 2
+    assert summary.cancelled == {str(f): ["A"]}
+    assert f.read_text(encoding="utf-8") == "{A}\n"
+
+
+def test_single_flight_shares_one_concurrent_call() -> None:
+    import threading
+
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = {"n": 0}
+    results = []
+
+    def slow_call() -> str:
+        calls["n"] += 1
+        release.wait(timeout=5)
+        return "R"
+
+    threads = [threading.Thread(target=lambda: results.append(flight.do("k", slow_call))) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    time.sleep(0.1)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert calls["n"] == 1
+    assert sorted(results) == [("R", False)] + [("R", True)] * 4
+
+
+def test_single_flight_does_not_keep_failures() -> None:
+    flight = SingleFlight()
+
+    def boom() -> str:
+        raise RuntimeError("boom")
+
+    with pytest.raises(RuntimeError):
+        flight.do("k", boom)
+
+    assert flight.do("k", lambda: "OK") == ("OK", False)
+
+
+def test_generate_code_deduplicates_identical_prompts_across_files(tmp_path, monkeypatch: pytest.MonkeyPatch) -> None:
+    from types import SimpleNamespace
+
+    tasks = []
+    for name in ("a.txt", "b.txt", "c.txt"):
+        f = tmp_path / name
+        f.write_text("{P}\n", encoding="utf-8")
+        tasks.append(
+            SimpleNamespace(
+                filepath=str(f),
+                prompts={"P": "same prompt"},
+                context_dict={},
+                global_context="",
+                prompt_outputs={"P"},
+                prompt_outputs_tags={},
+                prompt_output_targets={},
+                prompt_order=None,
+            )
+        )
+
+    calls = {"n": 0}
+
+    def fake_generate(prompt: str, prompt_name: str) -> str:
+        calls["n"] += 1
+        return json.dumps({"code": "SHARED"})
+
+    monkeypatch.setattr(code_generator, "generate_code_with_chat", fake_generate)
+
+    summary = code_generator.generate_code(tasks)
+
+    assert calls["n"] == 1
+    assert summary.deduplicated == 2
+    assert all((tmp_path / name).read_text(encoding="utf-8") == "SHARED\n" for name in ("a.txt", "b.txt", "c.txt"))
@@ -215,3 +215,46 @@ def test_print_formatted_errors_raises_on_malformed_error_string() -> None:
     # No ": " delimiter => split will fail.
     with pytest.raises(ValueError):
         print_formatted_errors(["this has no delimiter"])
+
+
+def _run_with_a_broken_file(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, strict: bool) -> tuple[Path, Path]:
+    monkeypatch.chdir(tmp_path)
+    # configurationProcess sets Config attributes (Strict among them); restore them after the test.
+    for name in [name for name in vars(Config) if name[:1].isupper()]:
+        monkeypatch.setattr(Config, name, getattr(Config, name))
+    good = tmp_path / "good.txt"
+    good.write_text("<prompt:A>\nDo thing\n<prompt:A/>\n<A>\n<A/>\n", encoding="utf-8")
+    bad = tmp_path / "bad.txt"
+    bad.write_text("<prompt:B>\nfirst\n<prompt:B/>\n<prompt:B>\nsecond\n<prompt:B/>\n{B}\n", encoding="utf-8")
+    args = SimpleNamespace(
+        debug=False,
+        log=False,
+        parser=False,
+        mock_llm=True,
+        filepath=str(tmp_path),
+        openrouter_key=None,
+        model=Config.Model,
+        strict=strict,
+    )
+    configurationProcess(args)
+    contextProcess()
+    return good, bad
+
+
+def test_strict_run_aborts_on_a_parse_error_before_generating(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]
+) -> None:
+    good, _ = _run_with_a_broken_file(tmp_path, monkeypatch, strict=True)
+
+    assert "Total errors in" in capsys.readouterr().out
+    assert good.read_text(encoding="utf-8") == "<prompt:A>\nDo thing\n<prompt:A/>\n<A>\n<A/>\n"
+
+
+def test_streaming_run_skips_only_the_file_with_a_parse_error(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture[str]
+) -> None:
+    good, bad = _run_with_a_broken_file(tmp_path, monkeypatch, strict=False)
+
+    assert "These files were skipped because of errors" in capsys.readouterr().out
+    assert "MOCK_LLM_RESPONSE(A)" in good.read_text(encoding="utf-8")
+    assert "{B}" in bad.read_text(encoding="utf-8")
@@ -0,0 +1,94 @@
+"""Unit tests for context.context_index (persisted, incremental index of context variables)."""
+
+from __future__ import annotations
+
+import os
+from pathlib import Path
+
+import pytest
+
+from context.config import Config
+from context.context_index import ContextIndex
+from context.tag_parser import parse_tags, regexPatterns
+
+
+def _write(path: Path, content: str) -> Path:
+    path.write_text(content, encoding="utf-8")
+    return path
+
+
+def test_entry_records_spans_declarations_and_reads_values_by_seeking(tmp_path: Path) -> None:
+    shared = _write(
+        tmp_path / "shared.txt",
+        "<import>base.txt<import/>\n<context:ONE>\n  one  \n<context:ONE/>\n<context:TWO>two<context:TWO/>\n",
+    )
+    index = ContextIndex(regexPatterns)
+
+    entry = index.entry(str(shared))
+
+    assert list(entry["context"]) == ["ONE", "TWO"]
+    assert entry["imports"] == ["base.txt"]
+    start, end, digest = entry["context"]["TWO"]
+    assert shared.read_bytes()[start:end] == b"two"
+    assert len(digest) == 64
+    assert index.read_variable(str(shared), "ONE") == "one"
+
+
+def test_persisted_index_only_rescans_changed_files(tmp_path: Path) -> None:
+    a = _write(tmp_path / "a.txt", "<context:A>a<context:A/>\n")
+    b = _write(tmp_path / "b.txt", "<context:B>b<context:B/>\n")
+    index_path = str(tmp_path / "cache" / "index.json")
+
+    first = ContextIndex(regexPatterns, index_path)
+    first.refresh([str(a), str(b)])
+    first.save()
+    assert first.scanned == 2
+
+    _write(b, "<context:B>changed value<context:B/>\n")
+    second = ContextIndex(regexPatterns, index_path)
+    second.refresh([str(a), str(b)])
+
+    assert second.scanned == 1
+    assert second.read_variable(str(b), "B") == "changed value"
+
+
+def test_where_lists_definitions_and_forgets_deleted_files(tmp_path: Path) -> None:
+    a = _write(tmp_path / "a.txt", "<context:SHARED>a<context:SHARED/>\n")
+    b = _write(tmp_path / "b.txt", "<context:SHARED>b<context:SHARED/>\n")
+    index = ContextIndex(regexPatterns)
+    index.refresh([str(a), str(b)])
+
+    assert [os.path.basename(d[0]) for d in index.where("SHARED")] == ["a.txt", "b.txt"]
+
+    b.unlink()
+    index.refresh([str(a)])
+    assert [os.path.basename(d[0]) for d in index.where("SHARED")] == ["a.txt"]
+    assert index.where("MISSING") == []
+
+
+def test_parse_tags_persists_index_of_imported_files(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    index_path = tmp_path / "index.json"
+    monkeypatch.setattr(Config, "Index_Path", str(index_path))
+    shared = _write(tmp_path / "shared.txt", "<context:ONE>\n1\n<context:ONE/>\n")
+    main = _write(
+        tmp_path / "main.txt", f"<import:ONE>{shared}<import:ONE/>\n<prompt:P>\n{{ONE}}\n<prompt:P/>\n{{P}}\n"
+    )
+
+    tasks, errors = parse_tags([str(main)], in_comment_signs=[])
+
+    assert errors == []
+    assert tasks[0].context_dict["ONE"] == "1"
+    assert ContextIndex(regexPatterns, str(index_path)).where("ONE")[0][0] == str(shared)
+
+
+def test_read_variable_rescans_a_file_rewritten_since_it_was_scanned(tmp_path: Path) -> None:
+    shared = _write(tmp_path / "shared.txt", "<context:ONE>one<context:ONE/>\n")
+    index = ContextIndex(regexPatterns)
+    stat = os.stat(shared)
+    index.entry(str(shared))
+
+    # Rewritten between the stat check and the read: same size and mtime, shifted span.
+    _write(shared, "x<context:ONE>on<context:ONE/>\n")
+    os.utime(shared, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+
+    assert index.read_variable(str(shared), "ONE") == "on"
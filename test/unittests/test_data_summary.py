@@ -0,0 +1,73 @@
+"""Unit tests for context.data_summary (SCHEMA summaries of CSV/TSV/JSONL imports)."""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import pytest
+
+from context.data_summary import summarize_data_file
+
+
+def test_csv_summary_reports_rows_types_and_sample(tmp_path: Path) -> None:
+    data = tmp_path / "data.csv"
+    rows = ["id,price,name,created,active"] + [f"{i},{i}.5,item {i},2024-01-0{i % 9 + 1},true" for i in range(1000)]
+    rows.append("1000,,item 1000,2024-02-01,false")
+    data.write_text("\n".join(rows) + "\n", encoding="utf-8")
+
+    summary = summarize_data_file(str(data), sample_rows=2)
+
+    assert "ROWS: 1001" in summary
+    assert "- id: integer" in summary
+    assert "- price: float (1 empty)" in summary
+    assert "- name: string" in summary
+    assert "- created: datetime" in summary
+    assert "- active: boolean" in summary
+    assert summary.endswith(
+        "SAMPLE (first 2 rows):\nid,price,name,created,active\n0,0.5,item 0,2024-01-01,true\n"
+        "1,1.5,item 1,2024-01-02,true\n"
+    )
+
+
+def test_tsv_mixed_integer_and_float_widen_to_float(tmp_path: Path) -> None:
+    data = tmp_path / "data.tsv"
+    data.write_text("a\tb\n1\tx\n2.5\t3\n", encoding="utf-8")
+
+    summary = summarize_data_file(str(data))
+
+    assert "- a: float" in summary
+    assert "- b: string" in summary
+
+
+def test_jsonl_summary_tracks_missing_keys(tmp_path: Path) -> None:
+    data = tmp_path / "events.jsonl"
+    records = [{"id": 1, "tags": ["a"]}, {"id": 2, "user": {"name": "x"}}, {"id": 3.5, "tags": None}]
+    data.write_text("\n".join(json.dumps(r) for r in records) + "\n\n", encoding="utf-8")
+
+    summary = summarize_data_file(str(data), sample_rows=1)
+
+    assert "ROWS: 3" in summary
+    assert "- id: float" in summary
+    assert "- tags: array (2 empty)" in summary
+    assert "- user: object (2 empty)" in summary
+    assert summary.endswith('SAMPLE (first 1 rows):\n{"id": 1, "tags": ["a"]}\n')
+
+
+def test_jsonl_summary_skips_and_counts_malformed_lines(tmp_path: Path) -> None:
+    data = tmp_path / "events.jsonl"
+    data.write_text('{"id": 1}\n{"id": 2, "trunc\nnot json\n{"id": 3}\n', encoding="utf-8")
+
+    summary = summarize_data_file(str(data))
+
+    assert "ROWS: 2\nMALFORMED LINES (skipped): 2\n" in summary
+    assert "- id: integer" in summary
+    assert summary.endswith('{"id": 1}\n{"id": 3}\n')
+
+
+def test_summarize_rejects_unsupported_extension(tmp_path: Path) -> None:
+    data = tmp_path / "data.txt"
+    data.write_text("x", encoding="utf-8")
+
+    with pytest.raises(ValueError, match="SCHEMA import supports"):
+        summarize_data_file(str(data))
@@ -0,0 +1,100 @@
+"""Unit tests for context.file_imports (modifiers of <file:NAME>path | MODIFIER<file:NAME/> imports)."""
+
+from __future__ import annotations
+
+from pathlib import Path
+
+import pytest
+
+from context import file_imports
+from context.file_imports import parse_file_import, read_file_import
+
+
+@pytest.fixture
+def numbered(tmp_path: Path) -> Path:
+    path = tmp_path / "numbered.log"
+    path.write_text("".join(f"line {i}\n" for i in range(1, 101)), encoding="utf-8")
+    return path
+
+
+def test_parse_file_import_modifiers() -> None:
+    assert parse_file_import(" data.csv ") == ("data.csv", None, [])
+    assert parse_file_import("data.csv | schema 3") == ("data.csv", "SCHEMA", [3])
+
+    with pytest.raises(ValueError, match="integer arguments"):
+        parse_file_import("data.csv | SCHEMA x")
+    with pytest.raises(ValueError, match="empty modifier"):
+        parse_file_import("data.csv |")
+
+
+def test_read_file_import_rejects_unknown_modifier(tmp_path: Path) -> None:
+    data = tmp_path / "data.csv"
+    data.write_text("a\n1\n", encoding="utf-8")
+
+    with pytest.raises(ValueError, match="Unknown file import modifier 'FOO'"):
+        read_file_import(f"{data} | FOO")
+
+
+def test_head_returns_first_lines(numbered: Path) -> None:
+    assert read_file_import(f"{numbered} | HEAD 2") == "line 1\nline 2\n"
+    assert read_file_import(f"{numbered} | HEAD 0") == ""
+
+
+def test_tail_returns_last_lines_across_block_boundaries(numbered: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    # Tiny blocks force several backward reads that split lines.
+    monkeypatch.setattr(file_imports, "_TAIL_BLOCK_SIZE", 7)
+
+    assert read_file_import(f"{numbered} | TAIL 3") == "line 98\nline 99\nline 100\n"
+    assert read_file_import(f"{numbered} | TAIL 500") == numbered.read_text(encoding="utf-8")
+
+
+def test_tail_without_trailing_newline(tmp_path: Path) -> None:
+    path = tmp_path / "no_newline.txt"
+    path.write_text("a\nb\nc", encoding="utf-8")
+
+    assert read_file_import(f"{path} | TAIL 2") == "b\nc"
+
+
+def test_mid_returns_inclusive_line_range(numbered: Path) -> None:
+    assert read_file_import(f"{numbered} | MID 10 12") == "line 10\nline 11\nline 12\n"
+    assert read_file_import(f"{numbered} | MID 99 200") == "line 99\nline 100\n"
+
+    with pytest.raises(ValueError, match="1 <= start <= end"):
+        read_file_import(f"{numbered} | MID 5 4")
+
+
+def test_modifiers_validate_argument_count(numbered: Path) -> None:
+    with pytest.raises(ValueError, match="HEAD expects one argument"):
+        read_file_import(f"{numbered} | HEAD")
+    with pytest.raises(ValueError, match="MID expects two arguments"):
+        read_file_import(f"{numbered} | MID 1")
+
+
+def test_dir_import_concatenates_matching_files_with_headers(tmp_path: Path) -> None:
+    (tmp_path / "b.py").write_text("print('b')\n", encoding="utf-8")
+    (tmp_path / "a.py").write_text("print('a')", encoding="utf-8")
+    (tmp_path / "c.txt").write_text("not python\n", encoding="utf-8")
+
+    content = file_imports.read_dir_import(str(tmp_path / "*.py"))
+
+    assert content == f"# File: {tmp_path / 'a.py'}\nprint('a')\n# File: {tmp_path / 'b.py'}\nprint('b')\n"
+
+
+def test_dir_import_stops_at_byte_budget(tmp_path: Path) -> None:
+    for name in ("a.py", "b.py", "c.py"):
+        (tmp_path / name).write_text("x" * 100, encoding="utf-8")
+    header = len(f"# File: {tmp_path / 'a.py'}\n")
+
+    content = file_imports.read_dir_import(f"{tmp_path / '*.py'} | MAX_BYTES {2 * header + 150}")
+
+    assert content.count("# File:") == 2
+    assert "x" * 100 in content
+    budget = 2 * header + 150
+    assert content.endswith(f"[... truncated; 1 more files omitted: budget of {budget} bytes reached ...]\n")
+
+
+def test_dir_import_validates_spec(tmp_path: Path) -> None:
+    with pytest.raises(ValueError, match="does not match any files"):
+        file_imports.read_dir_import(str(tmp_path / "*.none"))
+    with pytest.raises(ValueError, match="Unknown directory import modifier 'HEAD'"):
+        file_imports.parse_dir_import("src/*.py | HEAD 3")
@@ -19,7 +19,8 @@ from pathlib import Path
 
 import pytest
 
-from context.file_manager import get_file_paths
+from context import file_manager
+from context.file_manager import TEMP_SUFFIX, get_file_paths, ignore_paths, write_file_atomically
 
 
 def _touch(path: Path, content: str = "x") -> None:
@@ -185,3 +186,48 @@ def test_get_file_paths_traverses_windows_junction_without_crashing(tmp_path: Pa
 
     # We should at least see the file under the junction path.
     assert (link / "t.txt").resolve() in got
+
+
+def test_glob_file_paths_sorts_and_honours_ignore_rules(tmp_path: Path) -> None:
+    from context.file_manager import glob_file_paths
+
+    _touch(tmp_path / ".gitignore", "build/\n*.gen.py\n")
+    _touch(tmp_path / "src" / "b.py")
+    _touch(tmp_path / "src" / "a.py")
+    _touch(tmp_path / "src" / "nested" / "c.py")
+    _touch(tmp_path / "src" / "skip.gen.py")
+    _touch(tmp_path / "src" / "build" / "d.py")
+    _touch(tmp_path / "src" / "Context_Logs" / "e.py")
+
+    got = glob_file_paths(str(tmp_path / "src" / "**" / "*.py"), root=str(tmp_path))
+
+    assert [Path(p).relative_to(tmp_path).as_posix() for p in got] == ["src/a.py", "src/b.py", "src/nested/c.py"]
+
+
+def test_write_file_atomically_replaces_content_and_keeps_the_mode(tmp_path: Path) -> None:
+    target = tmp_path / "script.sh"
+    _touch(target, "old")
+    target.chmod(0o755)
+
+    write_file_atomically(str(target), "new")
+
+    assert target.read_text(encoding="utf-8") == "new"
+    assert target.stat().st_mode & 0o777 == 0o755
+    assert os.listdir(tmp_path) == ["script.sh"]
+
+
+def test_get_file_paths_skips_temporary_files_of_atomic_writes(tmp_path: Path) -> None:
+    _touch(tmp_path / "a.txt")
+    _touch(tmp_path / f"a.txt.1.2{TEMP_SUFFIX}")
+
+    assert get_file_paths(str(tmp_path)) == [str(tmp_path / "a.txt")]
+
+
+def test_get_file_paths_skips_run_state_files(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(file_manager, "ignore_list", list(file_manager.ignore_list))
+    for name in ("a.txt", ".context_journal.jsonl", "context.lock", "jobs.db", "jobs.db-journal"):
+        _touch(tmp_path / name)
+
+    ignore_paths(str(tmp_path / "jobs.db"), str(tmp_path / "jobs.db-journal"), None)
+
+    assert get_file_paths(str(tmp_path)) == [str(tmp_path / "a.txt")]
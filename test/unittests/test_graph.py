@@ -4,20 +4,29 @@ These tests mock the LangChain ChatOpenAI client. They verify:
 - client configuration (api_key/model/base_url)
 - message construction (SystemMessage + HumanMessage; prompt_name substitution)
 - response normalization (AIMessage vs non-AIMessage)
+- streaming mode (chunks accumulated into one response, TTFT/token metrics reported)
+- hedged requests (duplicate sent past the latency percentile, capped by the spend budget)
 
 They do not test the langgraph wiring (graph shape), by design.
 """
 
 from __future__ import annotations
 
+import threading
+import time
+from concurrent.futures import CancelledError
 from dataclasses import dataclass, field
 from typing import Any
 
 import pytest
-from langchain_core.messages import AIMessage, HumanMessage, SystemMessage
+from langchain_core.messages import AIMessage, AIMessageChunk, HumanMessage, SystemMessage
 
+from context import graph
+from context.concurrency import AdaptiveConcurrencyLimiter
 from context.config import Config
-from context.graph import PROMPTS, _call_openrouter
+from context.graph import PROMPTS, _call_openrouter, pop_call_metrics, run_generation_graph, run_scope
+from context.log import Log, configure_logger
+from context.run_state import RunState
 
 
 def _snapshot_config() -> tuple[str, str]:
@@ -35,6 +44,7 @@ class _FakeChatOpenAI:
     api_key: str
     model: str
     base_url: str
+    timeout: float | None = None
 
     # captured from invoke
     last_messages: list[Any] | None = None
@@ -69,6 +79,7 @@ def test_call_openrouter_constructs_messages_and_configures_client(monkeypatch:
             "api_key": "KEY",
             "model": "openai/gpt-5.2",
             "base_url": "https://openrouter.ai/api/v1",
+            "timeout": Config.Request_Timeout,
         }
 
         inst: _FakeChatOpenAI = created["inst"]
@@ -111,3 +122,191 @@ def test_call_openrouter_normalizes_non_aimessage_response(monkeypatch: pytest.M
         assert out_state["response"] == "WEIRD"
     finally:
         _restore_config(snapshot)
+
+
+def test_call_openrouter_stream_mode_accumulates_chunks_and_reports_metrics(monkeypatch: pytest.MonkeyPatch) -> None:
+    snapshot = _snapshot_config()
+    try:
+        Config.Api_Key = "KEY"
+        if Log.logger is None:
+            Log.logger = configure_logger(debug=False, logToFile=False)
+        monkeypatch.setattr(Config, "Stream", True)
+
+        class _StreamingChat(_FakeChatOpenAI):
+            def invoke(self, messages: list[Any]) -> Any:  # pragma: no cover
+                raise AssertionError("invoke should not be used in streaming mode")
+
+            def stream(self, messages: list[Any]):
+                self.last_messages = messages
+                yield from (AIMessageChunk(content=part) for part in ["def ", "", "f():", " pass"])
+
+        monkeypatch.setattr("context.graph.ChatOpenAI", lambda **kwargs: _StreamingChat(**kwargs))
+
+        out_state = _call_openrouter({"prompt": "x", "prompt_name": "T", "response": ""})
+
+        assert out_state["response"] == "def f(): pass"
+        metrics = out_state["stream_metrics"]
+        assert metrics["tokens"] == 3
+        assert 0 <= metrics["ttft"] <= metrics["duration"]
+    finally:
+        _restore_config(snapshot)
+
+
+def _install_endless_stream(monkeypatch: pytest.MonkeyPatch, on_chunk) -> dict[str, Any]:
+    stream = {"chunks": 0, "closed": False}
+
+    class _EndlessChat(_FakeChatOpenAI):
+        def stream(self, messages: list[Any]):
+            try:
+                while True:
+                    stream["chunks"] += 1
+                    on_chunk(stream["chunks"])
+                    yield AIMessageChunk(content="x")
+            finally:
+                stream["closed"] = True
+
+    monkeypatch.setattr("context.graph.ChatOpenAI", lambda **kwargs: _EndlessChat(**kwargs))
+    return stream
+
+
+def test_stream_stops_at_the_next_chunk_once_the_run_is_cancelled(monkeypatch: pytest.MonkeyPatch) -> None:
+    if Log.logger is None:
+        Log.logger = configure_logger(debug=False, logToFile=False)
+    monkeypatch.setattr(Config, "Stream", True)
+    run = RunState()
+    stream = _install_endless_stream(monkeypatch, lambda chunk: chunk == 3 and run.cancel())
+
+    with run_scope(run), pytest.raises(CancelledError):
+        run_generation_graph("x", "T")
+
+    assert stream == {"chunks": 3, "closed": True}
+
+
+def test_stream_is_bounded_by_the_request_timeout_in_total(monkeypatch: pytest.MonkeyPatch) -> None:
+    if Log.logger is None:
+        Log.logger = configure_logger(debug=False, logToFile=False)
+    monkeypatch.setattr(Config, "Stream", True)
+    monkeypatch.setattr(Config, "Request_Timeout", 0.2)
+    # Every read is well within the timeout; only the stream as a whole is too slow.
+    stream = _install_endless_stream(monkeypatch, lambda chunk: time.sleep(0.02))
+
+    with pytest.raises(TimeoutError):
+        run_generation_graph("x", "T")
+
+    assert stream["closed"]
+    assert stream["chunks"] < 20
+
+
+def _install_slow_first_call(monkeypatch: pytest.MonkeyPatch) -> None:
+    calls = {"n": 0}
+    lock = threading.Lock()
+
+    def _fake_invoke(state: dict) -> tuple[dict, float]:
+        with lock:
+            calls["n"] += 1
+            n = calls["n"]
+        if n == 1:
+            time.sleep(0.5)
+            return {**state, "response": "SLOW"}, 0.5
+        return {**state, "response": "FAST"}, 0.01
+
+    monkeypatch.setattr(graph, "_invoke_graph", _fake_invoke)
+
+
+def _warm_tracker(monkeypatch: pytest.MonkeyPatch) -> graph._HedgeTracker:
+    tracker = graph._HedgeTracker()
+    for _ in range(Config.Hedge_Min_Samples):
+        tracker.record_latency(0.01)
+        tracker.count_request()
+    monkeypatch.setattr(graph, "_hedge_tracker", tracker)
+    return tracker
+
+
+def test_run_generation_graph_hedges_slow_request_and_uses_first_response(monkeypatch: pytest.MonkeyPatch) -> None:
+    if Log.logger is None:
+        Log.logger = configure_logger(debug=False, logToFile=False)
+    monkeypatch.setattr(Config, "Hedge", True)
+    monkeypatch.setattr(Config, "Hedge_Max_Fraction", 1.0)
+    _warm_tracker(monkeypatch)
+    _install_slow_first_call(monkeypatch)
+
+    assert run_generation_graph("x", "T") == "FAST"
+    assert pop_call_metrics() == {"stream": None, "hedged": True, "hedge_won": True}
+
+
+def test_run_generation_graph_respects_hedge_budget(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(Config, "Hedge", True)
+    monkeypatch.setattr(Config, "Hedge_Max_Fraction", 0.0)
+    tracker = _warm_tracker(monkeypatch)
+    _install_slow_first_call(monkeypatch)
+
+    assert run_generation_graph("x", "T") == "SLOW"
+    assert tracker.hedges == 0
+    assert pop_call_metrics()["hedged"] is False
+
+
+def test_hedged_request_takes_a_limiter_slot_and_is_skipped_when_none_is_free(monkeypatch: pytest.MonkeyPatch) -> None:
+    if Log.logger is None:
+        Log.logger = configure_logger(debug=False, logToFile=False)
+    monkeypatch.setattr(Config, "Hedge", True)
+    monkeypatch.setattr(Config, "Hedge_Max_Fraction", 1.0)
+    tracker = _warm_tracker(monkeypatch)
+    _install_slow_first_call(monkeypatch)
+    run = RunState()
+    limiter = run.limiter = AdaptiveConcurrencyLimiter(initial=1, minimum=1, maximum=1)
+
+    # The caller's own request holds the only slot: no room for a duplicate.
+    with limiter.slot(), run_scope(run):
+        assert run_generation_graph("x", "T") == "SLOW"
+    assert tracker.hedges == 0
+
+    tracker = _warm_tracker(monkeypatch)
+    _install_slow_first_call(monkeypatch)
+    limiter = run.limiter = AdaptiveConcurrencyLimiter(initial=2, minimum=1, maximum=2)
+    with limiter.slot(), run_scope(run):
+        assert run_generation_graph("x", "T") == "FAST"
+    assert tracker.hedges == 1
+    # The duplicate's slot is released once it finishes.
+    deadline = time.monotonic() + 5
+    while limiter.in_flight and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert limiter.in_flight == 0
+
+
+def test_losing_streamed_duplicate_is_cancelled_and_the_hedge_pool_belongs_to_the_run(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    if Log.logger is None:
+        Log.logger = configure_logger(debug=False, logToFile=False)
+    monkeypatch.setattr(Config, "Hedge", True)
+    monkeypatch.setattr(Config, "Hedge_Max_Fraction", 1.0)
+    monkeypatch.setattr(Config, "Stream", True)
+    _warm_tracker(monkeypatch)
+    calls = []
+    slow_stream_closed = threading.Event()
+
+    class _Chat(_FakeChatOpenAI):
+        def stream(self, messages: list[Any]):
+            calls.append(len(calls))
+            if len(calls) > 1:
+                yield AIMessageChunk(content="FAST")
+                return
+            try:
+                while True:
+                    time.sleep(0.05)
+                    yield AIMessageChunk(content="slow ")
+            finally:
+                slow_stream_closed.set()
+
+    monkeypatch.setattr("context.graph.ChatOpenAI", lambda **kwargs: _Chat(**kwargs))
+    run = RunState()
+    run.limiter = AdaptiveConcurrencyLimiter(initial=2, minimum=1, maximum=2)
+
+    with run.limiter.slot(), run_scope(run):
+        assert run_generation_graph("x", "T") == "FAST"
+
+    assert slow_stream_closed.wait(timeout=5)
+    assert RunState()._hedge_pool is None
+    run.close()
+    with pytest.raises(RuntimeError):
+        run.hedge_pool().submit(time.sleep, 0)
@@ -0,0 +1,161 @@
+"""Unit tests for context.job_queue and the --queue / --worker run (queue_runner.queue_run)."""
+
+from __future__ import annotations
+
+import json
+import threading
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from context import code_generator, queue_runner
+from context.config import Config
+from context.job_queue import JobQueue
+
+
+@pytest.fixture
+def fast_queue(monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(Config, "Queue_Poll_Seconds", 0.01)
+    monkeypatch.setattr(Config, "Queue_Heartbeat_Seconds", 0.05)
+
+
+class _ThreadProcess(threading.Thread):
+    """Stands in for a spawned worker process, so the fake LLM of the test is used."""
+
+    def __init__(self, target, args, daemon):
+        super().__init__(target=target, args=args, daemon=daemon)
+
+    def terminate(self) -> None:
+        pass
+
+
+def _key(tmp_path: Path, name: str):
+    return str(tmp_path / "a.py"), name
+
+
+def test_claim_takes_the_highest_rank_ready_job_and_waits_for_dependencies(tmp_path: Path) -> None:
+    queue = JobQueue(str(tmp_path / "queue.db"))
+    a, b, c = (_key(tmp_path, name) for name in "ABC")
+    queue.reset([(a, 1.0, []), (b, 5.0, [a]), (c, 3.0, [])])
+
+    assert queue.claim("w1") == (c, [])
+    assert queue.claim("w1") == (a, [])
+    assert queue.claim("w1") is None
+    assert queue.complete(a, "w1", "code of A")
+    assert queue.claim("w2") == (b, [a])
+    assert queue.results([a, b]) == {a: "code of A"}
+    assert queue.unfinished() == 2
+
+
+def test_an_expired_lease_is_claimed_again_and_the_old_worker_cannot_complete(tmp_path: Path) -> None:
+    queue = JobQueue(str(tmp_path / "queue.db"), lease_seconds=0.05)
+    a = _key(tmp_path, "A")
+    queue.reset([(a, 1.0, [])])
+
+    assert queue.claim("w1") == (a, [])
+    assert queue.claim("w2") is None
+    time.sleep(0.1)
+    assert not queue.heartbeat(a, "w2")
+    assert queue.claim("w2") == (a, [])
+
+    assert not queue.complete(a, "w1", "late")
+    assert queue.complete(a, "w2", "code")
+    assert queue.outcome(a) == ("done", "code", None)
+
+
+def test_failures_cascade_to_dependents_but_skipped_prompts_release_them(tmp_path: Path) -> None:
+    queue = JobQueue(str(tmp_path / "queue.db"), lease_seconds=0.05, max_attempts=1)
+    a, b, c, d = (_key(tmp_path, name) for name in "ABCD")
+    queue.reset([(a, 4.0, []), (b, 3.0, [a]), (c, 2.0, []), (d, 1.0, [c])])
+
+    queue.claim("w1")
+    assert queue.fail(a, "w1", "boom")
+    assert queue.outcome(b)[0] == "failed"
+    assert "which failed" in queue.outcome(b)[2]
+
+    queue.claim("w1")
+    assert queue.skip(c, "w1", "too large")
+    assert queue.claim("w1") == (d, [c])
+    # The worker died: with max_attempts=1 its expired lease fails the job.
+    time.sleep(0.1)
+    assert queue.claim("w2") is None
+    assert queue.outcome(d)[0] == "failed"
+    assert queue.unfinished() == 0
+
+
+def test_queue_run_generates_through_workers_and_merges_each_file_once(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, fast_queue: None, parse_tasks
+) -> None:
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "models.py").write_text("<prompt:Model>\nWrite a model\n<prompt:Model/>\n<Model>\n<Model/>\n")
+    (tmp_path / "repo.py").write_text(
+        "<prompt:Repo>\nRepository for {models.py::Model}\n<prompt:Repo/>\n<Repo>\n<Repo/>\n"
+        "<prompt:A->X>\nWrite X\n<prompt:A->X/>\n<prompt:D->X>\nRefine X\n<prompt:D->X/>\n<X>\nseed\n<X/>\n"
+    )
+    prompts = {}
+
+    def fake_generate(prompt: str, prompt_name: str) -> str:
+        prompts[prompt_name] = prompt
+        return json.dumps({"code": f"# code of {prompt_name}"})
+
+    monkeypatch.setattr(code_generator, "generate_code_with_chat", fake_generate)
+    monkeypatch.setattr(queue_runner.multiprocessing, "get_context", lambda _: SimpleNamespace(Process=_ThreadProcess))
+    writers = []
+    write = code_generator.write_file_atomically
+    monkeypatch.setattr(
+        code_generator,
+        "write_file_atomically",
+        lambda path, text: (writers.append(threading.current_thread().name), write(path, text)),
+    )
+
+    summary = queue_runner.queue_run(parse_tasks("models.py", "repo.py"), str(tmp_path / "queue.db"), workers=2)
+
+    assert summary.completed == 4
+    assert "# code of Model" in prompts["Repo"]
+    assert "CODE_TO_MODIFY:\n# code of A" in prompts["D"]
+    assert "CODE_TO_MODIFY:\nseed" in prompts["A"]
+    repo = (tmp_path / "repo.py").read_text()
+    assert "<Repo>\n# code of Repo\n<Repo/>" in repo
+    assert "<X>\n# code of D\n<X/>" in repo
+    assert "# code of Model" in (tmp_path / "models.py").read_text()
+    # Only the coordinator writes files; workers just store their results in the queue.
+    assert writers == [threading.current_thread().name] * 4
+
+
+def test_queue_run_spawns_worker_processes(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, fast_queue: None, parse_tasks
+) -> None:
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(Config, "MockLLM", True)
+    (tmp_path / "a.py").write_text("<prompt:A>\nWrite A\n<prompt:A/>\n<A>\n<A/>\n")
+
+    summary = queue_runner.queue_run(parse_tasks("a.py"), str(tmp_path / "queue.db"), workers=1)
+
+    assert summary.completed == 1
+    assert "MOCK_LLM_RESPONSE(A)" in (tmp_path / "a.py").read_text()
+
+
+def test_queue_run_closes_the_queue_when_the_merge_fails(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, fast_queue: None, parse_tasks
+) -> None:
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "a.py").write_text("<prompt:A>\nWrite A\n<prompt:A/>\n<A>\n<A/>\n")
+    monkeypatch.setattr(code_generator, "generate_code_with_chat", lambda prompt, name: json.dumps({"code": "a"}))
+    monkeypatch.setattr(queue_runner.multiprocessing, "get_context", lambda _: SimpleNamespace(Process=_ThreadProcess))
+
+    def fail_commit(*args) -> None:
+        raise OSError("disk full")
+
+    monkeypatch.setattr(queue_runner, "__commit_response", fail_commit)
+    closed = []
+    close = JobQueue.close
+    monkeypatch.setattr(JobQueue, "close", lambda queue: (closed.append(threading.current_thread()), close(queue)))
+
+    with pytest.raises(OSError, match="disk full"):
+        queue_runner.queue_run(parse_tasks("a.py"), str(tmp_path / "queue.db"), workers=1)
+
+    # The coordinator's own connection is closed too, not just the workers'.
+    assert threading.current_thread() in closed
+    assert not [thread for thread in threading.enumerate() if isinstance(thread, _ThreadProcess)]
@@ -0,0 +1,136 @@
+"""Unit tests for context.journal (the run journal behind --resume)."""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+
+import pytest
+
+from context import code_generator, planner
+from context.ast import prompt_key
+from context.config import Config
+from context.journal import RunJournal
+
+
+@pytest.fixture
+def resume(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    monkeypatch.chdir(tmp_path)
+    journal = tmp_path / "journal.jsonl"
+    monkeypatch.setattr(Config, "Journal_Path", str(journal))
+    monkeypatch.setattr(Config, "Resume", True)
+    return journal
+
+
+def _fake_llm(monkeypatch: pytest.MonkeyPatch) -> list[str]:
+    calls = []
+
+    def fake_generate(prompt: str, prompt_name: str) -> str:
+        calls.append(prompt_name)
+        return json.dumps({"code": f"# {prompt_name} from {len(prompt)} chars"})
+
+    monkeypatch.setattr(code_generator, "generate_code_with_chat", fake_generate)
+    return calls
+
+
+def test_journal_round_trip_ignores_a_torn_last_line(tmp_path: Path) -> None:
+    path = tmp_path / "journal.jsonl"
+    key = prompt_key(str(tmp_path / "a.py"), "A")
+    journal = RunJournal(str(path))
+    journal.record(key, "input-1", "code")
+    journal.record(key, "input-2", "code")
+    journal.close()
+    with open(path, "a", encoding="utf-8") as file:
+        file.write('{"file": "a.py", "pro')
+
+    reloaded = RunJournal(str(path))
+    reloaded.record(prompt_key(str(tmp_path / "b.py"), "B"), "input-b", "other")
+    reloaded.close()
+
+    reloaded = RunJournal(str(path))
+    assert reloaded.is_done(key, "input-2")
+    assert not reloaded.is_done(key, "input-1")
+    assert reloaded.is_done(prompt_key(str(tmp_path / "b.py"), "B"), "input-b")
+    assert reloaded.output_digest(prompt_key(str(tmp_path / "c.py"), "C")) == ""
+
+
+def test_resume_skips_journaled_prompts_and_reruns_changed_dependencies(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, resume: Path, parse_tasks
+) -> None:
+    models = tmp_path / "models.py"
+    models.write_text("<prompt:Model>\nWrite a model\n<prompt:Model/>\n<Model>\n<Model/>\n", encoding="utf-8")
+    (tmp_path / "repo.py").write_text(
+        "<prompt:Repo>\nRepository for {models.py::Model}\n<prompt:Repo/>\n<Repo>\n<Repo/>\n"
+        "<prompt:Doc>\nWrite docs\n<prompt:Doc/>\n<Doc>\n<Doc/>\n",
+        encoding="utf-8",
+    )
+    calls = _fake_llm(monkeypatch)
+
+    assert code_generator.generate_code(parse_tasks("models.py", "repo.py")).completed == 3
+    summary = code_generator.generate_code(parse_tasks("models.py", "repo.py"))
+
+    assert summary.resumed == 3
+    assert sorted(calls) == ["Doc", "Model", "Repo"]
+
+    # A new Model output invalidates Repo, which references it; Doc is unaffected.
+    calls.clear()
+    models.write_text(models.read_text(encoding="utf-8").replace("a model", "a larger model"), encoding="utf-8")
+    summary = code_generator.generate_code(parse_tasks("models.py", "repo.py"))
+
+    assert calls == ["Model", "Repo"]
+    assert summary.resumed == 1
+
+
+def test_plan_reports_resumed_prompts(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, resume: Path, parse_tasks
+) -> None:
+    (tmp_path / "a.py").write_text(
+        "<prompt:A>\nWrite A\n<prompt:A/>\n<A>\n<A/>\n<prompt:B>\nWrite B\n<prompt:B/>\n<B>\n<B/>\n", encoding="utf-8"
+    )
+    calls = _fake_llm(monkeypatch)
+    code_generator.generate_code(parse_tasks("a.py"))
+    (tmp_path / "a.py").write_text(
+        (tmp_path / "a.py").read_text(encoding="utf-8").replace("Write B", "Write a better B"), encoding="utf-8"
+    )
+    calls.clear()
+
+    plan = planner.plan_run(parse_tasks("a.py"))
+
+    assert {entry["prompt"]: entry["status"] for entry in plan["prompts"]} == {"A": "resumed", "B": "run"}
+    assert calls == []
+
+
+def test_resume_rewrites_an_output_reverted_in_the_file(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, resume: Path, parse_tasks
+) -> None:
+    original = "<prompt:A>\nWrite A\n<prompt:A/>\n<A>\n<A/>\n"
+    (tmp_path / "a.py").write_text(original, encoding="utf-8")
+    calls = _fake_llm(monkeypatch)
+    code_generator.generate_code(parse_tasks("a.py"))
+
+    # For example `git checkout a.py` after the run.
+    (tmp_path / "a.py").write_text(original, encoding="utf-8")
+    summary = code_generator.generate_code(parse_tasks("a.py"))
+
+    assert calls == ["A", "A"]
+    assert summary.resumed == 0
+    assert "# A from" in (tmp_path / "a.py").read_text(encoding="utf-8")
+
+
+def test_resume_reruns_an_output_target_when_the_code_to_modify_changes(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, resume: Path, parse_tasks
+) -> None:
+    a = tmp_path / "a.py"
+    a.write_text(
+        "<prompt:A->X>\nWrite X\n<prompt:A->X/>\n<prompt:D->X>\nRefine X\n<prompt:D->X/>\n<X>\nseed\n<X/>\n",
+        encoding="utf-8",
+    )
+    calls = _fake_llm(monkeypatch)
+    code_generator.generate_code(parse_tasks("a.py"))
+    assert code_generator.generate_code(parse_tasks("a.py")).resumed == 2
+
+    calls.clear()
+    a.write_text(a.read_text(encoding="utf-8").replace("Write X", "Write a longer X"), encoding="utf-8")
+    code_generator.generate_code(parse_tasks("a.py"))
+
+    assert calls == ["A", "D"]
@@ -0,0 +1,55 @@
+"""Unit tests for context.lazy_context and lazy resolution of imports while assembling prompts."""
+
+from __future__ import annotations
+
+from types import SimpleNamespace
+
+import pytest
+
+from context import code_generator
+from context.lazy_context import ContextLoadError, LazyContextDict
+
+
+def test_lazy_value_is_loaded_once_on_first_read() -> None:
+    calls = {"n": 0}
+
+    def load() -> str:
+        calls["n"] += 1
+        return "content"
+
+    values = LazyContextDict()
+    values.set_lazy("A", load, "a.txt")
+
+    assert "A" in values and list(values) == ["A"]
+    assert "<lazy a.txt>" in repr(values)
+    assert not values.is_loaded("A")
+    assert values["A"] == "content"
+    assert values["A"] == "content"
+    assert values.is_loaded("A")
+    assert calls["n"] == 1
+
+
+def test_lazy_value_load_failure_raises_context_load_error() -> None:
+    values = LazyContextDict()
+    values.set_lazy("A", lambda: open("/nonexistent/x.txt").read(), "x.txt")
+
+    with pytest.raises(ContextLoadError, match="Could not load context variable 'A' from x.txt"):
+        values["A"]
+
+
+def test_process_prompt_only_loads_referenced_variables() -> None:
+    context = LazyContextDict()
+    context.set_lazy("USED", lambda: "used content", "used.txt")
+    context.set_lazy("UNUSED", lambda: pytest.fail("UNUSED must not be loaded"), "unused.txt")
+    task = SimpleNamespace(
+        filepath="f.txt",
+        context_dict=context,
+        global_context="",
+        prompt_outputs_tags={},
+        context_sources={"USED": "file", "UNUSED": "file"},
+    )
+
+    prompt = code_generator.__process_prompt("Use {USED}", task)
+
+    assert prompt == "Use \n\nUSED:\nused content"
+    assert not context.is_loaded("UNUSED")
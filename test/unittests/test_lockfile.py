@@ -0,0 +1,98 @@
+"""Unit tests for context.lockfile (context.lock and --frozen)."""
+
+from __future__ import annotations
+
+import json
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from context import code_generator
+from context.config import Config
+from context.Context import configurationProcess, contextProcess
+from context.lockfile import LockDriftError
+
+_SOURCE = (
+    "<prompt:Model>\nWrite a model\n<prompt:Model/>\n<Model>\n<Model/>\n"
+    "<prompt:Repo>\nRepository for {Model}\n<prompt:Repo/>\n<Repo>\n<Repo/>\n"
+)
+
+
+@pytest.fixture
+def locked(tmp_path: Path, monkeypatch: pytest.MonkeyPatch, parse_tasks) -> Path:
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(Config, "Lock_Path", str(tmp_path / "context.lock"))
+    (tmp_path / "a.py").write_text(_SOURCE, encoding="utf-8")
+
+    def fake_generate(prompt: str, prompt_name: str) -> str:
+        return json.dumps({"code": f"class {prompt_name}: pass"})
+
+    monkeypatch.setattr(code_generator, "generate_code_with_chat", fake_generate)
+    code_generator.generate_code(parse_tasks("a.py"))
+    return tmp_path / "context.lock"
+
+
+@pytest.fixture
+def no_llm(monkeypatch: pytest.MonkeyPatch) -> None:
+    def fail(*args, **kwargs):
+        raise AssertionError("--frozen must not call the LLM")
+
+    monkeypatch.setattr(code_generator, "generate_code_with_chat", fail)
+
+
+def test_generate_code_records_outputs_in_the_lockfile(locked: Path) -> None:
+    prompts = json.loads(locked.read_text(encoding="utf-8"))["prompts"]
+
+    assert sorted(prompts) == ["a.py::Model", "a.py::Repo"]
+    assert prompts["a.py::Repo"]["code"] == "class Repo: pass"
+    assert prompts["a.py::Repo"]["model"] == Config.Model
+
+
+def test_apply_lock_replays_outputs_without_calling_the_llm(tmp_path: Path, locked: Path, no_llm, parse_tasks) -> None:
+    generated = (tmp_path / "a.py").read_text(encoding="utf-8")
+    (tmp_path / "a.py").write_text(_SOURCE, encoding="utf-8")
+
+    summary = code_generator.apply_lock(parse_tasks("a.py"))
+
+    assert summary.locked == 2
+    assert (tmp_path / "a.py").read_text(encoding="utf-8") == generated
+
+
+def test_apply_lock_rejects_drifted_inputs_and_writes_nothing(
+    tmp_path: Path, locked: Path, no_llm, parse_tasks
+) -> None:
+    drifted = _SOURCE.replace("Write a model", "Write a bigger model")
+    (tmp_path / "a.py").write_text(drifted, encoding="utf-8")
+
+    with pytest.raises(LockDriftError) as error:
+        code_generator.apply_lock(parse_tasks("a.py"))
+
+    assert error.value.drifted == ["a.py::Model: its inputs changed since it was locked"]
+    assert (tmp_path / "a.py").read_text(encoding="utf-8") == drifted
+
+
+def test_context_process_frozen_fails_without_a_lock_entry(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch, no_llm
+) -> None:
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(Config, "Api_Key", None)
+    (tmp_path / "a.py").write_text(_SOURCE, encoding="utf-8")
+    args = SimpleNamespace(
+        debug=False,
+        log=False,
+        parser=False,
+        mock_llm=False,
+        filepath="a.py",
+        openrouter_key=None,
+        model=Config.Model,
+        frozen=True,
+    )
+
+    configurationProcess(args)
+    try:
+        assert contextProcess() == 1
+    finally:
+        Config.Frozen = False
+        Config.Lock_Path = None
+    assert (tmp_path / "a.py").read_text(encoding="utf-8") == _SOURCE
@@ -12,7 +12,8 @@ from typing import Any
 import pytest
 
 from context.config import Config
-from context.openai_interface import generate_code_with_chat
+from context.graph import PROMPTS
+from context.openai_interface import generate_batch_with_chat, generate_code_with_chat
 
 
 class _DummyLogger:
@@ -89,3 +90,43 @@ def test_generate_code_with_chat_reraises_graph_exception(monkeypatch: pytest.Mo
             generate_code_with_chat(prompt="x", prompt_name="Y")
     finally:
         _restore_config(snapshot)
+
+
+def test_generate_batch_with_chat_splits_and_validates_response(monkeypatch: pytest.MonkeyPatch) -> None:
+    snapshot = _snapshot_config()
+    try:
+        Config.MockLLM = False
+        _ensure_logger(monkeypatch)
+
+        captured: dict[str, Any] = {}
+
+        def _fake_graph(prompt: str, prompt_name: str, system: str | None = None) -> str:
+            captured.update(prompt=prompt, prompt_name=prompt_name, system=system)
+            return '```json\n{"A": "code a", "B": 3, "Extra": "ignored"}\n```'
+
+        monkeypatch.setattr("context.openai_interface.run_generation_graph", _fake_graph)
+
+        out = generate_batch_with_chat({"A": "do a", "B": "do b", "C": "do c"}, global_context="GC")
+
+        # Only A validates: B is not a string and C is missing, so both fall back to individual calls.
+        assert out == {"A": json.dumps({"code": "code a"})}
+        assert captured["prompt_name"] == "BATCH"
+        assert captured["system"].startswith(PROMPTS["Batch"])
+        # The per-prompt guidelines are kept, with the task name in place of the tag name.
+        assert PROMPTS["System"].replace("<<<TAGNAME>>>", "<<<TASKNAME>>>") in captured["system"]
+        assert '"A": "do a"' in captured["prompt"]
+        assert captured["prompt"].endswith("GLOBAL_CONTEXT:\nGC")
+    finally:
+        _restore_config(snapshot)
+
+
+def test_generate_batch_with_chat_invalid_json_returns_empty(monkeypatch: pytest.MonkeyPatch) -> None:
+    snapshot = _snapshot_config()
+    try:
+        Config.MockLLM = False
+        _ensure_logger(monkeypatch)
+        monkeypatch.setattr("context.openai_interface.run_generation_graph", lambda *args, **kwargs: "not json")
+
+        assert generate_batch_with_chat({"A": "do a"}) == {}
+    finally:
+        _restore_config(snapshot)
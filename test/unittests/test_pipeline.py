@@ -0,0 +1,112 @@
+"""Unit tests for context.pipeline (streaming parse -> order -> generate)."""
+
+from __future__ import annotations
+
+import json
+import threading
+import time
+from pathlib import Path
+
+import pytest
+
+from context import code_generator
+from context.config import Config
+from context.file_manager import iter_file_paths
+from context.pipeline import stream_tasks
+
+
+def _prompt_file(path: Path, name: str = "P") -> Path:
+    path.write_text(f"<prompt:{name}>\nwrite {path.stem}\n<prompt:{name}/>\n{{{name}}}\n", encoding="utf-8")
+    return path
+
+
+def test_stream_tasks_yields_ordered_tasks_and_collects_errors(tmp_path: Path) -> None:
+    good = _prompt_file(tmp_path / "a_good.txt")
+    (tmp_path / "b_duplicate.txt").write_text("<prompt:P>\na\n<prompt:P/>\n<prompt:P>\nb\n<prompt:P/>\n{P}\n")
+    (tmp_path / "c_cycle.txt").write_text(
+        "<prompt:A>\n{B}\n<prompt:A/>\n<prompt:B>\n{A}\n<prompt:B/>\n", encoding="utf-8"
+    )
+    (tmp_path / "d_plain.txt").write_text("no tags here\n", encoding="utf-8")
+
+    errors = []
+    tasks = list(stream_tasks(iter_file_paths(str(tmp_path)), errors))
+
+    assert [task.filepath for task in tasks] == [str(good)]
+    assert tasks[0].prompt_order == ["P"]
+    assert len(errors) == 2
+    assert any("b_duplicate.txt" in error for error in errors)
+    assert any("c_cycle.txt" in error and "cycle" in error for error in errors)
+
+
+def test_stream_tasks_applies_backpressure_and_stops_with_consumer(tmp_path: Path) -> None:
+    paths = [str(_prompt_file(tmp_path / f"f{i}.txt")) for i in range(20)]
+    parsed = []
+
+    def tracked_paths():
+        for path in paths:
+            parsed.append(path)
+            yield path
+
+    stream = stream_tasks(tracked_paths(), [], queue_size=2)
+    next(stream)
+    time.sleep(0.3)
+
+    # One yielded, two queued, one blocked on put, plus at most one read ahead by the walker.
+    assert len(parsed) <= 5
+    stream.close()
+
+
+def test_generate_code_starts_before_parsing_finishes(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(Config, "Pipeline_Queue_Size", 2)
+    paths = [str(_prompt_file(tmp_path / f"f{i}.txt")) for i in range(4)]
+    first_generated = threading.Event()
+    parsed_after_first_request = []
+
+    def slow_paths():
+        for path in paths:
+            yield path
+            if first_generated.is_set():
+                parsed_after_first_request.append(path)
+            time.sleep(0.05)
+
+    def fake_generate(prompt: str, prompt_name: str) -> str:
+        first_generated.set()
+        return json.dumps({"code": "DONE"})
+
+    monkeypatch.setattr(code_generator, "generate_code_with_chat", fake_generate)
+
+    summary = code_generator.generate_code(stream_tasks(slow_paths(), []))
+
+    assert summary.completed == 4
+    assert parsed_after_first_request
+    assert all(Path(path).read_text(encoding="utf-8").endswith("DONE\n") for path in paths)
+
+
+def test_stream_tasks_stops_waiting_for_the_next_file_when_no_time_is_left(tmp_path: Path) -> None:
+    path = str(_prompt_file(tmp_path / "f.txt"))
+    parsing = threading.Event()
+
+    def stuck_paths():
+        yield path
+        parsing.wait(timeout=5)
+
+    stream = stream_tasks(stuck_paths(), [], remaining=lambda: 0.1)
+
+    assert next(stream).filepath == path
+    with pytest.raises(TimeoutError):
+        next(stream)
+    parsing.set()
+
+
+def test_stream_tasks_skips_a_file_that_closes_a_cross_file_cycle(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.chdir(tmp_path)
+    Path("a.txt").write_text("<prompt:A>\n{b.txt::B}\n<prompt:A/>\n{A}\n", encoding="utf-8")
+    Path("b.txt").write_text("<prompt:B>\n{a.txt::A}\n<prompt:B/>\n{B}\n", encoding="utf-8")
+
+    errors = []
+    tasks = list(stream_tasks(["a.txt", "b.txt"], errors))
+
+    assert [task.filepath for task in tasks] == ["a.txt"]
+    assert len(errors) == 1 and "b.txt" in errors[0] and "a.txt::A" in errors[0]
@@ -0,0 +1,129 @@
+"""Unit tests for context.scheduler (critical-path-first prompt scheduling)."""
+
+from __future__ import annotations
+
+import json
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from context import code_generator
+from context.ast import build_prompt_order
+from context.config import Config
+from context.run_state import RunState
+from context.scheduler import (
+    LatencyHistory,
+    PromptScheduler,
+    critical_path,
+    critical_path_ranks,
+    estimate_seconds,
+    execution_layers,
+    group_dependencies,
+    simulate_run_seconds,
+)
+from context.tag_parser import parse_tags
+
+
+def test_critical_path_ranks_follow_the_longest_chain() -> None:
+    # 0 -> 1 -> 2, and 3 depends on 0 only.
+    dependencies = [set(), {0}, {1}, {0}]
+
+    assert critical_path_ranks([1.0, 2.0, 3.0, 10.0], dependencies) == [11.0, 5.0, 3.0, 10.0]
+
+
+def test_group_dependencies_keep_writers_of_one_tag_in_order() -> None:
+    task = SimpleNamespace(
+        prompts={"A": "", "B": "", "C": "", "D": ""},
+        prompt_outputs_tags={"X": "old"},
+        prompt_output_targets={"A": "X", "C": "X"},
+        prompt_dependencies={"A": [], "B": ["A"], "C": [], "D": []},
+    )
+
+    assert group_dependencies(task, [["A"], ["B"], ["C"], ["D"]]) == [set(), {0}, {0}, set()]
+
+
+def test_group_dependencies_without_ast_dependencies_are_sequential() -> None:
+    task = SimpleNamespace(prompts={"A": "", "B": ""}, prompt_outputs_tags={})
+
+    assert group_dependencies(task, [["A"], ["B"]]) == [set(), {0}]
+
+
+def test_latency_history_round_trip_and_estimates(tmp_path: Path) -> None:
+    path = tmp_path / "latency.json"
+    task = SimpleNamespace(filepath=str(tmp_path / "a.txt"), prompts={"A": "short prompt"})
+    history = LatencyHistory(str(path))
+
+    size_estimate = estimate_seconds(task, ["A"], history)
+    history.record(history.key(task.filepath, ["A"]), 40.0)
+    history.record(history.key(task.filepath, ["A"]), 20.0)
+    history.save()
+
+    assert 0 < size_estimate < 40.0
+    assert estimate_seconds(task, ["A"], LatencyHistory(str(path))) == 30.0
+
+
+def test_generate_code_runs_the_long_chain_before_independent_leaves(
+    tmp_path: Path, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    monkeypatch.setattr(Config, "Max_Concurrency", 1)
+    monkeypatch.setattr(Config, "Concurrency", 1)
+    chain = ["A", "B", "C", "D"]
+    leaves = [f"L{i}" for i in range(6)]
+    parts = [f"<prompt:{leaf}>\nleaf {leaf}\n<prompt:{leaf}/>\n" for leaf in leaves]
+    parts += [
+        f"<prompt:{name}>\nstep {{{prev}}}\n<prompt:{name}/>\n"
+        for prev, name in zip(["X"] + chain, chain, strict=False)
+    ]
+    parts += [f"{{{name}}}\n" for name in leaves + chain]
+    file_path = tmp_path / "deep.txt"
+    file_path.write_text("".join(parts), encoding="utf-8")
+
+    tasks, errors = parse_tags([str(file_path)], in_comment_signs=[])
+    assert errors == []
+    build_prompt_order(tasks)
+
+    calls = []
+
+    def fake_generate(prompt: str, prompt_name: str) -> str:
+        calls.append(prompt_name)
+        return json.dumps({"code": f"CODE_{prompt_name}"})
+
+    monkeypatch.setattr(code_generator, "generate_code_with_chat", fake_generate)
+
+    summary = code_generator.generate_code(tasks)
+
+    assert summary.completed == 10
+    # Once only D is left of the chain, it ranks like any leaf.
+    assert calls[:3] == ["A", "B", "C"]
+    assert sorted(calls) == sorted(chain + leaves)
+    assert file_path.read_text(encoding="utf-8").splitlines()[-10:] == [f"CODE_{n}" for n in leaves + chain]
+
+
+def test_simulated_run_time_and_critical_path() -> None:
+    # A (4s) -> B (4s); three independent 3s leaves.
+    durations = [4.0, 4.0, 3.0, 3.0, 3.0]
+    dependencies = [set(), {0}, set(), set(), set()]
+
+    assert critical_path(durations, dependencies) == [0, 1]
+    assert execution_layers(dependencies) == [[0, 2, 3, 4], [1]]
+    assert simulate_run_seconds(durations, dependencies, 1) == 17.0
+    # Critical path first: A and a leaf, then B and a leaf, then the last leaf.
+    assert simulate_run_seconds(durations, dependencies, 2) == 9.0
+    assert simulate_run_seconds(durations, dependencies, 8) == 8.0
+
+
+def test_unexpected_error_after_a_group_runs_fails_the_file_instead_of_hanging(tmp_path: Path) -> None:
+    class BrokenHistory(LatencyHistory):
+        def record(self, key: str, seconds: float) -> None:
+            raise RuntimeError("history is broken")
+
+    task = SimpleNamespace(filepath=str(tmp_path / "a.txt"), prompts={"A": "a"}, prompt_outputs_tags={})
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        scheduler = PromptScheduler(pool, RunState(), lambda _: [["A"]], lambda *_: None, BrokenHistory())
+        future = scheduler.add(task)
+        scheduler.finish_input()
+
+        with pytest.raises(RuntimeError, match="history is broken"):
+            future.result(timeout=10)
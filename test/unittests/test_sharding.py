@@ -0,0 +1,124 @@
+"""Unit tests for context.sharding (--shard K/N and --verify-shards)."""
+
+from __future__ import annotations
+
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from context.config import Config
+from context.Context import configurationProcess, contextProcess
+from context.context_index import ContextIndex
+from context.sharding import Shard, parse_shard, verify_manifests
+from context.tag_parser import regexPatterns
+
+
+@pytest.fixture
+def repo(tmp_path: Path, monkeypatch: pytest.MonkeyPatch) -> Path:
+    monkeypatch.chdir(tmp_path)
+    # configurationProcess sets Config attributes; restore them after the test.
+    for name in [name for name in vars(Config) if name[:1].isupper()]:
+        monkeypatch.setattr(Config, name, getattr(Config, name))
+    (tmp_path / "base.py").write_text("<context:BASE>\nbase\n<context:BASE/>\n")
+    (tmp_path / "uses_base.py").write_text(
+        "<import>base.py<import/>\n<prompt:Uses>\nUse {BASE}\n<prompt:Uses/>\n<Uses>\n<Uses/>\n"
+    )
+    (tmp_path / "models.py").write_text("<prompt:Model>\nWrite a model\n<prompt:Model/>\n<Model>\n<Model/>\n")
+    (tmp_path / "repo.py").write_text(
+        "<prompt:Repo>\nRepository for {models.py::Model}\n<prompt:Repo/>\n<Repo>\n<Repo/>\n"
+    )
+    for number in range(8):
+        (tmp_path / f"single_{number}.py").write_text(
+            f"<prompt:S{number}>\nWrite {number}\n<prompt:S{number}/>\n<S{number}>\n<S{number}/>\n"
+        )
+    return tmp_path
+
+
+def _files(tmp_path: Path) -> list[str]:
+    return sorted(path.name for path in tmp_path.glob("*.py"))
+
+
+def test_parse_shard() -> None:
+    assert parse_shard("2/4") == (2, 4)
+    for spec in ("0/4", "5/4", "1", "a/b", "1/0"):
+        with pytest.raises(ValueError, match="--shard"):
+            parse_shard(spec)
+
+
+def test_shards_partition_the_files_and_keep_dependent_files_together(repo: Path) -> None:
+    shards = []
+    for index in (1, 2, 3):
+        shard = Shard(index, 3)
+        shards.append(sorted(Path(path).name for path in shard.select(_files(repo), ContextIndex(regexPatterns))))
+
+    assert sorted(name for names in shards for name in names) == _files(repo)
+    assert all(shard for shard in shards)
+    for first, second in (("base.py", "uses_base.py"), ("models.py", "repo.py")):
+        assert [first in names for names in shards] == [second in names for names in shards]
+    # The split only depends on the paths, so every CI job computes the same one.
+    again = Shard(2, 3).select(reversed(_files(repo)), ContextIndex(regexPatterns))
+    assert sorted(Path(path).name for path in again) == shards[1]
+
+
+def test_select_leaves_out_every_known_manifest(repo: Path) -> None:
+    for name in ("context-shard-1-of-3.json", "custom-1.json", "custom-2.json"):
+        (repo / name).write_text("{}\n")
+    paths = [*_files(repo), "context-shard-1-of-3.json", "custom-1.json", "custom-2.json"]
+    selected = []
+    trees = set()
+    for index in (1, 2, 3):
+        shard = Shard(index, 3)
+        selected += shard.select(
+            paths, ContextIndex(regexPatterns), [f"custom-{index}.json", "custom-1.json", "custom-2.json", None]
+        )
+        trees.add(shard.tree)
+
+    assert sorted(selected) == [path for path in paths if path.endswith(".py")]
+    assert len(trees) == 1
+
+
+def _run_shard(spec: str) -> None:
+    args = SimpleNamespace(
+        debug=False,
+        log=False,
+        parser=False,
+        mock_llm=True,
+        filepath=".",
+        openrouter_key=None,
+        model=Config.Model,
+        shard=spec,
+    )
+    configurationProcess(args)
+    contextProcess()
+
+
+def test_shard_runs_write_manifests_that_verify_after_the_merge(repo: Path) -> None:
+    _run_shard("1/2")
+    _run_shard("2/2")
+    manifests = [str(repo / "context-shard-1-of-2.json"), str(repo / "context-shard-2-of-2.json")]
+
+    assert verify_manifests(manifests) == []
+    assert "MOCK_LLM_RESPONSE(Repo)" in (repo / "repo.py").read_text()
+
+    (repo / "repo.py").write_text("edited after the run\n")
+    problems = verify_manifests(manifests)
+    assert len(problems) == 1 and "repo.py differs from the output of its shard" in problems[0]
+
+    assert verify_manifests(manifests[:1])[-1] == "Missing manifests for shards 2 of 2"
+
+
+def test_verify_shards_exits_with_an_error(repo: Path) -> None:
+    args = SimpleNamespace(
+        debug=False,
+        log=False,
+        parser=False,
+        mock_llm=False,
+        filepath=None,
+        openrouter_key=None,
+        model=Config.Model,
+        verify_shards=["missing.json"],
+    )
+    configurationProcess(args)
+
+    assert contextProcess() == 1
@@ -0,0 +1,115 @@
+"""Unit tests for context.token_budget and the pre-flight prompt size check in code_generator.
+
+Covers:
+- Token estimation and per-model context windows.
+- head / tail / drop trimming order (lowest-priority, largest variables first).
+- Oversized prompts are rejected before any LLM call; trimmed prompts are sent.
+"""
+
+from __future__ import annotations
+
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from context import code_generator
+from context.config import Config
+from context.token_budget import context_window, estimate_tokens, fit_prompt
+
+
+def _assemble(variables: dict[str, str]) -> str:
+    return "".join(f"{name}:{content}\n" for name, content in variables.items())
+
+
+def test_estimate_tokens_and_context_window() -> None:
+    assert estimate_tokens("x" * 400, "openai/gpt-5.2") == 100
+    assert estimate_tokens("x" * 350, "other/model") == 100
+    assert context_window("openai/gpt-3.5-turbo") == 16_385
+    assert context_window("other/model") == 128_000
+
+
+def test_fit_prompt_under_budget_is_untouched() -> None:
+    variables = {"A": "a" * 10}
+    assert fit_prompt(_assemble, variables, {}, 100, "drop", "openai/gpt-5.2") == (_assemble(variables), [])
+
+
+def test_fit_prompt_drop_removes_lowest_priority_first() -> None:
+    variables = {"LOCAL": "l" * 400, "CSV": "c" * 4000}
+    prompt, trimmed = fit_prompt(_assemble, variables, {"LOCAL": 2, "CSV": 0}, 200, "drop", "openai/gpt-5.2")
+
+    assert trimmed == ["CSV"]
+    assert "l" * 400 in prompt
+    assert "c" * 100 not in prompt
+
+
+@pytest.mark.parametrize("strategy", ["head", "tail"])
+def test_fit_prompt_truncation_keeps_requested_end(strategy: str) -> None:
+    content = "H" * 2000 + "T" * 2000
+    prompt, trimmed = fit_prompt(_assemble, {"LOG": content}, {}, 500, strategy, "openai/gpt-5.2")
+
+    assert trimmed == ["LOG"]
+    assert estimate_tokens(prompt, "openai/gpt-5.2") <= 500
+    kept = "H" if strategy == "head" else "T"
+    lost = "T" if strategy == "head" else "H"
+    assert kept * 100 in prompt
+    assert lost not in prompt.replace("truncated", "").replace("the token budget", "")
+
+
+def _task(tmp_path, prompt: str, context_dict: dict[str, str], sources: dict[str, str]):
+    f = tmp_path / "big.txt"
+    f.write_text("{P}\n", encoding="utf-8")
+    return SimpleNamespace(
+        filepath=str(f),
+        prompts={"P": prompt},
+        context_dict=context_dict,
+        context_sources=sources,
+        global_context="",
+        prompt_outputs={"P"},
+        prompt_outputs_tags={},
+        prompt_output_targets={},
+        prompt_order=None,
+    )
+
+
+def test_oversized_prompt_is_rejected_before_calling_llm(tmp_path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(Config, "Max_Prompt_Tokens", 100)
+    monkeypatch.setattr(Config, "Trim_Strategy", "none")
+    task = _task(tmp_path, "Use {CSV}", {"CSV": "x" * 4000}, {"CSV": "file"})
+
+    def fake_generate(prompt: str, prompt_name: str) -> str:  # pragma: no cover
+        raise AssertionError("oversized prompts must not reach the provider")
+
+    monkeypatch.setattr(code_generator, "generate_code_with_chat", fake_generate)
+
+    summary = code_generator.generate_code([task])
+
+    assert summary.rejected_prompts == 1
+    assert summary.failed == 1
+    assert (tmp_path / "big.txt").read_text(encoding="utf-8") == "{P}\n"
+
+
+def test_trim_strategy_drops_file_import_before_local_context(tmp_path, monkeypatch: pytest.MonkeyPatch) -> None:
+    monkeypatch.setattr(Config, "Max_Prompt_Tokens", 200)
+    monkeypatch.setattr(Config, "Trim_Strategy", "drop")
+    task = _task(
+        tmp_path,
+        "Use {CSV} and {SPEC}",
+        {"CSV": "x" * 4000, "SPEC": "keep me"},
+        {"CSV": "file", "SPEC": "context"},
+    )
+
+    sent = []
+
+    def fake_generate(prompt: str, prompt_name: str) -> str:
+        sent.append(prompt)
+        return json.dumps({"code": "OK"})
+
+    monkeypatch.setattr(code_generator, "generate_code_with_chat", fake_generate)
+
+    summary = code_generator.generate_code([task])
+
+    assert len(sent) == 1
+    assert "keep me" in sent[0]
+    assert "x" * 100 not in sent[0]
+    assert summary.trimmed_prompts == 1